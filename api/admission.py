@@ -0,0 +1,383 @@
+# api/admission.py
+from __future__ import annotations
+
+import asyncio
+import heapq
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+from api.engine import POOL_MAX_SIZE
+from api.metrics import EXPIRED_REQUESTS
+
+if TYPE_CHECKING:
+    from api.engine import EngineWorker
+
+# Priority classes, most urgent first: chat turns are interactive, bulk
+# /inference jobs are batch.
+INTERACTIVE = "interactive"
+BATCH = "batch"
+PRIORITIES = (INTERACTIVE, BATCH)
+
+# At most MAX_CONCURRENT_TURNS turns run on the engine at once; up to
+# MAX_QUEUED_TURNS interactive and MAX_QUEUED_BATCH batch turns more may
+# wait. Anything beyond that is rejected.
+MAX_CONCURRENT_TURNS = int(os.getenv("ALSPEC_MAX_CONCURRENT_TURNS", str(POOL_MAX_SIZE)))
+MAX_QUEUED_TURNS = int(os.getenv("ALSPEC_MAX_QUEUED_TURNS", "16"))
+MAX_QUEUED_BATCH = int(os.getenv("ALSPEC_MAX_QUEUED_BATCH", "256"))
+
+# A batch turn that has waited BATCH_AGING_S goes ahead of interactive
+# turns, so a steady stream of chat traffic cannot starve batch work.
+BATCH_AGING_S = float(os.getenv("ALSPEC_BATCH_AGING_S", "10"))
+
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    """Client weights from "name=weight,name=weight"; unlisted clients weigh 1."""
+    weights = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        name, _, weight = item.partition("=")
+        weights[name.strip()] = float(weight) if weight.strip() else 1.0
+    return weights
+
+
+# Fair-share weights per API client, e.g. "frontend=4,nightly-eval=1"
+CLIENT_WEIGHTS = parse_weights(os.getenv("ALSPEC_CLIENT_WEIGHTS", ""))
+
+
+class QueueFull(Exception):
+    """Raised when a turn arrives and the admission queue is already full."""
+
+    def __init__(self, position: int, capacity: int):
+        super().__init__(f"queue full (position {position}, capacity {capacity})")
+        self.position = position
+        self.capacity = capacity
+
+
+class DeadlineExceeded(Exception):
+    """Raised for a turn whose deadline passed before it could start."""
+
+    def __init__(self, late_s: float):
+        super().__init__(f"deadline passed {1000.0 * late_s:.0f} ms before the turn could start")
+        self.late_s = late_s
+
+
+@dataclass
+class Ticket:
+    """Timing and scheduling attributes for one admitted turn (time.monotonic() clock)."""
+
+    enqueued_at: float
+    priority: str = INTERACTIVE
+    client: str = ""
+    deadline: Optional[float] = None
+    position: int = 0
+    admitted_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    @property
+    def queue_wait_s(self) -> float:
+        if self.admitted_at is None:
+            return 0.0
+        return self.admitted_at - self.enqueued_at
+
+    @property
+    def generation_s(self) -> float:
+        if self.admitted_at is None or self.finished_at is None:
+            return 0.0
+        return self.finished_at - self.admitted_at
+
+    def late_s(self, now: float) -> float:
+        """How far past its deadline the turn is at ``now`` (<= 0 if not yet due)."""
+        return float("-inf") if self.deadline is None else now - self.deadline
+
+
+@dataclass(eq=False)
+class _Waiter:
+    ticket: Ticket
+    future: asyncio.Future
+    seq: int
+    waiting: bool = True
+
+    @property
+    def key(self) -> Tuple[float, int]:
+        # Earliest deadline first; turns without one go last, in arrival order
+        deadline = self.ticket.deadline
+        return (deadline if deadline is not None else float("inf"), self.seq)
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return self.key < other.key
+
+
+@dataclass
+class _ClassQueue:
+    """The waiting turns of one priority class: an EDF heap per client, plus arrival order."""
+
+    by_client: Dict[str, List[_Waiter]] = field(default_factory=dict)
+    arrivals: Deque[_Waiter] = field(default_factory=deque)
+    size: int = 0
+
+
+class AdmissionController:
+    """
+    Bounded, deadline-aware admission queue in front of the engine.
+
+    ``admit()`` waits for one of ``max_concurrent`` turn slots, then (when a
+    worker is given) for that worker's lock, so a worker only ever runs one
+    turn at a time. Time spent waiting for both is the turn's queue wait;
+    time inside the block is its generation time.
+
+    When a slot frees up, the next turn is chosen by:
+
+      1. class: interactive before batch, except that a batch turn that
+         has waited ``batch_aging_s`` is served first (oldest first);
+      2. client: within the class, the client with the least engine time
+         used so far, divided by its weight (weighted fair sharing);
+      3. deadline: among that client's turns, the earliest deadline, then
+         arrival order.
+
+    A turn whose deadline passes while it waits (or by the time it gets the
+    worker) is dropped with ``DeadlineExceeded`` and never reaches the
+    engine.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = MAX_CONCURRENT_TURNS,
+        max_queue: int = MAX_QUEUED_TURNS,
+        max_batch_queue: int = MAX_QUEUED_BATCH,
+        batch_aging_s: float = BATCH_AGING_S,
+        weights: Optional[Dict[str, float]] = None,
+    ):
+        if max_concurrent < 1 or max_queue < 0 or max_batch_queue < 0:
+            raise ValueError(
+                f"invalid admission limits: max_concurrent={max_concurrent}, "
+                f"max_queue={max_queue}, max_batch_queue={max_batch_queue}"
+            )
+        self.max_concurrent = max_concurrent
+        self.capacity = {INTERACTIVE: max_queue, BATCH: max_batch_queue}
+        self.batch_aging_s = batch_aging_s
+        self.weights = dict(CLIENT_WEIGHTS if weights is None else weights)
+        self.active = 0
+        self._queues = {p: _ClassQueue() for p in PRIORITIES}
+        self._seq = 0
+        # Weighted engine seconds per client; new or returning clients start
+        # at the clock, so idle time is not banked as credit
+        self._usage: Dict[str, float] = {}
+        self._clock = 0.0
+
+        self.admitted = 0
+        self.rejected = 0
+        self.expired = 0
+        self.aged = 0
+        self.admitted_by_class = {p: 0 for p in PRIORITIES}
+        self.total_queue_wait_s = 0.0
+        self.max_queue_wait_s = 0.0
+        self.total_generation_s = 0.0
+
+    @property
+    def max_queue(self) -> int:
+        return self.capacity[INTERACTIVE]
+
+    @property
+    def queued(self) -> int:
+        return sum(q.size for q in self._queues.values())
+
+    def weight(self, client: str) -> float:
+        return max(self.weights.get(client, 1.0), 1e-6)
+
+    def _is_waiting(self, client: str) -> bool:
+        return any(w.waiting for q in self._queues.values() for w in q.by_client.get(client, ()))
+
+    def _enqueue(self, ticket: Ticket) -> _Waiter:
+        queue = self._queues[ticket.priority]
+        if not self._is_waiting(ticket.client):
+            self._usage[ticket.client] = max(self._usage.get(ticket.client, 0.0), self._clock)
+        waiter = _Waiter(ticket, asyncio.get_running_loop().create_future(), self._seq)
+        self._seq += 1
+        heapq.heappush(queue.by_client.setdefault(ticket.client, []), waiter)
+        queue.arrivals.append(waiter)
+        queue.size += 1
+        ticket.position = self.queued
+        return waiter
+
+    def _remove(self, waiter: _Waiter) -> None:
+        """Take ``waiter`` out of the queue; its heap and arrival entries are skipped lazily."""
+        if waiter.waiting:
+            waiter.waiting = False
+            self._queues[waiter.ticket.priority].size -= 1
+
+    def _count_expired(self, priority: str) -> None:
+        self.expired += 1
+        EXPIRED_REQUESTS.labels(priority).inc()
+
+    def _expire(self, waiter: _Waiter, now: float) -> None:
+        self._remove(waiter)
+        self._count_expired(waiter.ticket.priority)
+        if not waiter.future.done():
+            waiter.future.set_exception(DeadlineExceeded(waiter.ticket.late_s(now)))
+
+    def _prune(self, queue: _ClassQueue, now: float) -> None:
+        """Drop stale entries and expired turns from the heads of ``queue``."""
+        for client in list(queue.by_client):
+            heap = queue.by_client[client]
+            # EDF order puts the overdue turns at the top of each heap
+            while heap and (not heap[0].waiting or heap[0].ticket.late_s(now) > 0):
+                waiter = heapq.heappop(heap)
+                if waiter.waiting:
+                    self._expire(waiter, now)
+            if not heap:
+                del queue.by_client[client]
+        while queue.arrivals and not queue.arrivals[0].waiting:
+            queue.arrivals.popleft()
+
+    def _next(self) -> Optional[_Waiter]:
+        now = time.monotonic()
+        for queue in self._queues.values():
+            self._prune(queue, now)
+        interactive, batch = self._queues[INTERACTIVE], self._queues[BATCH]
+
+        if batch.arrivals and (
+            not interactive.size or now - batch.arrivals[0].ticket.enqueued_at >= self.batch_aging_s
+        ):
+            if interactive.size:
+                # Starvation protection: the longest-waiting batch turn goes next
+                self.aged += 1
+                waiter = batch.arrivals[0]
+                self._grant(waiter)
+                return waiter
+            queue = batch
+        elif interactive.size:
+            queue = interactive
+        else:
+            return None
+
+        client = min(queue.by_client, key=lambda c: (self._usage.get(c, self._clock), queue.by_client[c][0].seq))
+        waiter = queue.by_client[client][0]
+        self._grant(waiter)
+        return waiter
+
+    def _grant(self, waiter: _Waiter) -> None:
+        self._remove(waiter)
+        self._clock = max(self._clock, self._usage.get(waiter.ticket.client, 0.0))
+
+    def _charge(self, ticket: Ticket) -> None:
+        usage = self._usage.get(ticket.client, self._clock)
+        self._usage[ticket.client] = usage + ticket.generation_s / self.weight(ticket.client)
+        # Forget clients that have nothing queued and are behind the clock
+        if len(self._usage) > 1024:
+            self._usage = {c: u for c, u in self._usage.items() if u > self._clock}
+
+    async def _acquire_slot(self, ticket: Ticket) -> None:
+        late = ticket.late_s(time.monotonic())
+        if late > 0:
+            self._count_expired(ticket.priority)
+            raise DeadlineExceeded(late)
+        if self.active < self.max_concurrent and not self.queued:
+            self.active += 1
+            return
+        capacity = self.capacity[ticket.priority]
+        size = self._queues[ticket.priority].size
+        if size >= capacity:
+            self.rejected += 1
+            raise QueueFull(size + 1, capacity)
+
+        waiter = self._enqueue(ticket)
+        fut = waiter.future
+        try:
+            if ticket.deadline is None:
+                # _release_slot hands its slot straight to us.
+                await fut
+            else:
+                await asyncio.wait_for(fut, max(0.0, ticket.deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            if waiter.waiting:
+                self._expire(waiter, time.monotonic())
+            raise DeadlineExceeded(ticket.late_s(time.monotonic())) from None
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled() and fut.exception() is None:
+                self._release_slot()
+            else:
+                self._remove(waiter)
+            raise
+
+    async def _lock_worker(self, worker: "EngineWorker", ticket: Ticket) -> None:
+        if ticket.deadline is None:
+            await worker.lock.acquire()
+            return
+        try:
+            await asyncio.wait_for(worker.lock.acquire(), max(0.0, ticket.deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            # The worker stayed busy for longer than the turn could wait
+            self._count_expired(ticket.priority)
+            raise DeadlineExceeded(ticket.late_s(time.monotonic())) from None
+
+    def _release_slot(self) -> None:
+        while True:
+            waiter = self._next()
+            if waiter is None:
+                break
+            if not waiter.future.done():
+                waiter.future.set_result(None)
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def admit(
+        self,
+        worker: Optional["EngineWorker"] = None,
+        priority: str = INTERACTIVE,
+        deadline: Optional[float] = None,
+        client: str = "",
+    ) -> AsyncIterator[Ticket]:
+        """
+        Admit one turn, raising ``QueueFull`` if it cannot even be queued and
+        ``DeadlineExceeded`` if ``deadline`` (a time.monotonic() value)
+        passes before it starts.
+        """
+        if priority not in self.capacity:
+            raise ValueError(f"unknown priority {priority!r}, expected one of {PRIORITIES}")
+        ticket = Ticket(time.monotonic(), priority, client, deadline)
+        await self._acquire_slot(ticket)
+        try:
+            if worker is not None:
+                await self._lock_worker(worker, ticket)
+            try:
+                ticket.admitted_at = time.monotonic()
+                self.admitted += 1
+                self.admitted_by_class[priority] += 1
+                self.total_queue_wait_s += ticket.queue_wait_s
+                self.max_queue_wait_s = max(self.max_queue_wait_s, ticket.queue_wait_s)
+                yield ticket
+            finally:
+                ticket.finished_at = time.monotonic()
+                self.total_generation_s += ticket.generation_s
+                self._charge(ticket)
+                if worker is not None:
+                    worker.lock.release()
+        finally:
+            self._release_slot()
+
+    def snapshot(self) -> Dict[str, float]:
+        admitted = self.admitted or 1
+        return {
+            "active_turns": self.active,
+            "queued_turns": self.queued,
+            "queued_interactive": self._queues[INTERACTIVE].size,
+            "queued_batch": self._queues[BATCH].size,
+            "max_concurrent_turns": self.max_concurrent,
+            "max_queued_turns": self.capacity[INTERACTIVE],
+            "max_queued_batch": self.capacity[BATCH],
+            "turns_admitted": self.admitted,
+            "turns_admitted_interactive": self.admitted_by_class[INTERACTIVE],
+            "turns_admitted_batch": self.admitted_by_class[BATCH],
+            "turns_rejected": self.rejected,
+            "turns_expired": self.expired,
+            "batch_turns_aged": self.aged,
+            "avg_queue_wait_ms": 1000.0 * self.total_queue_wait_s / admitted,
+            "max_queue_wait_ms": 1000.0 * self.max_queue_wait_s,
+            "avg_generation_ms": 1000.0 * self.total_generation_s / admitted,
+        }
@@ -0,0 +1,336 @@
+# api/async_client.py
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import random
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
+from urllib.parse import urlencode, urlsplit
+
+import h11
+import httpx
+
+# Keep-alive pool shared by every request from one client.
+CLIENT_MAX_CONNECTIONS = int(os.getenv("ALSPEC_CLIENT_MAX_CONNECTIONS", "64"))
+CLIENT_KEEPALIVE_S = float(os.getenv("ALSPEC_CLIENT_KEEPALIVE_S", "30"))
+
+# Per-request timeout, and how often / how patiently failed requests are
+# retried (exponential backoff with full jitter).
+CLIENT_TIMEOUT_S = float(os.getenv("ALSPEC_CLIENT_TIMEOUT_S", "30"))
+CLIENT_RETRIES = int(os.getenv("ALSPEC_CLIENT_RETRIES", "3"))
+CLIENT_BACKOFF_S = float(os.getenv("ALSPEC_CLIENT_BACKOFF_S", "0.1"))
+CLIENT_BACKOFF_MAX_S = float(os.getenv("ALSPEC_CLIENT_BACKOFF_MAX_S", "5"))
+
+# Default number of requests run_many keeps in flight.
+RUN_MANY_CONCURRENCY = int(os.getenv("ALSPEC_RUN_MANY_CONCURRENCY", "16"))
+
+# Overload and gateway errors are worth retrying; other statuses are not.
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+
+# A POST that may have reached the server is not sent again, as that could
+# run it twice: POSTs are retried only when the connection was never made,
+# or on statuses with which the server turns a request away unprocessed.
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+POST_RETRY_STATUSES = frozenset({429, 503})
+
+# Bytes read from an input file per upload write
+UPLOAD_CHUNK_SIZE = 256 * 1024
+
+
+async def _file_chunks(path: Path) -> AsyncIterator[bytes]:
+    """The contents of ``path`` in UPLOAD_CHUNK_SIZE chunks, read off the event loop."""
+    with open(path, "rb") as f:
+        while True:
+            chunk = await asyncio.to_thread(f.read, UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+
+class AsyncInferenceClient:
+    """
+    asyncio counterpart of ``InferenceClient`` over one pooled
+    ``httpx.AsyncClient``.
+
+    Every request has its own timeout and is retried on connection errors,
+    timeouts and RETRY_STATUSES, so one stuck request costs at most
+    ``timeout`` per attempt instead of stalling a whole ``run_many``.
+    POSTs are retried only when they cannot have run (see
+    POST_RETRY_STATUSES).
+    Use as ``async with AsyncInferenceClient() as client: ...``.
+    """
+
+    def __init__(
+        self,
+        base_url: str = "http://localhost:8000",
+        max_connections: int = CLIENT_MAX_CONNECTIONS,
+        keepalive_expiry: float = CLIENT_KEEPALIVE_S,
+        timeout: float = CLIENT_TIMEOUT_S,
+        retries: int = CLIENT_RETRIES,
+        backoff: float = CLIENT_BACKOFF_S,
+        backoff_max: float = CLIENT_BACKOFF_MAX_S,
+    ):
+        env_base = os.getenv("APP_SERVER_URL")
+        if env_base:
+            base_url = env_base.strip()
+        self.base_url = base_url
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.retried = 0
+        self.last_stream_stats: Dict[str, Any] = {}
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(timeout, connect=min(timeout, 5.0)),
+        )
+
+    async def __aenter__(self) -> "AsyncInferenceClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+    async def _request(self, method: str, path: str, timeout: Optional[float] = None,
+                       **kwargs) -> httpx.Response:
+        timeout = self.timeout if timeout is None else timeout
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        retry_statuses = RETRY_STATUSES if idempotent else POST_RETRY_STATUSES
+        attempt = 0
+        while True:
+            try:
+                response = await self.client.request(method, path, timeout=timeout, **kwargs)
+                if response.status_code not in retry_statuses or attempt >= self.retries:
+                    response.raise_for_status()
+                    return response
+            except httpx.TransportError as e:
+                # Connection failures and timeouts
+                if attempt >= self.retries or not (idempotent or isinstance(e, UNSENT_ERRORS)):
+                    raise
+            attempt += 1
+            self.retried += 1
+            await asyncio.sleep(self._backoff(attempt))
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter keeps a fan-out of retries from arriving in lockstep
+        return random.uniform(0, min(self.backoff_max, self.backoff * 2 ** (attempt - 1)))
+
+    # ----- models -----
+    async def load_model(self, model_name: str, model_path: Optional[str] = None,
+                         precision: str = "fp16", device: str = "cuda") -> Dict[str, Any]:
+        payload = {
+            "model_name": model_name,
+            "model_path": model_path,
+            "precision": precision,
+            "device": device,
+        }
+        response = await self._request("POST", "/models/load", json=payload)
+        return response.json()
+
+    async def unload_model(self, model_name: str) -> Dict[str, Any]:
+        response = await self._request("POST", "/models/unload", json={"model_name": model_name})
+        return response.json()
+
+    async def switch_model(self, model_name: str) -> Dict[str, Any]:
+        response = await self._request("POST", "/models/switch", json={"model_name": model_name})
+        return response.json()
+
+    async def list_models(self) -> List[Dict[str, Any]]:
+        response = await self._request("GET", "/models")
+        data = response.json()
+        if isinstance(data, dict) and "models" in data:
+            return data["models"]
+        if isinstance(data, list):
+            return data
+        return []
+
+    # ----- inference -----
+    async def _post_inference(self, model_name: str, input_data: Any, batch_size: int,
+                              stream_output: bool,
+                              schedule: Optional[Dict[str, Any]] = None) -> httpx.Response:
+        payload = {
+            "model_name": model_name,
+            "batch_size": batch_size,
+            "stream": stream_output,
+            "input": input_data,
+        }
+        # Optional scheduling hints: priority, deadline_ms, client_id
+        payload.update({k: v for k, v in (schedule or {}).items() if v is not None})
+        return await self._request("POST", "/inference", json=payload)
+
+    async def run_inference(self, model_name: str, input_data: Any,
+                            batch_size: int = 1, stream: bool = False,
+                            wait: bool = True, priority: Optional[str] = None,
+                            deadline_ms: Optional[float] = None,
+                            client_id: Optional[str] = None) -> Dict[str, Any]:
+        if stream:
+            tokens = [t async for t in self.stream_inference(model_name, input_data, batch_size)]
+            result = {"status": "succeeded", "model": model_name,
+                      "result": {"output": "".join(tokens)}}
+            result.update(self.last_stream_stats)
+            return result
+
+        p = Path(str(input_data))
+        if p.exists() and p.is_file():
+            # Files are streamed record by record; see stream_file_inference
+            results = [r async for r in self.stream_file_inference(model_name, p, batch_size)]
+            return {"status": "succeeded", "model": model_name,
+                    "records": len(results), "results": results}
+
+        schedule = {"priority": priority, "deadline_ms": deadline_ms, "client_id": client_id}
+        response = await self._post_inference(model_name, input_data, batch_size, False, schedule)
+        result = response.json()
+        if wait and response.status_code == 202 and "job_id" in result:
+            result = await self.wait_for_job(result["job_id"])
+        return result
+
+    async def run_many(self, model_name: str, inputs: Sequence[Any], batch_size: int = 1,
+                       concurrency: int = RUN_MANY_CONCURRENCY,
+                       return_exceptions: bool = False) -> List[Any]:
+        """
+        Run every input with at most ``concurrency`` requests in flight and
+        return the results in input order. With ``return_exceptions`` a
+        failed input leaves its exception in its slot instead of aborting
+        the rest.
+        """
+        sem = asyncio.Semaphore(max(1, concurrency))
+
+        async def one(item: Any) -> Dict[str, Any]:
+            async with sem:
+                return await self.run_inference(model_name, item, batch_size)
+
+        return await asyncio.gather(*(one(item) for item in inputs),
+                                    return_exceptions=return_exceptions)
+
+    async def stream_inference(self, model_name: str, input_data: Any,
+                               batch_size: int = 1) -> AsyncIterator[str]:
+        """
+        Yield output tokens as the server streams them (server-sent events).
+        The server's closing timing summary is left in ``last_stream_stats``.
+        Streams are not retried once they have started.
+        """
+        self.last_stream_stats = {}
+        payload = {"model_name": model_name, "input": input_data,
+                   "batch_size": batch_size, "stream": True}
+        async with self.client.stream("POST", "/inference", json=payload) as response:
+            response.raise_for_status()
+            event = None
+            async for line in response.aiter_lines():
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:"):
+                    data = json.loads(line[len("data:"):])
+                    if event == "token":
+                        yield data["token"]
+                    elif event == "error":
+                        raise RuntimeError(data.get("error", "stream failed"))
+                    elif event == "done":
+                        self.last_stream_stats = data
+                        return
+
+    async def stream_file_inference(self, model_name: str, path: Any,
+                                    batch_size: int = 1) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Upload a file of newline-delimited prompts and yield one result per
+        record (JSON Lines) as the server produces them.
+
+        The file is sent in chunks from a separate task while results are
+        read here, on a connection of its own. The server starts answering
+        before the upload ends, and httpx reads a response only once the
+        whole body is sent, which could fill both socket buffers and stall
+        on large files. Uploads are not retried.
+        """
+        path = Path(path)
+        url = urlsplit(self.base_url)
+        https = url.scheme == "https"
+        port = url.port or (443 if https else 80)
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(url.hostname, port, ssl=https or None), self.timeout)
+        conn = h11.Connection(our_role=h11.CLIENT)
+        query = urlencode({"model_name": model_name, "batch_size": batch_size})
+        writer.write(conn.send(h11.Request(
+            method="POST",
+            target=f"{url.path.rstrip('/')}/inference?{query}",
+            headers=[
+                ("Host", url.netloc),
+                ("Content-Type", "application/x-ndjson"),
+                ("Content-Length", str(path.stat().st_size)),
+            ],
+        )))
+
+        async def upload() -> None:
+            async for chunk in _file_chunks(path):
+                writer.write(conn.send(h11.Data(data=chunk)))
+                await writer.drain()
+            writer.write(conn.send(h11.EndOfMessage()))
+            await writer.drain()
+
+        async def events() -> AsyncIterator[Any]:
+            while True:
+                event = conn.next_event()
+                if event is h11.NEED_DATA:
+                    conn.receive_data(await asyncio.wait_for(reader.read(UPLOAD_CHUNK_SIZE), self.timeout))
+                    continue
+                if isinstance(event, (h11.EndOfMessage, h11.ConnectionClosed)):
+                    return
+                yield event
+
+        uploader = asyncio.create_task(upload())
+        stream = events()
+        try:
+            response = await stream.__anext__()
+            if response.status_code >= 400:
+                body = b"".join([event.data async for event in stream])
+                httpx.Response(response.status_code, content=body,
+                               request=httpx.Request("POST", self.base_url)).raise_for_status()
+            pending = b""
+            async for event in stream:
+                pending += event.data
+                *lines, pending = pending.split(b"\n")
+                for line in lines:
+                    if line.strip():
+                        yield json.loads(line)
+            if pending.strip():
+                yield json.loads(pending)
+            await uploader
+        finally:
+            await stream.aclose()
+            uploader.cancel()
+            writer.close()
+
+    async def get_job(self, job_id: str, wait_s: float = 0.0) -> Dict[str, Any]:
+        # The server may hold the request for wait_s before answering
+        response = await self._request("GET", f"/jobs/{job_id}", params={"wait_s": wait_s},
+                                       timeout=self.timeout + wait_s)
+        return response.json()
+
+    async def wait_for_job(self, job_id: str, timeout: float = 300.0) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            remaining = deadline - loop.time()
+            job = await self.get_job(job_id, wait_s=max(0.0, min(30.0, remaining)))
+            if job.get("status") in ("succeeded", "failed", "expired"):
+                return job
+            if remaining <= 0:
+                raise TimeoutError(f"job {job_id} still {job.get('status')} after {timeout}s")
+
+    # ----- system -----
+    async def get_system_status(self) -> Dict[str, Any]:
+        response = await self._request("GET", "/system/status")
+        return response.json()
+
+    async def get_statistics(self) -> Dict[str, Any]:
+        response = await self._request("GET", "/system/stats")
+        return response.json()
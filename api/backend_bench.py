@@ -0,0 +1,89 @@
+# api/backend_bench.py
+"""
+Benchmark an engine backend directly, without the WebSocket layer.
+
+Runs ``--sessions`` concurrent conversations of ``--turns`` turns each on a
+WorkerPool and reports time-to-first-chunk, turn latency and throughput.
+Against the mock llama-server this needs no GPU:
+
+    uvicorn api.mock_llama_server:app --port 8080
+    python -m api.backend_bench --backend llama-server --sessions 8
+    python -m api.backend_bench --backend llama-server --sessions 8 --no-keepalive
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import statistics
+import time
+from typing import List
+
+from api.engine import WorkerPool, create_backend
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return float("nan")
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run_session(pool: WorkerPool, turns: int, ttft: List[float], latency: List[float]) -> int:
+    chunks = 0
+    async with pool.session() as worker:
+        for i in range(turns):
+            start = time.perf_counter()
+            first = None
+            async for _ in worker.send_and_stream(f"benchmark turn {i}"):
+                if first is None:
+                    first = time.perf_counter() - start
+                chunks += 1
+            latency.append(time.perf_counter() - start)
+            ttft.append(first if first is not None else latency[-1])
+    return chunks
+
+
+async def main_async(args: argparse.Namespace) -> None:
+    if args.backend == "llama-server":
+        from api.llama_server import LlamaServerBackend
+
+        backend = LlamaServerBackend(keepalive_expiry=0 if args.no_keepalive else 60)
+    else:
+        backend = create_backend(args.backend)
+
+    pool = WorkerPool(backend, size=args.sessions, max_size=args.sessions)
+    await pool.start()
+    ttft: List[float] = []
+    latency: List[float] = []
+    try:
+        start = time.perf_counter()
+        chunks = await asyncio.gather(
+            *(run_session(pool, args.turns, ttft, latency) for _ in range(args.sessions))
+        )
+        elapsed = time.perf_counter() - start
+    finally:
+        await pool.close()
+
+    print(f"backend={backend.name} sessions={args.sessions} turns={len(latency)} "
+          f"keepalive={not args.no_keepalive}")
+    print(f"  first chunk ms: p50={1000 * percentile(ttft, 0.5):.1f} "
+          f"p95={1000 * percentile(ttft, 0.95):.1f}")
+    print(f"  turn ms:        p50={1000 * percentile(latency, 0.5):.1f} "
+          f"p95={1000 * percentile(latency, 0.95):.1f} "
+          f"mean={1000 * statistics.mean(latency):.1f}")
+    print(f"  throughput:     {len(latency) / elapsed:.1f} turns/s, "
+          f"{sum(chunks) / elapsed:.1f} chunks/s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark an engine backend")
+    parser.add_argument("--backend", choices=["llama-cli", "llama-server"], default="llama-server")
+    parser.add_argument("--sessions", type=int, default=4)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--no-keepalive", action="store_true",
+                        help="open a new HTTP connection per turn (llama-server only)")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
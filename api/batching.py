@@ -0,0 +1,144 @@
+# api/batching.py
+from __future__ import annotations
+
+import asyncio
+import bisect
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List
+
+# Server-side ceiling on batch size and on how long the first request of a
+# batch may wait for company.
+MAX_BATCH_SIZE = int(os.getenv("ALSPEC_MAX_BATCH_SIZE", "32"))
+MAX_BATCH_WAIT_S = float(os.getenv("ALSPEC_MAX_BATCH_WAIT_MS", "10")) / 1000.0
+
+# Upper bounds (ms) of the queue-wait histogram buckets.
+WAIT_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 250, 500, 1000]
+
+RunBatch = Callable[[str, List[Any]], Awaitable[List[Any]]]
+
+
+@dataclass
+class _Request:
+    item: Any
+    limit: int
+    future: asyncio.Future
+    enqueued_at: float
+
+
+class MicroBatcher:
+    """
+    Gathers concurrent requests for the same model into batches.
+
+    Each model has a dispatcher that runs one batch at a time. A batch opens
+    with the oldest waiting request and takes more until it reaches its size
+    limit or ``max_wait_s`` has passed since that request arrived; requests
+    that piled up while the previous batch was running join immediately.
+
+    A request's ``batch_size`` is the largest batch it is willing to join
+    (capped at ``max_batch_size``), and the batch limit is the largest among
+    its members, so requests with the default ``batch_size=1`` run alone and
+    pay no extra wait. Each batch is one ``run_batch(model, items)`` call
+    whose results are fanned back out in order.
+    """
+
+    def __init__(
+        self,
+        run_batch: RunBatch,
+        max_batch_size: int = MAX_BATCH_SIZE,
+        max_wait_s: float = MAX_BATCH_WAIT_S,
+    ):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_s = max_wait_s
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._dispatchers: Dict[str, asyncio.Task] = {}
+
+        self.batches = 0
+        self.requests = 0
+        self.batch_size_hist: Dict[int, int] = {}
+        self.wait_hist: List[int] = [0] * (len(WAIT_BUCKETS_MS) + 1)
+        self.total_wait_s = 0.0
+
+    async def submit(self, model: str, item: Any, batch_size: int = 1) -> Any:
+        limit = max(1, min(int(batch_size or 1), self.max_batch_size))
+        queue = self._queues.get(model)
+        if queue is None:
+            queue = self._queues[model] = asyncio.Queue()
+            self._dispatchers[model] = asyncio.create_task(self._dispatch(model, queue))
+
+        fut = asyncio.get_running_loop().create_future()
+        await queue.put(_Request(item, limit, fut, time.perf_counter()))
+        return await fut
+
+    async def close(self) -> None:
+        for task in self._dispatchers.values():
+            task.cancel()
+        self._dispatchers.clear()
+        self._queues.clear()
+
+    async def _dispatch(self, model: str, queue: asyncio.Queue) -> None:
+        while True:
+            first = await queue.get()
+            batch = [first]
+            limit = first.limit
+            deadline = first.enqueued_at + self.max_wait_s
+            while len(batch) < limit:
+                try:
+                    req = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - time.perf_counter()
+                    if timeout <= 0:
+                        break
+                    try:
+                        req = await asyncio.wait_for(queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                batch.append(req)
+                limit = max(limit, req.limit)
+            await self._run(model, batch)
+
+    async def _run(self, model: str, batch: List[_Request]) -> None:
+        # Requests whose caller was cancelled while they waited are not run
+        batch = [r for r in batch if not r.future.done()]
+        if not batch:
+            return
+        self._record(batch, time.perf_counter())
+        try:
+            results = await self.run_batch(model, [r.item for r in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(
+                    f"run_batch returned {len(results)} results for {len(batch)} inputs"
+                )
+        except Exception as e:
+            for req in batch:
+                if not req.future.done():
+                    req.future.set_exception(e)
+            return
+        for req, result in zip(batch, results):
+            if not req.future.done():
+                req.future.set_result(result)
+
+    def _record(self, batch: List[_Request], started: float) -> None:
+        size = len(batch)
+        self.batches += 1
+        self.requests += size
+        self.batch_size_hist[size] = self.batch_size_hist.get(size, 0) + 1
+        for req in batch:
+            wait_s = started - req.enqueued_at
+            self.total_wait_s += wait_s
+            self.wait_hist[bisect.bisect_left(WAIT_BUCKETS_MS, wait_s * 1000.0)] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        labels = [f"<={b}ms" for b in WAIT_BUCKETS_MS] + [f">{WAIT_BUCKETS_MS[-1]}ms"]
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_s * 1000.0,
+            "batches": self.batches,
+            "requests": self.requests,
+            "avg_batch_size": self.requests / self.batches if self.batches else 0.0,
+            "avg_wait_ms": 1000.0 * self.total_wait_s / self.requests if self.requests else 0.0,
+            "batch_size_histogram": {str(k): v for k, v in sorted(self.batch_size_hist.items())},
+            "wait_ms_histogram": dict(zip(labels, self.wait_hist)),
+        }
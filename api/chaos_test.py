@@ -0,0 +1,131 @@
+# api/chaos_test.py
+"""
+Chaos test for engine crash recovery.
+
+Starts a WorkerPool on the llama-cli backend with a hot standby, then, for
+each round, kills the engine (SIGKILL) in the middle of a reply and checks
+that:
+
+  - the interrupted turn fails with EngineCrashed instead of ending quietly,
+  - the supervisor recovers the worker from the standby, not a cold start,
+  - the next turn on the same worker is served, with a time to first token
+    far below the cold start time.
+
+Needs llama-cli and a model (ALSPEC_LLAMA_BIN / ALSPEC_MODEL_PATH):
+
+    python -m api.chaos_test --rounds 3
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import signal
+import sys
+import time
+from typing import Optional, Tuple
+
+from api.engine import EngineCrashed, LlamaCliBackend, LlamaCliWorker, WorkerPool
+
+PROMPT = "Write a long story about a lighthouse keeper."
+
+
+async def wait_for(condition, timeout: float, interval: float = 0.01) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        await asyncio.sleep(interval)
+    return True
+
+
+async def crash_mid_turn(worker: LlamaCliWorker, kill_after: int) -> Tuple[int, Optional[str]]:
+    """Run a turn and SIGKILL the engine after ``kill_after`` chunks; returns chunks seen and the error."""
+    chunks = 0
+    try:
+        async with worker.lock:
+            async for _ in worker.generate(PROMPT):
+                chunks += 1
+                if chunks == kill_after:
+                    os.kill(worker.proc.pid, signal.SIGKILL)
+    except EngineCrashed as e:
+        return chunks, str(e)
+    return chunks, None
+
+
+async def timed_turn(worker: LlamaCliWorker) -> Tuple[float, float, int]:
+    """Time to first chunk, total time and chunks for one turn."""
+    start = time.perf_counter()
+    first = None
+    chunks = 0
+    async for _ in worker.send_and_stream("Hello again"):
+        if first is None:
+            first = time.perf_counter() - start
+        chunks += 1
+    total = time.perf_counter() - start
+    return (first if first is not None else total), total, chunks
+
+
+async def main_async(args: argparse.Namespace) -> int:
+    pool = WorkerPool(LlamaCliBackend(), size=1, max_size=1, standby=1)
+    failures = 0
+    try:
+        start = time.perf_counter()
+        await pool.start()
+        cold_start_s = time.perf_counter() - start
+        print(f"Cold start (model load + warm-up): {cold_start_s:.3f}s")
+
+        supervisor = pool.supervisor
+        async with pool.session() as worker:
+            for round_no in range(1, args.rounds + 1):
+                if not await wait_for(lambda: supervisor.standby_ready >= 1, args.timeout):
+                    print(f"ERROR: standby not ready after {args.timeout:.0f}s")
+                    return 1
+                pid = worker.proc.pid
+                before = dict(supervisor.recoveries)
+
+                chunks, error = await crash_mid_turn(worker, args.kill_after)
+                recovered = await wait_for(
+                    lambda: sum(supervisor.recoveries.values()) > sum(before.values()), args.timeout
+                )
+                ttft, total, reply_chunks = await timed_turn(worker)
+
+                mode = supervisor.last_recovery_mode if recovered else None
+                checks = {
+                    "turn failed with EngineCrashed": error is not None,
+                    "recovered from standby": mode == "standby",
+                    "new engine process": worker.proc is not None and worker.proc.pid != pid,
+                    "next turn served": reply_chunks > 0,
+                    "no cold start": ttft < cold_start_s / 2,
+                }
+                ok = all(checks.values())
+                failures += not ok
+                recovery_ms = 1000.0 * (supervisor.last_recovery_s or 0.0)
+                print(f"Round {round_no}: killed pid {pid} after {chunks} chunks -> "
+                      f"recovered ({mode}) in {recovery_ms:.1f} ms, "
+                      f"next turn first token {1000.0 * ttft:.1f} ms, {total:.3f}s total: "
+                      f"{'PASS' if ok else 'FAIL'}")
+                for name, passed in checks.items():
+                    if not passed:
+                        print(f"  failed: {name}")
+
+        print("CHAOS TEST COMPLETED:")
+        print(f"  Rounds: {args.rounds}, failed: {failures}")
+        print(f"  Recoveries: {supervisor.recoveries['standby']} from standby, "
+              f"{supervisor.recoveries['cold']} cold")
+        return 1 if failures else 0
+    finally:
+        await pool.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Kill the engine mid-turn and check hot-standby recovery")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--kill-after", type=int, default=2, help="chunks to receive before killing the engine")
+    parser.add_argument("--timeout", type=float, default=300.0, help="seconds to wait for a standby or recovery")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
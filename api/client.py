@@ -1,7 +1,15 @@
 import requests
+import json
 import os
-from typing import Dict, Any, List, Optional
+import threading
+import time
+from http.client import HTTPConnection, HTTPSConnection
+from typing import Dict, Any, Iterator, List, Optional
 from pathlib import Path
+from urllib.parse import urlencode, urlsplit
+
+# Bytes read from an input file per upload write
+UPLOAD_CHUNK_SIZE = 256 * 1024
 
 class InferenceClient:
     def __init__(self, base_url: str = "http://localhost:8000"):
@@ -10,6 +18,7 @@ class InferenceClient:
             base_url = env_base.strip()
         self.base_url = base_url
         self.session = requests.Session()
+        self.last_stream_stats: Dict[str, Any] = {}
 
     # ----- models -----
     def load_model(self, model_name: str, model_path: Optional[str] = None,
@@ -36,10 +45,14 @@ class InferenceClient:
         response.raise_for_status()
         return response.json()
 
-    def list_models(self) -> List[Dict[str, Any]]:
+    def get_models(self) -> Dict[str, Any]:
+        """The raw /models response, including registry statistics when the server reports them."""
         resp = self.session.get(f"{self.base_url}/models")
         resp.raise_for_status()
-        data = resp.json()
+        return resp.json()
+
+    def list_models(self) -> List[Dict[str, Any]]:
+        data = self.get_models()
         # Normalize to a list of model dicts (what the CLI expects)
         if isinstance(data, dict) and "models" in data:
             return data["models"]
@@ -49,33 +62,155 @@ class InferenceClient:
         return []
 
     # ----- inference -----
-    def run_inference(self, model_name: str, input_data: Any,
-                      batch_size: int = 1, stream: bool = False) -> Dict[str, Any]:
+    def _post_inference(self, model_name: str, input_data: Any, batch_size: int,
+                        stream_output: bool, schedule: Optional[Dict[str, Any]] = None,
+                        **request_kwargs) -> requests.Response:
         params = {
             "model_name": model_name,
             "batch_size": batch_size,
-            "stream": stream,
+            "stream": stream_output,
         }
+        # Optional scheduling hints: priority, deadline_ms, client_id
+        params.update({k: v for k, v in (schedule or {}).items() if v is not None})
 
         p = Path(str(input_data))
         if p.exists() and p.is_file():
             # multipart/form-data when a file path is provided
             with open(p, "rb") as f:
                 files = {"input": f}
-                response = self.session.post(
-                    f"{self.base_url}/inference", data=params, files=files
+                return self.session.post(
+                    f"{self.base_url}/inference", data=params, files=files,
+                    **request_kwargs
+                )
+        # JSON body when input_data is text/JSON
+        payload = dict(params)
+        payload["input"] = input_data
+        return self.session.post(
+            f"{self.base_url}/inference", json=payload, **request_kwargs
+        )
+
+    def run_inference(self, model_name: str, input_data: Any,
+                      batch_size: int = 1, stream: bool = False,
+                      wait: bool = True, priority: Optional[str] = None,
+                      deadline_ms: Optional[float] = None,
+                      client_id: Optional[str] = None) -> Dict[str, Any]:
+        if stream:
+            # Collect the streamed tokens into the usual result shape
+            tokens = list(self.stream_inference(model_name, input_data, batch_size))
+            result = {"status": "succeeded", "model": model_name,
+                      "result": {"output": "".join(tokens)}}
+            result.update(self.last_stream_stats)
+            return result
+
+        p = Path(str(input_data))
+        if p.exists() and p.is_file():
+            # Files are streamed record by record; see stream_file_inference
+            results = list(self.stream_file_inference(model_name, p, batch_size))
+            return {"status": "succeeded", "model": model_name,
+                    "records": len(results), "results": results}
+
+        schedule = {"priority": priority, "deadline_ms": deadline_ms, "client_id": client_id}
+        response = self._post_inference(model_name, input_data, batch_size, False, schedule)
+        response.raise_for_status()
+        result = response.json()
+        # The server queues the job and answers 202; poll until it finishes
+        if wait and response.status_code == 202 and "job_id" in result:
+            result = self.wait_for_job(result["job_id"])
+        return result
+
+    def stream_inference(self, model_name: str, input_data: Any,
+                         batch_size: int = 1) -> Iterator[str]:
+        """
+        Yield output tokens as the server streams them (server-sent events).
+        The server's closing timing summary is left in ``last_stream_stats``.
+        """
+        self.last_stream_stats = {}
+        response = self._post_inference(model_name, input_data, batch_size, True,
+                                         stream=True)
+        with response:
+            response.raise_for_status()
+            event = None
+            # chunk_size=None hands over each chunk as soon as it arrives
+            for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:"):
+                    data = json.loads(line[len("data:"):])
+                    if event == "token":
+                        yield data["token"]
+                    elif event == "error":
+                        raise RuntimeError(data.get("error", "stream failed"))
+                    elif event == "done":
+                        self.last_stream_stats = data
+                        return
+
+    def stream_file_inference(self, model_name: str, path: Any,
+                              batch_size: int = 1) -> Iterator[Dict[str, Any]]:
+        """
+        Upload a file of newline-delimited prompts and yield one result per
+        record (JSON Lines) as the server produces them.
+
+        The body is written from a background thread while results are read
+        here. The server starts answering before the upload ends, so reading
+        only afterwards (as requests does) could fill both socket buffers and
+        stall on large files.
+        """
+        path = Path(path)
+        url = urlsplit(self.base_url)
+        conn_cls = HTTPSConnection if url.scheme == "https" else HTTPConnection
+        conn = conn_cls(url.hostname, url.port, timeout=300)
+        query = urlencode({"model_name": model_name, "batch_size": batch_size})
+        conn.putrequest("POST", f"{url.path.rstrip('/')}/inference?{query}")
+        conn.putheader("Content-Type", "application/x-ndjson")
+        conn.putheader("Content-Length", str(path.stat().st_size))
+        conn.endheaders()
+
+        upload_errors: List[Exception] = []
+
+        def upload():
+            try:
+                with open(path, "rb") as f:
+                    while True:
+                        chunk = f.read(UPLOAD_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        conn.send(chunk)
+            except Exception as e:
+                upload_errors.append(e)
+
+        uploader = threading.Thread(target=upload, daemon=True)
+        uploader.start()
+        try:
+            response = conn.getresponse()
+            if response.status >= 400:
+                raise requests.HTTPError(
+                    f"{response.status} {response.reason}: {response.read()[:200]!r}"
                 )
-        else:
-            # JSON body when input_data is text/JSON
-            payload = dict(params)
-            payload["input"] = input_data
-            response = self.session.post(
-                f"{self.base_url}/inference", json=payload
-            )
+            for line in response:
+                if line.strip():
+                    yield json.loads(line)
+            uploader.join()
+            if upload_errors:
+                raise upload_errors[0]
+        finally:
+            conn.close()
 
+    def get_job(self, job_id: str, wait_s: float = 0.0) -> Dict[str, Any]:
+        response = self.session.get(f"{self.base_url}/jobs/{job_id}",
+                                    params={"wait_s": wait_s})
         response.raise_for_status()
         return response.json()
 
+    def wait_for_job(self, job_id: str, timeout: float = 300.0) -> Dict[str, Any]:
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            job = self.get_job(job_id, wait_s=max(0.0, min(30.0, remaining)))
+            if job.get("status") in ("succeeded", "failed", "expired"):
+                return job
+            if remaining <= 0:
+                raise TimeoutError(f"job {job_id} still {job.get('status')} after {timeout}s")
+
     # ----- system -----
     def get_system_status(self) -> Dict[str, Any]:
         response = self.session.get(f"{self.base_url}/system/status")
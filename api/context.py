@@ -0,0 +1,288 @@
+# api/context.py
+"""
+Token accounting for the context window of one conversation.
+
+Every worker keeps a ContextWindow next to its conversation. Before a turn,
+``fit()`` checks that the system prompt, the history, the new message and
+room for the reply fit in the token budget; if not, the oldest turns are
+compacted and then dropped. The system prompt is always kept. After the
+turn, ``record()`` adds it to the history and ``last`` holds its token
+counts, which the server reports in the turn's end message.
+
+Tokens are counted with the model's own tokenizer where one can be found
+(see get_tokenizer) and estimated from the text length otherwise. Engine
+backends load it once, off the event loop, before their first worker
+starts (EngineBackend.prepare).
+"""
+from __future__ import annotations
+
+import logging
+import math
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from api.metrics import CONTEXT_TOKENS, CONTEXT_TRIMMED
+
+log = logging.getLogger(__name__)
+
+# Token budget of one conversation: system prompt, history, the next
+# message and the reply (the engine's output budget is reserved for it).
+CONTEXT_BUDGET = int(os.getenv("ALSPEC_CONTEXT_TOKENS", "4096"))
+
+# A turn that does not fit trims the history down to this fraction of the
+# budget rather than just under it, so the kept prefix (and the engine's
+# cache of it) stays the same for the next several turns instead of
+# shifting on every one.
+CONTEXT_LOW_WATER = float(os.getenv("ALSPEC_CONTEXT_LOW_WATER", "0.75"))
+
+# Old messages are first cut to this many tokens; turns are dropped, oldest
+# first, only if that is not enough.
+COMPACT_TOKENS = int(os.getenv("ALSPEC_CONTEXT_COMPACT_TOKENS", "48"))
+
+# tokenizer.json (tokenizers), tokenizer.model (sentencepiece) or a .gguf
+# whose vocabulary is used (read by transformers and gguf). Unset: look next
+# to the model, then in the model file itself.
+TOKENIZER_PATH = os.getenv("ALSPEC_TOKENIZER_PATH", "")
+
+# Chat template tokens around each message (Llama 3: role header and
+# end-of-turn markers).
+MESSAGE_OVERHEAD = 5
+
+# Without a tokenizer, one token per this many UTF-8 bytes.
+BYTES_PER_TOKEN = 4.0
+
+ELLIPSIS = " ..."
+
+
+class Tokenizer:
+    """Estimates token counts from the UTF-8 length; the fallback when no tokenizer loads."""
+
+    name = "estimate"
+
+    def count(self, text: str) -> int:
+        return math.ceil(len(text.encode("utf-8")) / BYTES_PER_TOKEN)
+
+    def truncate(self, text: str, tokens: int) -> str:
+        """The longest prefix of ``text`` that is at most ``tokens`` tokens."""
+        return text.encode("utf-8")[: int(tokens * BYTES_PER_TOKEN)].decode("utf-8", "ignore")
+
+
+class HFTokenizer(Tokenizer):
+    """A Hugging Face ``tokenizers`` tokenizer (tokenizer.json)."""
+
+    name = "tokenizers"
+
+    def __init__(self, tokenizer: Any):
+        self._tok = tokenizer
+
+    @classmethod
+    def from_file(cls, path: Path) -> "HFTokenizer":
+        from tokenizers import Tokenizer as _Tokenizer
+
+        return cls(_Tokenizer.from_file(str(path)))
+
+    @classmethod
+    def from_gguf(cls, path: Path) -> "HFTokenizer":
+        # transformers rebuilds the fast tokenizer from the vocabulary in the
+        # GGUF header; the tensors are not read.
+        from transformers import AutoTokenizer
+
+        return cls(AutoTokenizer.from_pretrained(str(path.parent), gguf_file=path.name).backend_tokenizer)
+
+    def count(self, text: str) -> int:
+        return len(self._tok.encode(text, add_special_tokens=False).ids)
+
+    def truncate(self, text: str, tokens: int) -> str:
+        if tokens <= 0:
+            return ""
+        encoding = self._tok.encode(text, add_special_tokens=False)
+        if len(encoding.ids) <= tokens:
+            return text
+        return text[: encoding.offsets[tokens - 1][1]]
+
+
+class SentencePieceTokenizer(Tokenizer):
+    """A sentencepiece model (tokenizer.model)."""
+
+    name = "sentencepiece"
+
+    def __init__(self, path: Path):
+        import sentencepiece
+
+        self._sp = sentencepiece.SentencePieceProcessor(model_file=str(path))
+
+    def count(self, text: str) -> int:
+        return len(self._sp.encode(text))
+
+    def truncate(self, text: str, tokens: int) -> str:
+        ids = self._sp.encode(text)
+        return text if len(ids) <= tokens else self._sp.decode(ids[: max(tokens, 0)])
+
+
+def _load(path: Path) -> Tokenizer:
+    if path.suffix == ".json":
+        return HFTokenizer.from_file(path)
+    if path.suffix == ".model":
+        return SentencePieceTokenizer(path)
+    if path.suffix == ".gguf":
+        return HFTokenizer.from_gguf(path)
+    raise ValueError(f"unknown tokenizer format {path.suffix!r}")
+
+
+@lru_cache(maxsize=None)
+def get_tokenizer(model_path: Optional[Path] = None) -> Tokenizer:
+    """
+    The tokenizer for ``model_path``, loaded once per process:
+    ALSPEC_TOKENIZER_PATH if set, else tokenizer.json or tokenizer.model
+    next to the model, else the model's own GGUF vocabulary. Falls back to
+    the estimate if none of them loads.
+    """
+    if TOKENIZER_PATH:
+        candidates = [Path(TOKENIZER_PATH)]
+    elif model_path is not None:
+        candidates = [model_path.parent / "tokenizer.json", model_path.parent / "tokenizer.model", model_path]
+    else:
+        candidates = []
+    for path in candidates:
+        if not path.is_file():
+            continue
+        try:
+            tokenizer = _load(path)
+        except Exception as e:
+            log.warning("could not load tokenizer from %s: %s", path, e)
+            continue
+        log.info("counting context tokens with %s (%s)", path, tokenizer.name)
+        return tokenizer
+    log.warning("no tokenizer found; context tokens are estimated at %.0f bytes each", BYTES_PER_TOKEN)
+    return Tokenizer()
+
+
+@dataclass
+class Turn:
+    user: str
+    reply: str
+    tokens: int
+    compacted: bool = False
+
+
+class ContextWindow:
+    """
+    The token budget of one conversation.
+
+    ``reserve`` tokens are kept free for the reply. With ``compact=False``
+    old turns are only dropped, for engines whose history cannot be
+    rewritten (llama-cli shifts its own context; the window then tracks
+    what it keeps).
+    """
+
+    def __init__(
+        self,
+        system_prompt: str,
+        tokenizer: Tokenizer,
+        backend: str,
+        reserve: int = 0,
+        budget: int = CONTEXT_BUDGET,
+        low_water: float = CONTEXT_LOW_WATER,
+        compact_tokens: int = COMPACT_TOKENS,
+        compact: bool = True,
+    ):
+        self.system_prompt = system_prompt
+        self.tokenizer = tokenizer
+        self.backend = backend
+        self.reserve = reserve
+        self.budget = budget
+        self.low_water = low_water
+        self.compact_tokens = compact_tokens
+        self.compact = compact
+        self.system_tokens = self._message_tokens(system_prompt)
+        self.turns: List[Turn] = []
+        # Token counts of the last finished turn
+        self.last: Dict[str, Any] = {}
+        self._pending: Dict[str, int] = {}
+
+    def _message_tokens(self, text: str) -> int:
+        return self.tokenizer.count(text) + MESSAGE_OVERHEAD
+
+    @property
+    def tokens(self) -> int:
+        """Tokens the conversation takes up, system prompt included."""
+        return self.system_tokens + sum(turn.tokens for turn in self.turns)
+
+    def clear(self) -> None:
+        self.turns = []
+        self._pending = {}
+
+    def add(self, user_msg: str, reply: str) -> None:
+        """Append a turn to the history without reporting it (warm-up, replayed replies)."""
+        tokens = self._message_tokens(user_msg) + self._message_tokens(reply)
+        self.turns.append(Turn(user_msg, reply, tokens))
+
+    def fit(self, user_msg: str) -> None:
+        """Make room for a turn starting with ``user_msg``."""
+        raw_tokens = self.tokenizer.count(user_msg)
+        prompt_tokens = raw_tokens + MESSAGE_OVERHEAD
+        compacted = dropped = 0
+        if self.tokens + prompt_tokens + self.reserve > self.budget:
+            target = int(self.low_water * self.budget) - prompt_tokens - self.reserve
+            shortened: List[Turn] = []
+            if self.compact:
+                # Oldest first; the latest turn is kept whole
+                for turn in self.turns[:-1]:
+                    if self.tokens <= target:
+                        break
+                    if not turn.compacted:
+                        self._compact(turn)
+                        shortened.append(turn)
+            while self.turns and self.tokens > target:
+                self.turns.pop(0)
+                dropped += 1
+            # Turns compacted and then dropped anyway count as dropped
+            kept = {id(turn) for turn in self.turns}
+            compacted = sum(id(turn) in kept for turn in shortened)
+            if self.tokens > target:
+                log.warning("%s: system prompt and message (%d tokens) leave no room in a %d-token context",
+                            self.backend, self.system_tokens + prompt_tokens, self.budget)
+            CONTEXT_TRIMMED.labels(self.backend, "compacted").inc(compacted)
+            CONTEXT_TRIMMED.labels(self.backend, "dropped").inc(dropped)
+        self._pending = {"prompt_tokens": raw_tokens, "turns_compacted": compacted, "turns_dropped": dropped}
+
+    def _compact(self, turn: Turn) -> None:
+        turn.user = self._shorten(turn.user)
+        turn.reply = self._shorten(turn.reply)
+        turn.tokens = self._message_tokens(turn.user) + self._message_tokens(turn.reply)
+        turn.compacted = True
+
+    def _shorten(self, text: str) -> str:
+        short = self.tokenizer.truncate(text, self.compact_tokens)
+        return text if short == text else short.rstrip() + ELLIPSIS
+
+    def record(self, user_msg: str, reply: str) -> Dict[str, Any]:
+        """Add a finished (or cancelled) turn, made room for by ``fit()``, and report its token counts."""
+        self.add(user_msg, reply)
+        self.last = {
+            **(self._pending or {"prompt_tokens": self.tokenizer.count(user_msg)}),
+            "reply_tokens": self.tokenizer.count(reply),
+            "context_tokens": self.tokens,
+            "context_budget": self.budget,
+            "turns_in_context": len(self.turns),
+        }
+        self._pending = {}
+        CONTEXT_TOKENS.labels(self.backend).observe(self.tokens)
+        return self.last
+
+    def export(self) -> List[List[str]]:
+        """The history as [user, reply] pairs, e.g. to save with a KV snapshot."""
+        return [[turn.user, turn.reply] for turn in self.turns]
+
+    def messages(self, user_msg: Optional[str] = None) -> List[Dict[str, str]]:
+        """The conversation as chat messages, for engines that are sent the whole history."""
+        messages = [{"role": "system", "content": self.system_prompt}]
+        for turn in self.turns:
+            messages.append({"role": "user", "content": turn.user})
+            messages.append({"role": "assistant", "content": turn.reply})
+        if user_msg is not None:
+            messages.append({"role": "user", "content": user_msg})
+        return messages
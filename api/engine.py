@@ -2,11 +2,24 @@
 from __future__ import annotations
 
 import asyncio
+import logging
+import os
+import signal
+import time
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import AsyncGenerator, Optional
+from typing import Any, AsyncGenerator, AsyncIterator, Callable, Dict, List, Optional, Set
 
-# Path to llama-cli binary on Marshall's server
-LLAMA_BIN = (
+from api.context import CONTEXT_BUDGET, ContextWindow, Tokenizer, get_tokenizer
+from api.kv_store import prefix_cache_path
+from api.metrics import CANCEL_LATENCY, ENGINE_RECOVERY, ENGINE_RESTARTS, TOKENS_DISCARDED, turn_cancelled
+from api.stream_reader import TurnReader
+
+log = logging.getLogger(__name__)
+
+# Path to llama-cli binary on Marshall's server (override with ALSPEC_LLAMA_BIN)
+LLAMA_BIN = Path(os.getenv("ALSPEC_LLAMA_BIN") or (
     Path.home()
     / "implementation"
     / "server-core"
@@ -14,97 +27,768 @@ LLAMA_BIN = (
     / "build"
     / "bin"
     / "llama-cli"
-)
+))
+
+MODEL_PATH = Path(os.getenv("ALSPEC_MODEL_PATH") or (
+    Path.home()
+    / "implementation"
+    / "server-core"
+    / "model_storage"
+    / "Llama-3.2-1B-Instruct-Q4_K_M.gguf"
+))
 
 SYSTEM_PROMPT = "You are a helpful assistant."
 
-# GLOBAL persistent llama process
-_llama_proc: Optional[asyncio.subprocess.Process] = None
+# Output token budget per turn (llama-cli -n)
+MAX_TOKENS = int(os.getenv("ALSPEC_MAX_TOKENS", "256"))
+
+# Pool sizing. POOL_SIZE workers are kept running at all times; the pool
+# grows on demand up to POOL_MAX_SIZE (bounded by how many copies of the
+# model the GPU can hold).
+POOL_SIZE = int(os.getenv("ALSPEC_POOL_SIZE", "1"))
+POOL_MAX_SIZE = int(os.getenv("ALSPEC_POOL_MAX_SIZE", str(max(POOL_SIZE, 1))))
+HEALTH_CHECK_INTERVAL_S = float(os.getenv("ALSPEC_HEALTH_CHECK_INTERVAL_S", "5.0"))
+
+# Which EngineBackend serves turns: "llama-cli" (REPL over pipes),
+# "llama-server" (HTTP, see api/llama_server.py) or "speculative" (tiny
+# draft/target torch models on CPU, see api/speculative.py).
+ENGINE_BACKEND = os.getenv("ALSPEC_ENGINE_BACKEND", "llama-cli")
+
+# A worker is ready once its engine has loaded the model and answered
+# WARMUP_PROMPT (set it to "" to skip the warm-up turn).
+START_TIMEOUT_S = float(os.getenv("ALSPEC_ENGINE_START_TIMEOUT_S", "300"))
+WARMUP_PROMPT = os.getenv("ALSPEC_WARMUP_PROMPT", "Hi")
+
+# Pre-warmed spare engines kept by the supervisor. A worker whose engine
+# dies takes one over instead of loading the model again. Each standby
+# holds a full copy of the model; 0 disables them.
+STANDBY_ENGINES = int(os.getenv("ALSPEC_STANDBY_ENGINES", "1"))
+STANDBY_RETRY_S = float(os.getenv("ALSPEC_STANDBY_RETRY_S", "5.0"))
+
+# Serializes llama-cli starts while the shared system-prompt cache is being
+# written, so only one engine writes it and the rest load it.
+_prefix_lock = asyncio.Lock()
+
+# A cancelled llama-cli turn is interrupted with SIGINT; an engine that is
+# not back at its prompt within CANCEL_TIMEOUT_S is killed and replaced.
+CANCEL_TIMEOUT_S = float(os.getenv("ALSPEC_CANCEL_TIMEOUT_S", "10"))
+
+
+class EngineCrashed(RuntimeError):
+    """The engine exited in the middle of a turn; the turn's output is incomplete."""
+
+
+class EngineWorker(ABC):
+    """
+    One conversation on an engine backend.
+
+    Turns are serialized with ``lock`` so two sessions sharing a worker
+    never interleave their prompts.
+    """
+
+    def __init__(self, worker_id: int):
+        self.worker_id = worker_id
+        self.sessions = 0
+        self.lock = asyncio.Lock()
+        self._ready = False
+        # Notified when the engine exits on its own (set by the pool)
+        self.supervisor: Optional[EngineSupervisor] = None
+        # Token accounting for the conversation, on backends that keep one
+        self.context: Optional[ContextWindow] = None
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__} id={self.worker_id} sessions={self.sessions}>"
+
+    @property
+    def ready(self) -> bool:
+        return self._ready and self.is_alive()
+
+    @property
+    @abstractmethod
+    def failed(self) -> bool:
+        """True when the worker was started but its engine has gone away."""
+
+    @abstractmethod
+    def is_alive(self) -> bool:
+        ...
+
+    @abstractmethod
+    async def start(self) -> None:
+        """Start the engine if needed and return once it is ready for a turn."""
+
+    @abstractmethod
+    async def stop(self) -> None:
+        ...
+
+    def remember(self, user_msg: str, reply: str) -> None:
+        """
+        Add a turn that was answered without the engine (e.g. from the
+        response cache) to the conversation, if the backend can. The REPL
+        cannot, so by default this does nothing.
+        """
+
+    async def reset(self) -> None:
+        """
+        Forget the current conversation. The caller must hold ``self.lock``.
+        The default restarts the engine; backends that keep history outside
+        the engine override this with something cheaper.
+        """
+        await self.stop()
+        await self.start()
+
+    @property
+    def can_save_state(self) -> bool:
+        """Whether ``save_state`` and ``load_state`` work on this worker."""
+        return False
 
+    async def save_state(self, name: str) -> bool:
+        """
+        Have the engine write the conversation's KV state to ``name`` in the
+        KV cache directory (see api/kv_store.py). The caller must hold
+        ``self.lock``. Returns False if the backend cannot.
+        """
+        return False
 
-async def start_llama_if_needed() -> None:
+    async def load_state(self, name: str) -> bool:
+        """
+        Load KV state saved by ``save_state``; the caller then adds the
+        history with ``remember``. Returns False if the backend cannot.
+        """
+        return False
+
+    @abstractmethod
+    def generate(self, user_msg: str) -> AsyncGenerator[str, None]:
+        """
+        Stream the reply to one user message. The caller must hold
+        ``self.lock``. Closing the generator or cancelling the task that
+        iterates it stops the engine's generation as well; what was said
+        so far stays in the conversation.
+        """
+
+    def adopt(self, other: "EngineWorker") -> bool:
+        """
+        Take over ``other``'s running, warm engine, leaving ``other`` empty.
+        Returns False if this backend cannot hand engines over.
+        """
+        return False
+
+    def turn_stats(self) -> Dict[str, Any]:
+        """Backend-specific figures for the last turn (e.g. speculation), reported to the client."""
+        return {}
+
+    async def send_and_stream(self, user_msg: str) -> AsyncGenerator[str, None]:
+        """Run one turn under this worker's lock."""
+        async with self.lock:
+            stream = self.generate(user_msg)
+            try:
+                async for text in stream:
+                    yield text
+            finally:
+                await stream.aclose()
+
+
+class EngineBackend(ABC):
+    """Creates workers for one kind of engine and owns any shared resources."""
+
+    name: str
+    # Identifies the model being served (part of the response-cache key).
+    model: str = ""
+    # Whether workers can adopt a standby's engine (see EngineSupervisor).
+    standby: bool = False
+
+    @abstractmethod
+    def create_worker(self, worker_id: int) -> EngineWorker:
+        ...
+
+    async def prepare(self) -> None:
+        """Load what the workers share; WorkerPool.start awaits it before creating any."""
+        pass
+
+    async def close(self) -> None:
+        pass
+
+
+class LlamaCliWorker(EngineWorker):
     """
-    Start the llama-cli persistent REPL if not already running.
+    One persistent llama-cli REPL process.
 
     We intentionally use llama.cpp's built-in chat interface:
         ./llama-cli -m <model> --system-prompt "..."
     so it remembers conversation history and keeps a KV cache alive.
     """
-    global _llama_proc
-    if _llama_proc is not None:
-        return
-
-    model_path = (
-        Path.home()
-        / "implementation"
-        / "server-core"
-        / "model_storage"
-        / "Llama-3.2-1B-Instruct-Q4_K_M.gguf"
-    )
-
-    if not LLAMA_BIN.is_file():
-        raise RuntimeError(f"llama-cli not found at {LLAMA_BIN}")
-    if not model_path.is_file():
-        raise RuntimeError(f"Model file not found at {model_path}")
-
-    cmd = [
-        str(LLAMA_BIN),
-        "-m",
-        str(model_path),
-        "--system-prompt",
-        SYSTEM_PROMPT,
-        "-n",
-        "256",
-        "--split-mode",
-        "none",
-        "--main-gpu",
-        "0",
-    ]
-
-    _llama_proc = await asyncio.create_subprocess_exec(
-        *cmd,
-        stdin=asyncio.subprocess.PIPE,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
-    )
-
-    # Give llama.cpp a moment to print its banner / warmup.
-    # We don't try to consume it here; the first user message
-    # will flush any remaining startup text.
-    await asyncio.sleep(1.0)
 
+    def __init__(self, worker_id: int, model_path: Path = MODEL_PATH, tokenizer: Optional[Tokenizer] = None):
+        super().__init__(worker_id)
+        self.model_path = model_path
+        self.proc: Optional[asyncio.subprocess.Process] = None
+        self._stderr_task: Optional[asyncio.Task] = None
+        self._exit_task: Optional[asyncio.Task] = None
+        # Drains an interrupted turn; the next turn waits for it
+        self._settle_task: Optional[asyncio.Task] = None
+        self.context = ContextWindow(
+            SYSTEM_PROMPT, tokenizer or Tokenizer(), "llama-cli", reserve=MAX_TOKENS, compact=False
+        )
 
-async def send_and_stream(user_msg: str) -> AsyncGenerator[str, None]:
+    def __repr__(self) -> str:
+        pid = self.proc.pid if self.proc is not None else None
+        return f"<LlamaCliWorker id={self.worker_id} pid={pid} sessions={self.sessions}>"
+
+    @property
+    def failed(self) -> bool:
+        return self.proc is not None and self.proc.returncode is not None
+
+    def is_alive(self) -> bool:
+        return self.proc is not None and self.proc.returncode is None
+
+    async def start(self) -> None:
+        """
+        Start the llama-cli process if it is not already running, and return
+        once it is ready to take a turn.
+        """
+        if self.is_alive():
+            return
+        if self.failed:
+            ENGINE_RESTARTS.labels("cold").inc()
+
+        if not LLAMA_BIN.is_file():
+            raise RuntimeError(f"llama-cli not found at {LLAMA_BIN}")
+        if not self.model_path.is_file():
+            raise RuntimeError(f"Model file not found at {self.model_path}")
+
+        prefix = prefix_cache_path(self.model_path, SYSTEM_PROMPT)
+        if prefix is None or prefix.is_file():
+            await self._launch(prefix)
+        else:
+            # The first engine to start writes the shared prefix
+            async with _prefix_lock:
+                prefix.parent.mkdir(parents=True, exist_ok=True)
+                await self._launch(prefix)
+
+    async def _launch(self, prefix: Optional[Path]) -> None:
+        cmd = [
+            str(LLAMA_BIN),
+            "-m",
+            str(self.model_path),
+            "--system-prompt",
+            SYSTEM_PROMPT,
+            "-n",
+            str(MAX_TOKENS),
+            # Bound the context; when it fills up, llama.cpp drops the
+            # oldest tokens after the system prompt (--keep -1)
+            "-c",
+            str(CONTEXT_BUDGET),
+            "--keep",
+            "-1",
+            "--split-mode",
+            "none",
+            "--main-gpu",
+            "0",
+        ]
+        if prefix is not None:
+            # The system prompt's KV state, shared by every engine: loaded
+            # instead of prefilled, and written only if it does not exist yet
+            cmd += ["--prompt-cache", str(prefix)]
+            if prefix.is_file():
+                cmd.append("--prompt-cache-ro")
+
+        self.proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+
+        self._ready = False
+        self.context.clear()
+        self._stderr_task = asyncio.create_task(self._drain_stderr(self.proc))
+        self._exit_task = asyncio.create_task(self._watch_exit(self.proc))
+
+        try:
+            await asyncio.wait_for(self._wait_until_ready(), timeout=START_TIMEOUT_S)
+        except BaseException:
+            await self.stop()
+            raise
+        self._ready = True
+
+    async def _wait_until_ready(self) -> None:
+        """
+        Consume the startup banner up to the first prompt, then run the
+        warm-up turn so the first real user neither waits for the model load
+        nor sees banner text in their reply.
+        """
+        assert self.proc is not None and self.proc.stdout is not None
+        reader = TurnReader(self.proc.stdout)
+        async for _ in reader:
+            pass
+        if reader.eof:
+            code = await self.proc.wait()
+            raise RuntimeError(f"llama-cli exited during startup with code {code}")
+
+        if WARMUP_PROMPT:
+            reply = [text async for text in self._run_turn(WARMUP_PROMPT)]
+            self.context.add(WARMUP_PROMPT, "".join(reply))
+
+    @staticmethod
+    async def _drain_stderr(proc: asyncio.subprocess.Process) -> None:
+        # llama.cpp logs heavily to stderr; an unread pipe would eventually
+        # fill up and block the process.
+        assert proc.stderr is not None
+        while True:
+            line = await proc.stderr.readline()
+            if not line:
+                return
+            log.debug("llama-cli[%s]: %s", proc.pid, line.decode("utf-8", "replace").rstrip())
+
+    async def _watch_exit(self, proc: asyncio.subprocess.Process) -> None:
+        code = await proc.wait()
+        # Exits during startup are reported by start() itself
+        if self.proc is proc and self._ready:
+            log.warning("%r: llama-cli exited with code %s", self, code)
+            self._ready = False
+            if self.supervisor is not None:
+                self.supervisor.engine_exited(self)
+
+    def adopt(self, other: EngineWorker) -> bool:
+        if not isinstance(other, LlamaCliWorker) or not other.ready:
+            return False
+        for task in (self._exit_task, self._stderr_task, self._settle_task, other._exit_task):
+            if task is not None:
+                task.cancel()
+        self.proc, other.proc = other.proc, None
+        self._stderr_task, other._stderr_task = other._stderr_task, None
+        other._exit_task = None
+        self._settle_task = None
+        self.context, other.context = other.context, self.context
+        other._ready = False
+        self._exit_task = asyncio.create_task(self._watch_exit(self.proc))
+        self._ready = True
+        return True
+
+    async def stop(self) -> None:
+        self._ready = False
+        if self._settle_task is not None:
+            self._settle_task.cancel()
+            self._settle_task = None
+        if self._exit_task is not None:
+            self._exit_task.cancel()
+            self._exit_task = None
+        if self._stderr_task is not None:
+            self._stderr_task.cancel()
+            self._stderr_task = None
+        if self.proc is None:
+            return
+        if self.proc.returncode is None:
+            self.proc.terminate()
+            try:
+                await asyncio.wait_for(self.proc.wait(), timeout=5.0)
+            except asyncio.TimeoutError:
+                self.proc.kill()
+                await self.proc.wait()
+        self.proc = None
+
+    async def generate(self, user_msg: str) -> AsyncGenerator[str, None]:
+        """
+        Send a user message into this worker's REPL and stream output.
+
+        We write the text to stdin, then read stdout until we see a new prompt
+        ("> " on its own line). This is a best-effort heuristic that matches
+        llama.cpp's interactive mode well enough for the demo; the prompt
+        itself is not included in the output.
+
+        If the previous turn was cancelled, its leftover output is drained
+        first; if the engine died since the last turn, the supervisor
+        replaces it (from the standby when one is warm).
+        """
+        if self._settle_task is not None:
+            await asyncio.shield(self._settle_task)
+            self._settle_task = None
+        if self.failed and self.supervisor is not None:
+            await self.supervisor.replace(self)
+        await self.start()
+        self.context.fit(user_msg)
+        reply: List[str] = []
+        turn = self._run_turn(user_msg)
+        try:
+            async for text in turn:
+                reply.append(text)
+                yield text
+        finally:
+            # Delivers a close of this generator to the turn, which interrupts the engine
+            await turn.aclose()
+            # A stopped reply stays in the conversation; a crash loses all of it
+            if not self.failed:
+                self.context.record(user_msg, "".join(reply))
+
+    async def _run_turn(self, user_msg: str) -> AsyncGenerator[str, None]:
+        assert self.proc is not None
+        assert self.proc.stdin is not None
+        assert self.proc.stdout is not None
+
+        reader = TurnReader(self.proc.stdout)
+        reply: List[str] = []
+        try:
+            # Send the user message and a newline so llama.cpp treats it as one turn.
+            try:
+                self.proc.stdin.write((user_msg + "\n").encode("utf-8"))
+                await self.proc.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError) as e:
+                raise EngineCrashed(f"llama-cli (pid {self.proc.pid}) is gone") from e
+
+            async for text in reader:
+                reply.append(text)
+                yield text
+        except (asyncio.CancelledError, GeneratorExit):
+            if not reader.matched and not reader.eof:
+                self._interrupt(reader, reply)
+            raise
+        if reader.eof:
+            raise EngineCrashed(f"llama-cli (pid {self.proc.pid}) exited during the turn")
+
+    def _interrupt(self, reader: TurnReader, reply: List[str]) -> None:
+        """
+        Stop the reply of a cancelled turn, as Ctrl+C does in the REPL:
+        on SIGINT llama-cli stops generating and prints a new prompt. The
+        rest of the output is read and dropped in the background.
+
+        Before any output has arrived llama-cli may still be reading the
+        message, and SIGINT at its input prompt makes it exit, so the
+        signal then waits for the first chunk of the reply.
+        """
+        turn_cancelled("llama-cli", self.context.tokenizer.count("".join(reply)), MAX_TOKENS)
+        signalled = bool(reply) and self._send_interrupt()
+        self._settle_task = asyncio.create_task(self._settle(reader, signalled))
+
+    def _send_interrupt(self) -> bool:
+        try:
+            self.proc.send_signal(signal.SIGINT)
+        except ProcessLookupError:
+            return False
+        return True
+
+    async def _settle(self, reader: TurnReader, signalled: bool) -> None:
+        """Read an interrupted turn up to the next prompt, killing the engine if it never comes."""
+        proc = self.proc
+        start = time.monotonic()
+        discarded = 0
+
+        async def drain() -> None:
+            nonlocal signalled, discarded
+            async for _ in reader:
+                discarded += 1
+                if not signalled and not reader.matched:
+                    signalled = self._send_interrupt()
+
+        try:
+            await asyncio.wait_for(drain(), timeout=CANCEL_TIMEOUT_S)
+        except asyncio.TimeoutError:
+            log.warning("%r not back at the prompt %.0fs after a cancelled turn, killing it", self, CANCEL_TIMEOUT_S)
+            if proc.returncode is None:
+                proc.kill()
+            await proc.wait()
+        TOKENS_DISCARDED.labels("llama-cli").inc(discarded)
+        if reader.matched:
+            CANCEL_LATENCY.labels("llama-cli").observe(time.monotonic() - start)
+
+
+class LlamaCliBackend(EngineBackend):
+    name = "llama-cli"
+    standby = True
+
+    def __init__(self, model_path: Path = MODEL_PATH):
+        self.model_path = model_path
+        self.model = model_path.name
+        # Context tokens are estimated until prepare() has loaded the tokenizer
+        self.tokenizer: Tokenizer = Tokenizer()
+
+    async def prepare(self) -> None:
+        self.tokenizer = await asyncio.to_thread(get_tokenizer, self.model_path)
+
+    def create_worker(self, worker_id: int) -> EngineWorker:
+        return LlamaCliWorker(worker_id, self.model_path, self.tokenizer)
+
+
+def create_backend(name: str = ENGINE_BACKEND) -> EngineBackend:
+    if name == "llama-cli":
+        return LlamaCliBackend()
+    if name == "llama-server":
+        from api.llama_server import LlamaServerBackend
+
+        return LlamaServerBackend()
+    if name == "speculative":
+        from api.speculative import SpeculativeBackend
+
+        return SpeculativeBackend()
+    raise ValueError(f"unknown engine backend {name!r} (expected llama-cli, llama-server or speculative)")
+
+
+class EngineSupervisor:
     """
-    Send a user message into the running llama-cli REPL and stream output.
+    Replaces engines that exit, from a set of pre-warmed standbys.
 
-    We write the text to stdin, then read stdout until we see a new prompt
-    ("> " on its own line). This is a best-effort heuristic that matches
-    llama.cpp's interactive mode well enough for the demo.
+    Workers report an engine that exits on its own to ``engine_exited``.
+    The worker then takes over a standby engine that has already loaded
+    the model and answered the warm-up turn, so it serves again within
+    milliseconds, and a new standby is started in the background. With no
+    standby ready, or a backend that cannot hand engines over, the worker
+    is cold-started instead. Either way the worker object stays the same,
+    so sessions pinned to it keep working (the crashed engine's
+    conversation history is lost).
     """
-    await start_llama_if_needed()
-    assert _llama_proc is not None
-    assert _llama_proc.stdin is not None
-    assert _llama_proc.stdout is not None
-
-    # Send the user message and a newline so llama.cpp treats it as one turn.
-    _llama_proc.stdin.write((user_msg + "\n").encode("utf-8"))
-    await _llama_proc.stdin.drain()
-
-    buffer = ""
-    while True:
-        chunk = await _llama_proc.stdout.read(128)
-        if not chunk:
-            # Process ended unexpectedly.
-            if buffer:
-                yield buffer
-            break
-
-        text = chunk.decode("utf-8", errors="ignore")
-        buffer += text
-        yield text
-
-        # Heuristic: when the interactive prompt returns ("\n> "),
-        # llama.cpp is waiting for the next user turn.
-        if "\n> " in buffer or buffer.endswith("\n> ") or buffer.endswith("> "):
-            break
+
+    def __init__(self, create_worker: Callable[[], EngineWorker], standby: int = STANDBY_ENGINES):
+        self.create_worker = create_worker
+        self.standby_size = standby
+        self.standby: List[EngineWorker] = []
+        self.recoveries = {"standby": 0, "cold": 0}
+        self.last_recovery_s: Optional[float] = None
+        self.last_recovery_mode: Optional[str] = None
+        self._fill_task: Optional[asyncio.Task] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._closed = False
+
+    @property
+    def standby_ready(self) -> int:
+        return sum(w.ready for w in self.standby)
+
+    def engine_exited(self, worker: EngineWorker) -> None:
+        if self._closed:
+            return
+        if worker in self.standby:
+            self.standby.remove(worker)
+            self.refill()
+            return
+        task = asyncio.create_task(self._recover(worker, time.monotonic()))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _recover(self, worker: EngineWorker, exited_at: float) -> None:
+        try:
+            # Waits for a turn that was running on the dead engine to end
+            async with worker.lock:
+                await self.replace(worker, exited_at)
+        except Exception:
+            log.exception("recovering %r failed", worker)
+
+    async def replace(self, worker: EngineWorker, exited_at: Optional[float] = None) -> Optional[str]:
+        """
+        Get a failed ``worker`` serving again; the caller must hold
+        ``worker.lock``. Returns "standby" or "cold", or None if the worker
+        had not failed (e.g. it was already recovered).
+        """
+        if not worker.failed:
+            return None
+        started = time.monotonic() if exited_at is None else exited_at
+        if self.take_standby(worker):
+            mode = "standby"
+            ENGINE_RESTARTS.labels(mode).inc()
+        else:
+            mode = "cold"
+            await worker.start()
+        elapsed = time.monotonic() - started
+        ENGINE_RECOVERY.labels(mode).observe(elapsed)
+        self.recoveries[mode] += 1
+        self.last_recovery_s = elapsed
+        self.last_recovery_mode = mode
+        log.warning("%r recovered from %s in %.3fs", worker, mode, elapsed)
+        return mode
+
+    def take_standby(self, worker: EngineWorker) -> bool:
+        """Hand a warm standby engine to ``worker``; False if none could be used."""
+        for spare in self.standby:
+            if spare.ready and worker.adopt(spare):
+                self.standby.remove(spare)
+                self.refill()
+                return True
+        return False
+
+    def refill(self) -> None:
+        """Start standbys in the background until there are ``standby_size``."""
+        if self._closed or len(self.standby) >= self.standby_size:
+            return
+        if self._fill_task is None or self._fill_task.done():
+            self._fill_task = asyncio.create_task(self._fill())
+
+    async def _fill(self) -> None:
+        while not self._closed and len(self.standby) < self.standby_size:
+            spare = self.create_worker()
+            spare.supervisor = self
+            try:
+                await spare.start()
+            except Exception:
+                log.exception("starting standby engine failed")
+                await asyncio.sleep(STANDBY_RETRY_S)
+                continue
+            self.standby.append(spare)
+            log.info("standby %r ready", spare)
+
+    async def close(self) -> None:
+        self._closed = True
+        tasks = [t for t in (self._fill_task, *self._tasks) if t is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        standby, self.standby = self.standby, []
+        await asyncio.gather(*(w.stop() for w in standby), return_exceptions=True)
+
+    def snapshot(self) -> Dict[str, Any]:
+        last = self.last_recovery_s
+        return {
+            "engine_standby": self.standby_size,
+            "engine_standby_ready": self.standby_ready,
+            "engine_recoveries_standby": self.recoveries["standby"],
+            "engine_recoveries_cold": self.recoveries["cold"],
+            "engine_last_recovery_ms": None if last is None else 1000.0 * last,
+            "engine_last_recovery_mode": self.last_recovery_mode,
+        }
+
+
+class WorkerPool:
+    """
+    A pool of persistent engine workers.
+
+    ``size`` workers are started up front and kept alive by a periodic
+    health check. A session that finds no idle worker gets a new one, up to
+    ``max_size``; past that, sessions share the least-loaded worker and
+    their turns are serialized by the worker's lock.
+
+    The pool's supervisor replaces crashed engines and keeps ``standby``
+    warm spares, which also make growing the pool instant.
+    """
+
+    def __init__(
+        self,
+        backend: Optional[EngineBackend] = None,
+        size: int = POOL_SIZE,
+        max_size: int = POOL_MAX_SIZE,
+        health_check_interval: float = HEALTH_CHECK_INTERVAL_S,
+        standby: int = STANDBY_ENGINES,
+    ):
+        if size < 0 or max_size < 1 or size > max_size:
+            raise ValueError(f"invalid pool sizing: size={size}, max_size={max_size}")
+        self.backend = backend if backend is not None else create_backend()
+        self.size = size
+        self.max_size = max_size
+        self.health_check_interval = health_check_interval
+        self.workers: List[EngineWorker] = []
+        self._next_id = 0
+        self._lock = asyncio.Lock()
+        self._health_task: Optional[asyncio.Task] = None
+        self.supervisor = EngineSupervisor(self._new_worker, standby if self.backend.standby else 0)
+
+    @property
+    def ready(self) -> bool:
+        return any(w.ready for w in self.workers)
+
+    async def start(self) -> None:
+        """Start ``size`` workers concurrently and wait until they are warm."""
+        async with self._lock:
+            if self._health_task is None:
+                await self.backend.prepare()
+            missing = self.size - len(self.workers)
+            if missing > 0:
+                await asyncio.gather(*(self._spawn() for _ in range(missing)))
+            if self._health_task is None:
+                self._health_task = asyncio.create_task(self._health_loop())
+                self.supervisor.refill()
+
+    async def close(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        await self.supervisor.close()
+        async with self._lock:
+            workers, self.workers = self.workers, []
+        await asyncio.gather(*(w.stop() for w in workers), return_exceptions=True)
+        await self.backend.close()
+
+    def _new_worker(self) -> EngineWorker:
+        worker = self.backend.create_worker(self._next_id)
+        self._next_id += 1
+        worker.supervisor = self.supervisor
+        return worker
+
+    async def _spawn(self) -> EngineWorker:
+        worker = self._new_worker()
+        if not self.supervisor.take_standby(worker):
+            await worker.start()
+        self.workers.append(worker)
+        log.info("started %r", worker)
+        return worker
+
+    async def acquire(self, share: bool = True) -> Optional[EngineWorker]:
+        """
+        Take an idle worker, spawning one if the pool has room. When the pool
+        is full, return the least-loaded worker, or None if ``share`` is False.
+        """
+        if self._health_task is None:
+            await self.start()
+        async with self._lock:
+            idle = [w for w in self.workers if w.sessions == 0]
+            if idle:
+                worker = idle[0]
+            elif len(self.workers) < self.max_size:
+                worker = await self._spawn()
+            elif share:
+                worker = min(self.workers, key=lambda w: w.sessions)
+            else:
+                return None
+            worker.sessions += 1
+            return worker
+
+    def claim(self, worker: EngineWorker) -> None:
+        """Hold a worker the caller picked itself, e.g. one taken over from an evicted session."""
+        worker.sessions += 1
+
+    def release(self, worker: EngineWorker) -> None:
+        worker.sessions = max(0, worker.sessions - 1)
+
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[EngineWorker]:
+        """Hold a worker for the lifetime of one chat session."""
+        worker = await self.acquire()
+        try:
+            yield worker
+        finally:
+            self.release(worker)
+
+    async def health_check(self) -> None:
+        """Restart any worker whose engine has gone away and top up to ``size``."""
+        async with self._lock:
+            for worker in self.workers:
+                # A busy worker restarts itself at the start of its next turn.
+                if not worker.failed or worker.lock.locked():
+                    continue
+                log.warning("%r failed, restarting", worker)
+                async with worker.lock:
+                    await self.supervisor.replace(worker)
+            while len(self.workers) < self.size:
+                await self._spawn()
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            try:
+                await self.health_check()
+            except Exception:
+                log.exception("engine health check failed")
+
+
+_pool: Optional[WorkerPool] = None
+
+
+def get_pool() -> WorkerPool:
+    global _pool
+    if _pool is None:
+        _pool = WorkerPool()
+    return _pool
+
+
+async def send_and_stream(user_msg: str) -> AsyncGenerator[str, None]:
+    """One-off turn on any pooled worker (no session affinity)."""
+    async with get_pool().session() as worker:
+        stream = worker.send_and_stream(user_msg)
+        try:
+            async for text in stream:
+                yield text
+        finally:
+            await stream.aclose()
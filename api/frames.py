@@ -0,0 +1,317 @@
+# api/frames.py
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+END_OF_RESPONSE = "[[END_OF_RESPONSE]]"
+BUSY = "[[BUSY]]"
+STOP = "[[STOP]]"
+
+T = TypeVar("T")
+
+# Output frames are coalesced: at most one frame per COALESCE_WINDOW_MS
+# while tokens arrive faster than that, or sooner once COALESCE_MAX_BYTES
+# are waiting. A window of 0 sends every chunk as its own frame.
+COALESCE_WINDOW_S = float(os.getenv("ALSPEC_COALESCE_WINDOW_MS", "15")) / 1000.0
+COALESCE_MAX_BYTES = int(os.getenv("ALSPEC_COALESCE_MAX_BYTES", "1024"))
+
+# Messages a chat connection may have waiting behind the current turn;
+# further ones are turned away as busy, as an overfull admission queue does.
+INBOX_MESSAGES = int(os.getenv("ALSPEC_INBOX_MESSAGES", "16"))
+
+
+class FrameCoalescer:
+    """
+    Merges consecutive output chunks into fewer WebSocket frames.
+
+    A chunk that arrives at least ``window_s`` after the previous frame is
+    sent straight away, so the first token of a turn (and any token after a
+    pause) is never delayed. Chunks that arrive sooner are held until the
+    window since the previous frame has passed or ``max_bytes`` are waiting,
+    whichever comes first; ``close()`` sends whatever is left.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[str], Awaitable[None]],
+        window_s: float = COALESCE_WINDOW_S,
+        max_bytes: int = COALESCE_MAX_BYTES,
+    ):
+        self._send = send
+        self.window_s = window_s
+        self.max_bytes = max_bytes
+        self._parts: List[str] = []
+        self._size = 0
+        self._last_frame = float("-inf")
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timed_flush: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self.chunks = 0
+        self.frames = 0
+
+    async def push(self, text: str) -> None:
+        if not text:
+            return
+        loop = asyncio.get_running_loop()
+        self.chunks += 1
+        self._parts.append(text)
+        self._size += len(text.encode("utf-8"))
+        now = loop.time()
+        if self._size >= self.max_bytes or now - self._last_frame >= self.window_s:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self._last_frame + self.window_s - now, self._on_timer)
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        task = asyncio.ensure_future(self.flush())
+        # A failed send (client gone) resurfaces on the next push or close
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._timed_flush = task
+
+    async def flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        async with self._lock:
+            if not self._parts:
+                return
+            text = "".join(self._parts)
+            self._parts.clear()
+            self._size = 0
+            self._last_frame = asyncio.get_running_loop().time()
+            self.frames += 1
+            await self._send(text)
+
+    async def close(self) -> None:
+        await self.flush()
+        if self._timed_flush is not None:
+            task, self._timed_flush = self._timed_flush, None
+            await task
+
+    def discard(self) -> None:
+        """Drop anything still buffered, e.g. after the client went away."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._parts.clear()
+        self._size = 0
+
+
+class TextProtocol:
+    """
+    The original protocol: raw text frames, closed by END_OF_RESPONSE.
+    A rejected turn is a single "[[BUSY]] ..." frame before the sentinel.
+    The client sends "[[STOP]]" to cut the current reply short.
+    """
+
+    name = "text"
+
+    def __init__(self, ws: WebSocket):
+        self.ws = ws
+
+    def parse(self, message: str) -> str:
+        return message
+
+    def is_stop(self, message: str) -> bool:
+        return message == STOP
+
+    def deadline_ms(self, message: str) -> Optional[float]:
+        """The turn's own deadline, if the message carries one."""
+        return None
+
+    async def delta(self, text: str) -> None:
+        await self.ws.send_text(text)
+
+    async def busy(self, position: int, capacity: int) -> None:
+        await self.ws.send_text(
+            f"{BUSY} server busy: queue position {position} exceeds "
+            f"capacity {capacity}, please retry"
+        )
+
+    async def error(self, message: str) -> None:
+        await self.ws.send_text(message)
+
+    async def end(self, timing: Dict[str, Any]) -> None:
+        await self.ws.send_text(END_OF_RESPONSE)
+
+
+class JsonProtocol(TextProtocol):
+    """
+    Structured protocol, selected with ?protocol=json. Every frame is a
+    JSON object with a "type":
+
+      client -> server  {"type": "message", "text": "...", "deadline_ms": n}
+                        {"type": "stop"}
+      server -> client  {"type": "delta", "text": "..."}
+                        {"type": "busy", "position": n, "capacity": n}
+                        {"type": "error", "message": "..."}
+                        {"type": "end", "status": "ok" | "busy" | "error" | "stopped" | "expired",
+                         "turn": n, "queue_ms": .., "ttft_ms": .., "total_ms": ..,
+                         "chunks": n, "frames": n, "cached": bool,
+                         "engine": {...}, "context": {...}}
+
+    Every turn ends with exactly one "end" message. "engine" is only
+    present for backends that report per-turn figures, e.g. acceptance
+    rate and speedup for speculative decoding. "context" has the turn's
+    token counts (prompt_tokens, reply_tokens, context_tokens,
+    context_budget, turns_compacted, turns_dropped) on backends that keep
+    a token-budgeted history. "stop" cuts the current
+    reply short; its turn ends with status "stopped". "deadline_ms" is
+    optional; a turn that cannot start within it ends with "expired".
+    """
+
+    name = "json"
+
+    def is_stop(self, message: str) -> bool:
+        try:
+            data = json.loads(message)
+        except ValueError:
+            return False
+        return isinstance(data, dict) and data.get("type") == "stop"
+
+    def deadline_ms(self, message: str) -> Optional[float]:
+        value = json.loads(message).get("deadline_ms")
+        if value is None:
+            return None
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError('"deadline_ms" must be a number')
+        return float(value)
+
+    def parse(self, message: str) -> str:
+        try:
+            data = json.loads(message)
+        except ValueError:
+            raise ValueError("expected a JSON message") from None
+        if not isinstance(data, dict) or not isinstance(data.get("text"), str):
+            raise ValueError('expected {"type": "message", "text": "..."}')
+        return data["text"]
+
+    async def _send(self, **message: Any) -> None:
+        await self.ws.send_text(json.dumps(message))
+
+    async def delta(self, text: str) -> None:
+        await self._send(type="delta", text=text)
+
+    async def busy(self, position: int, capacity: int) -> None:
+        await self._send(type="busy", position=position, capacity=capacity)
+
+    async def error(self, message: str) -> None:
+        await self._send(type="error", message=message)
+
+    async def end(self, timing: Dict[str, Any]) -> None:
+        await self._send(type="end", **timing)
+
+
+class TurnCancelled(Exception):
+    """The client stopped the turn ("stop") or went away ("disconnect")."""
+
+    def __init__(self, reason: str):
+        super().__init__(f"turn cancelled ({reason})")
+        self.reason = reason
+
+
+class Inbox:
+    """
+    Reads a chat WebSocket in the background, so the client is heard while
+    a reply is streaming.
+
+    Messages wait in order for ``get()``, at most ``capacity`` of them; a
+    message that arrives when they are all taken is dropped. Only the turn
+    loop sends, so the drop is recorded against the last message waiting,
+    and ``take_rejected()`` hands it to the loop after that message's turn,
+    to be answered with "busy" and its own "end" in the order the client
+    sent them. A stop message, or the client
+    disconnecting, cancels the turn running under ``run()`` right away, and
+    the cancellation travels down through the worker's generator to the
+    engine.
+    """
+
+    def __init__(self, ws: WebSocket, proto: TextProtocol, capacity: int = INBOX_MESSAGES):
+        self.ws = ws
+        self.proto = proto
+        self.disconnected = False
+        self.rejected = 0
+        self.capacity = max(capacity, 1)
+        # Each entry is [message, messages dropped after it]
+        self._messages: "asyncio.Queue[Optional[list]]" = asyncio.Queue(maxsize=self.capacity)
+        self._last: Optional[list] = None
+        self._current: Optional[list] = None
+        self._turn: Optional[asyncio.Future] = None
+        self._reason: Optional[str] = None
+        self._reader: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._reader = asyncio.create_task(self._read())
+
+    async def close(self) -> None:
+        if self._reader is not None:
+            self._reader.cancel()
+            await asyncio.gather(self._reader, return_exceptions=True)
+
+    async def _read(self) -> None:
+        try:
+            while True:
+                message = await self.ws.receive_text()
+                if self.proto.is_stop(message):
+                    self._cancel("stop")
+                elif self._messages.full():
+                    self.rejected += 1
+                    self._last[1] += 1
+                else:
+                    self._last = [message, 0]
+                    self._messages.put_nowait(self._last)
+        except WebSocketDisconnect:
+            self.disconnected = True
+            self._cancel("disconnect")
+        finally:
+            # Nobody reads the replies any more; make room for the end marker
+            if self._messages.full():
+                self._messages.get_nowait()
+            self._messages.put_nowait(None)
+
+    def _cancel(self, reason: str) -> None:
+        if self._turn is not None and not self._turn.done():
+            self._reason = reason
+            self._turn.cancel()
+
+    async def get(self) -> Optional[str]:
+        """The next message from the client, or None once it has gone away."""
+        self._current = await self._messages.get()
+        return None if self._current is None else self._current[0]
+
+    def take_rejected(self) -> int:
+        """How many messages were dropped right after the one ``get()`` last returned."""
+        if self._current is None:
+            return 0
+        count, self._current[1] = self._current[1], 0
+        return count
+
+    async def run(self, turn: Awaitable[T]) -> T:
+        """Run ``turn`` as a task that the client can cancel, raising TurnCancelled if it does."""
+        self._reason = None
+        self._turn = asyncio.ensure_future(turn)
+        try:
+            return await self._turn
+        except asyncio.CancelledError:
+            if self._reason is None:
+                raise
+            raise TurnCancelled(self._reason) from None
+        finally:
+            self._turn = None
+
+
+PROTOCOLS = {p.name: p for p in (TextProtocol, JsonProtocol)}
+
+
+def select_protocol(ws: WebSocket) -> TextProtocol:
+    """Pick the protocol from the ?protocol= query parameter (default "text")."""
+    name = ws.query_params.get("protocol", "text")
+    if name not in PROTOCOLS:
+        raise ValueError(f"unknown protocol {name!r}, expected one of {sorted(PROTOCOLS)}")
+    return PROTOCOLS[name](ws)
@@ -0,0 +1,272 @@
+# api/gguf_catalog.py
+from __future__ import annotations
+
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from gguf import GGMLQuantizationType, GGUFValueType, LlamaFileType
+
+from api.engine import MODEL_PATH
+
+log = logging.getLogger(__name__)
+
+# Directory scanned for *.gguf files (server-core/model_storage by default)
+# and the on-disk cache of their parsed headers.
+MODEL_DIR = Path(os.getenv("ALSPEC_MODEL_DIR") or MODEL_PATH.parent)
+CATALOG_CACHE = Path(os.getenv("ALSPEC_MODEL_CATALOG_CACHE") or (
+    Path.home() / ".cache" / "alspec" / "gguf_catalog.json"
+))
+
+# Bump when the extracted fields change, so stale caches are re-read.
+CACHE_VERSION = 1
+
+GGUF_MAGIC = b"GGUF"
+
+_SCALARS = {
+    GGUFValueType.UINT8: "<B",
+    GGUFValueType.INT8: "<b",
+    GGUFValueType.UINT16: "<H",
+    GGUFValueType.INT16: "<h",
+    GGUFValueType.UINT32: "<I",
+    GGUFValueType.INT32: "<i",
+    GGUFValueType.FLOAT32: "<f",
+    GGUFValueType.BOOL: "<?",
+    GGUFValueType.UINT64: "<Q",
+    GGUFValueType.INT64: "<q",
+    GGUFValueType.FLOAT64: "<d",
+}
+_SIZES = {t: struct.calcsize(fmt) for t, fmt in _SCALARS.items()}
+
+
+class GGUFFormatError(ValueError):
+    """Raised for files that are not little-endian GGUF v2/v3."""
+
+
+class _HeaderParser:
+    """
+    Walks a GGUF header in a memory-mapped file.
+
+    Only the key/value section and tensor descriptors are touched. Arrays
+    (the tokenizer vocabulary can hold 100k+ entries) are skipped over and
+    only their length is kept, which is what makes this much faster than
+    gguf.GGUFReader, which materializes every element.
+    """
+
+    def __init__(self, buf: mmap.mmap):
+        self.buf = buf
+        self.pos = 0
+
+    def _unpack(self, fmt: str) -> Any:
+        value = struct.unpack_from(fmt, self.buf, self.pos)[0]
+        self.pos += struct.calcsize(fmt)
+        return value
+
+    def _string(self) -> str:
+        n = self._unpack("<Q")
+        raw = self.buf[self.pos:self.pos + n]
+        self.pos += n
+        return raw.decode("utf-8", errors="replace")
+
+    def _skip_string(self) -> None:
+        n = self._unpack("<Q")
+        self.pos += n
+
+    def _value(self, vtype: int) -> Any:
+        if vtype == GGUFValueType.STRING:
+            return self._string()
+        if vtype == GGUFValueType.ARRAY:
+            item_type = self._unpack("<I")
+            count = self._unpack("<Q")
+            self._skip_array(item_type, count)
+            return {"array_of": GGUFValueType(item_type).name, "length": count}
+        return self._unpack(_SCALARS[GGUFValueType(vtype)])
+
+    def _skip_array(self, item_type: int, count: int) -> None:
+        if item_type in _SIZES:
+            self.pos += _SIZES[item_type] * count
+        elif item_type == GGUFValueType.STRING:
+            for _ in range(count):
+                self._skip_string()
+        elif item_type == GGUFValueType.ARRAY:
+            for _ in range(count):
+                inner_type = self._unpack("<I")
+                inner_count = self._unpack("<Q")
+                self._skip_array(inner_type, inner_count)
+        else:
+            raise GGUFFormatError(f"unknown array item type {item_type}")
+
+    def parse(self) -> Tuple[int, Dict[str, Any], List[Tuple[str, List[int], int]]]:
+        if self.buf[:4] != GGUF_MAGIC:
+            raise GGUFFormatError("not a GGUF file")
+        self.pos = 4
+        version = self._unpack("<I")
+        if version not in (2, 3):
+            raise GGUFFormatError(f"unsupported GGUF version {version}")
+        tensor_count = self._unpack("<Q")
+        kv_count = self._unpack("<Q")
+
+        fields: Dict[str, Any] = {}
+        for _ in range(kv_count):
+            key = self._string()
+            fields[key] = self._value(self._unpack("<I"))
+
+        tensors = []
+        for _ in range(tensor_count):
+            name = self._string()
+            n_dims = self._unpack("<I")
+            dims = [self._unpack("<Q") for _ in range(n_dims)]
+            ggml_type = self._unpack("<I")
+            self.pos += 8  # data offset
+            tensors.append((name, dims, ggml_type))
+        return version, fields, tensors
+
+
+def _enum_name(enum, value: Any) -> Optional[str]:
+    try:
+        return enum(value).name
+    except (ValueError, TypeError):
+        return None
+
+
+def read_gguf_metadata(path: Path) -> Dict[str, Any]:
+    """Summary of one GGUF file's header; tensor data is never read."""
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        version, fields, tensors = _HeaderParser(buf).parse()
+
+    arch = fields.get("general.architecture", "")
+    parameters = 0
+    by_type: Dict[str, int] = {}
+    for _, dims, ggml_type in tensors:
+        n = 1
+        for d in dims:
+            n *= d
+        parameters += n
+        type_name = _enum_name(GGMLQuantizationType, ggml_type) or str(ggml_type)
+        by_type[type_name] = by_type.get(type_name, 0) + n
+
+    file_type = _enum_name(LlamaFileType, fields.get("general.file_type"))
+    if file_type is not None:
+        quantization = file_type.replace("MOSTLY_", "")
+    elif by_type:
+        quantization = max(by_type, key=by_type.get)
+    else:
+        quantization = None
+
+    tokens = fields.get("tokenizer.ggml.tokens")
+    return {
+        "gguf_version": version,
+        "architecture": arch or None,
+        "title": fields.get("general.name"),
+        "quantization": quantization,
+        "context_length": fields.get(f"{arch}.context_length"),
+        "embedding_length": fields.get(f"{arch}.embedding_length"),
+        "block_count": fields.get(f"{arch}.block_count"),
+        "head_count": fields.get(f"{arch}.attention.head_count"),
+        "vocab_size": tokens["length"] if isinstance(tokens, dict) else None,
+        "parameters": parameters,
+        "tensor_count": len(tensors),
+    }
+
+
+class ModelCatalog:
+    """
+    Metadata for every GGUF under ``model_dir``, cached on disk.
+
+    Cache entries are keyed by path and validated against the file's size
+    and mtime, so a rescan costs one stat per file and only new or changed
+    files have their headers parsed.
+    """
+
+    def __init__(self, model_dir: Path = MODEL_DIR, cache_path: Optional[Path] = CATALOG_CACHE):
+        self.model_dir = Path(model_dir)
+        self.cache_path = Path(cache_path) if cache_path else None
+        self._cache: Optional[Dict[str, Dict[str, Any]]] = None
+        self._lock = threading.Lock()
+        self.parsed = 0
+        self.cached = 0
+        self.files = 0
+        self.last_scan_s = 0.0
+
+    def _load_cache(self) -> Dict[str, Dict[str, Any]]:
+        if self._cache is None:
+            self._cache = {}
+            if self.cache_path is not None and self.cache_path.is_file():
+                try:
+                    data = json.loads(self.cache_path.read_text())
+                    if data.get("version") == CACHE_VERSION:
+                        self._cache = data.get("entries", {})
+                except (OSError, ValueError):
+                    log.warning("ignoring unreadable model catalog cache %s", self.cache_path)
+        return self._cache
+
+    def _save_cache(self) -> None:
+        if self.cache_path is None:
+            return
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.cache_path.parent, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump({"version": CACHE_VERSION, "entries": self._cache}, f)
+            os.replace(tmp, self.cache_path)
+        except OSError:
+            log.warning("could not write model catalog cache %s", self.cache_path, exc_info=True)
+
+    def scan(self) -> List[Dict[str, Any]]:
+        """Return one entry per GGUF file, sorted by name."""
+        with self._lock:
+            start = time.perf_counter()
+            cache = self._load_cache()
+            entries: Dict[str, Dict[str, Any]] = {}
+            changed = False
+            paths = sorted(self.model_dir.rglob("*.gguf")) if self.model_dir.is_dir() else []
+            for path in paths:
+                try:
+                    st = path.stat()
+                except OSError:
+                    continue
+                key = str(path.resolve())
+                entry = cache.get(key)
+                if entry is None or entry["size_bytes"] != st.st_size or entry["mtime_ns"] != st.st_mtime_ns:
+                    entry = {"size_bytes": st.st_size, "mtime_ns": st.st_mtime_ns}
+                    try:
+                        entry.update(read_gguf_metadata(path))
+                    except (GGUFFormatError, OSError, ValueError, struct.error) as e:
+                        entry["error"] = str(e)
+                    self.parsed += 1
+                    changed = True
+                else:
+                    self.cached += 1
+                entries[key] = entry
+
+            if changed or len(entries) != len(cache):
+                self._cache = entries
+                self._save_cache()
+
+            self.files = len(entries)
+            self.last_scan_s = time.perf_counter() - start
+            return [
+                {"name": Path(key).stem, "path": key, **entry}
+                for key, entry in sorted(entries.items(), key=lambda kv: Path(kv[0]).stem)
+            ]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "model_dir": str(self.model_dir),
+            "files": self.files,
+            "headers_parsed": self.parsed,
+            "cache_hits": self.cached,
+            "last_scan_ms": 1000.0 * self.last_scan_s,
+        }
+
+
+def catalog_metadata(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """The header fields of a scan() entry, without the cache bookkeeping."""
+    return {k: v for k, v in entry.items() if k not in ("name", "path", "size_bytes", "mtime_ns")}
@@ -0,0 +1,206 @@
+# api/jobs.py
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+from uuid import uuid4
+
+from api.metrics import EXPIRED_REQUESTS
+
+log = logging.getLogger(__name__)
+
+# At most JOB_STORE_CAPACITY jobs are tracked at once; finished jobs are
+# dropped JOB_TTL_S after they finish (or earlier, oldest first, when the
+# store is full). JOB_WORKERS jobs execute concurrently.
+JOB_STORE_CAPACITY = int(os.getenv("ALSPEC_JOB_STORE_CAPACITY", "10000"))
+JOB_TTL_S = float(os.getenv("ALSPEC_JOB_TTL_S", "300"))
+JOB_WORKERS = int(os.getenv("ALSPEC_JOB_WORKERS", "32"))
+
+FINISHED = ("succeeded", "failed", "expired")
+
+
+class JobStoreFull(Exception):
+    """Raised when every slot in the job store holds an unfinished job."""
+
+
+class JobExpired(Exception):
+    """Raised by a handler whose job's deadline passed before it could run."""
+
+
+@dataclass
+class Job:
+    model: str
+    input: Any
+    batch_size: int = 1
+    # Scheduling hints: a client id for fair sharing, a priority class and an
+    # optional deadline (time.monotonic()) after which the job is not run
+    client: str = ""
+    priority: str = "batch"
+    deadline: Optional[float] = None
+    job_id: str = field(default_factory=lambda: uuid4().hex[:12])
+    status: str = "queued"
+    result: Any = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.monotonic)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    done: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED
+
+    @property
+    def expired(self) -> bool:
+        return self.deadline is not None and time.monotonic() > self.deadline
+
+    def to_dict(self) -> Dict[str, Any]:
+        body: Dict[str, Any] = {"job_id": self.job_id, "status": self.status, "model": self.model}
+        if self.status == "succeeded":
+            body["result"] = self.result
+        if self.error is not None:
+            body["error"] = self.error
+        if self.started_at is not None:
+            body["queue_ms"] = 1000.0 * (self.started_at - self.created_at)
+        if self.finished_at is not None and self.started_at is not None:
+            body["run_ms"] = 1000.0 * (self.finished_at - self.started_at)
+        return body
+
+
+class JobStore:
+    """
+    Bounded, insertion-ordered store of jobs.
+
+    Finished jobs expire ``ttl_s`` after finishing. When the store is full,
+    the job that finished first is evicted to make room; if none has
+    finished yet, ``add`` raises ``JobStoreFull``. Finished jobs are kept
+    in a deque in the order they finished (see ``finish``), so expiry and
+    eviction only look at its left end.
+    """
+
+    def __init__(self, capacity: int = JOB_STORE_CAPACITY, ttl_s: float = JOB_TTL_S):
+        self.capacity = capacity
+        self.ttl_s = ttl_s
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._finished: "Deque[Job]" = deque()
+        self.evictions = 0
+        self.submitted = 0
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self.evict_expired()
+        return self._jobs.get(job_id)
+
+    def add(self, job: Job) -> None:
+        self.evict_expired()
+        if len(self._jobs) >= self.capacity:
+            if not self._finished:
+                raise JobStoreFull(f"job store full ({self.capacity} unfinished jobs)")
+            self._evict(self._finished.popleft())
+        self._jobs[job.job_id] = job
+        self.submitted += 1
+
+    def finish(self, job: Job) -> None:
+        """Mark ``job`` finished now; its status must already be final."""
+        job.finished_at = time.monotonic()
+        self._finished.append(job)
+
+    def evict_expired(self) -> int:
+        cutoff = time.monotonic() - self.ttl_s
+        expired = 0
+        while self._finished and self._finished[0].finished_at <= cutoff:
+            self._evict(self._finished.popleft())
+            expired += 1
+        return expired
+
+    def _evict(self, job: Job) -> None:
+        if self._jobs.pop(job.job_id, None) is not None:
+            self.evictions += 1
+
+    def snapshot(self) -> Dict[str, int]:
+        counts = {"queued": 0, "running": 0, "succeeded": 0, "failed": 0, "expired": 0}
+        for job in self._jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {
+            "jobs_total": self.submitted,
+            "jobs_stored": len(self._jobs),
+            "jobs_capacity": self.capacity,
+            "jobs_evicted": self.evictions,
+            **{f"jobs_{status}": n for status, n in counts.items()},
+        }
+
+
+class JobRunner:
+    """Executes submitted jobs on a fixed pool of worker tasks."""
+
+    def __init__(
+        self,
+        handler: Callable[[Job], Awaitable[Any]],
+        store: JobStore,
+        workers: int = JOB_WORKERS,
+    ):
+        self.handler = handler
+        self.store = store
+        self.workers = workers
+        self._queue: "asyncio.Queue[Job]" = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, job: Job) -> Job:
+        """Register and enqueue ``job``; raises ``JobStoreFull`` if it cannot be stored."""
+        self.store.add(job)
+        self._queue.put_nowait(job)
+        self.start()
+        return job
+
+    async def wait(self, job: Job, timeout: float) -> Job:
+        """Wait up to ``timeout`` seconds for ``job`` to finish."""
+        if not job.finished and timeout > 0:
+            try:
+                await asyncio.wait_for(job.done.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return job
+
+    async def _work(self) -> None:
+        while True:
+            job = await self._queue.get()
+            if job.expired:
+                # Never started: the deadline passed while the job was queued
+                EXPIRED_REQUESTS.labels(job.priority).inc()
+                job.error = "deadline passed before the job started"
+                job.status = "expired"
+                self.store.finish(job)
+                job.done.set()
+                continue
+            job.status = "running"
+            job.started_at = time.monotonic()
+            try:
+                job.result = await self.handler(job)
+                job.status = "succeeded"
+            except JobExpired as e:
+                job.error = str(e)
+                job.status = "expired"
+            except Exception as e:
+                log.exception("job %s failed", job.job_id)
+                job.error = str(e)
+                job.status = "failed"
+            finally:
+                self.store.finish(job)
+                job.done.set()
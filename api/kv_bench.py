@@ -0,0 +1,111 @@
+# api/kv_bench.py
+"""
+Resume latency of a saved session against a full re-prefill.
+
+Builds a conversation of ``--turns`` long turns on one llama-server slot
+and saves the slot's KV state to the KV store. Each round then empties the
+slot, as an eviction does, and resumes the conversation two ways, timed
+from the start of the resume to the first token of the next turn:
+
+  - restore: load the saved KV state and the history; only the new
+    message is prefilled
+  - re-prefill: the history alone; the server prefills all of it
+
+Needs a llama-server with --slot-save-path set to ALSPEC_KV_CACHE_DIR, or
+the stand-in:
+
+    ALSPEC_MOCK_SLOT_SAVE_PATH=~/.cache/alspec/kv uvicorn api.mock_llama_server:app --port 8080
+    python -m api.kv_bench --turns 10
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from typing import List, Tuple
+
+from api.kv_store import KVStore
+from api.llama_server import LlamaServerBackend, LlamaServerWorker
+
+SESSION_ID = "kv-bench"
+WORDS = "the lighthouse keeper wrote down every ship that passed in the night".split()
+
+
+def long_message(i: int, words: int) -> str:
+    return f"Turn {i}: " + " ".join(WORDS[(i + j) % len(WORDS)] for j in range(words))
+
+
+async def resume(worker: LlamaServerWorker, name: str, history: List[List[str]], restore: bool) -> Tuple[float, float]:
+    """Empty the slot, resume the conversation and run one turn; returns load time and time to first token."""
+    await worker._slot_action("erase")
+    await worker.reset()
+    start = time.perf_counter()
+    if restore and not await worker.load_state(name):
+        raise RuntimeError(f"could not restore {name}")
+    for user_msg, reply in history:
+        worker.remember(user_msg, reply)
+    loaded = time.perf_counter() - start
+    first = None
+    async for _ in worker.generate("And what happened next?"):
+        if first is None:
+            first = time.perf_counter() - start
+    return loaded, first if first is not None else time.perf_counter() - start
+
+
+async def main_async(args: argparse.Namespace) -> int:
+    store = KVStore()
+    store.ensure_directory()
+    backend = LlamaServerBackend(slots=1)
+    await backend.prepare()
+    worker = backend.create_worker(0)
+    name = store.state_name(SESSION_ID)
+    try:
+        await worker.start()
+        await worker.reset()
+        for i in range(args.turns):
+            async for _ in worker.generate(long_message(i, args.words)):
+                pass
+        history = worker.context.export()
+        tokens = worker.context.tokens
+        if not await worker.save_state(name):
+            print(f"ERROR: llama-server at {backend.base_url} could not save slot {worker.slot} "
+                  f"(is --slot-save-path set to {store.directory}?)")
+            return 1
+        size_mb = (store.directory / name).stat().st_size / (1024 * 1024)
+
+        loads: List[float] = []
+        restored: List[float] = []
+        reprefilled: List[float] = []
+        for _ in range(args.rounds):
+            load_s, ttft = await resume(worker, name, history, restore=True)
+            loads.append(load_s)
+            restored.append(ttft)
+            reprefilled.append((await resume(worker, name, history, restore=False))[1])
+    finally:
+        store.discard(SESSION_ID)
+        await worker.stop()
+        await backend.close()
+
+    restore_ms = 1000.0 * statistics.median(restored)
+    reprefill_ms = 1000.0 * statistics.median(reprefilled)
+    print("KV RESUME BENCH COMPLETED:")
+    print(f"  History: {len(history)} turns, ~{tokens} tokens; snapshot {size_mb:.1f} MB")
+    print(f"  Restore from disk: first token {restore_ms:.1f} ms (p50, load {1000.0 * statistics.median(loads):.1f} ms)")
+    print(f"  Full re-prefill:   first token {reprefill_ms:.1f} ms (p50)")
+    print(f"  Speedup: {reprefill_ms / restore_ms:.2f}x over {args.rounds} rounds")
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare resuming a saved session with re-prefilling its history")
+    parser.add_argument("--turns", type=int, default=10, help="turns in the conversation before it is saved")
+    parser.add_argument("--words", type=int, default=60, help="words per user message")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
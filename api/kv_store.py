@@ -0,0 +1,171 @@
+# api/kv_store.py
+"""
+On-disk KV state of conversations, so a session that was evicted from its
+engine resumes without prefilling its whole history again.
+
+A saved session is two files in KV_CACHE_DIR, named after a hash of the
+session id:
+
+  <key>.bin   the engine's KV state, written and read by the engine itself
+              (llama-server's slot save/restore, with --slot-save-path
+              pointing at the same directory)
+  <key>.json  the conversation history, which the worker needs to carry on
+
+The system prompt's state is shared by all sessions in one prefix file per
+model and system prompt (prefix-<hash>.bin, llama-cli's --prompt-cache).
+The directory is kept under KV_CACHE_MB by deleting the least recently
+used sessions; prefix files are never deleted. It is created on the first
+save, so a server with the KV cache disabled leaves nothing on disk.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from api.metrics import KV_STATE
+
+log = logging.getLogger(__name__)
+
+KV_CACHE_DIR = Path(os.getenv("ALSPEC_KV_CACHE_DIR") or (Path.home() / ".cache" / "alspec" / "kv"))
+
+# Disk budget for saved sessions. Opt-in, like the response cache: 0 (the
+# default) disables saving them and the shared prefix.
+KV_CACHE_MB = float(os.getenv("ALSPEC_KV_CACHE_MB", "0"))
+
+# Disconnected sessions are saved once they have been idle this long, so a
+# later eviction does not have to wait for the write.
+KV_SNAPSHOT_IDLE_S = float(os.getenv("ALSPEC_KV_SNAPSHOT_IDLE_S", "60"))
+
+PREFIX = "prefix-"
+
+
+def prefix_cache_path(model_path: Path, system_prompt: str) -> Optional[Path]:
+    """
+    The shared state file for ``system_prompt`` on ``model_path``, or None
+    when the KV cache is disabled. The name covers the model file's size
+    and mtime, so a replaced model does not load a stale prefix.
+    """
+    if KV_CACHE_MB <= 0:
+        return None
+    try:
+        stat = model_path.stat()
+        model = f"{model_path.resolve()}:{stat.st_size}:{stat.st_mtime_ns}"
+    except OSError:
+        model = str(model_path)
+    digest = hashlib.sha256(f"{model}\0{system_prompt}".encode("utf-8")).hexdigest()[:32]
+    return KV_CACHE_DIR / f"{PREFIX}{digest}.bin"
+
+
+class KVStore:
+    """Saved sessions in one directory, bounded in bytes with LRU eviction."""
+
+    def __init__(self, directory: Path = KV_CACHE_DIR, max_bytes: int = int(KV_CACHE_MB * 1024 * 1024)):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.saves = 0
+        self.restores = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def key(session_id: str) -> str:
+        # Session ids come from clients; the files are named after a hash
+        return hashlib.sha256(session_id.encode("utf-8")).hexdigest()[:32]
+
+    def ensure_directory(self) -> None:
+        """Create the directory; called before anything is written to it."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def state_name(self, session_id: str) -> str:
+        """File name (within the directory) the engine writes the session's KV state to."""
+        return f"{self.key(session_id)}.bin"
+
+    def _paths(self, session_id: str) -> Tuple[Path, Path]:
+        key = self.key(session_id)
+        return self.directory / f"{key}.bin", self.directory / f"{key}.json"
+
+    def save(self, session_id: str, history: Dict[str, Any]) -> None:
+        """Record the history that goes with the KV state the engine just wrote, then enforce the budget."""
+        _, meta = self._paths(session_id)
+        self.ensure_directory()
+        tmp = meta.with_suffix(".tmp")
+        tmp.write_text(json.dumps(history), encoding="utf-8")
+        os.replace(tmp, meta)
+        self.saves += 1
+        self.enforce_budget()
+
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """The saved history of ``session_id``, if both of its files are still there."""
+        state, meta = self._paths(session_id)
+        if not self.enabled or not state.is_file() or not meta.is_file():
+            return None
+        try:
+            history = json.loads(meta.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            log.warning("unreadable KV snapshot %s: %s", meta, e)
+            self.discard(session_id)
+            return None
+        # Most recently used: evicted last
+        for path in (state, meta):
+            os.utime(path)
+        self.restores += 1
+        return history
+
+    def discard(self, session_id: str) -> None:
+        for path in self._paths(session_id):
+            path.unlink(missing_ok=True)
+
+    def _scan(self) -> Tuple[int, List[Tuple[float, int, List[Path]]]]:
+        """Total bytes in the directory, and the saved sessions as (last used, bytes, files)."""
+        total = 0
+        sessions: Dict[str, Tuple[float, int, List[Path]]] = {}
+        if not self.directory.is_dir():
+            return total, []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+                total += stat.st_size
+                if entry.name.startswith(PREFIX):
+                    continue
+                key = entry.name.split(".", 1)[0]
+                used, size, paths = sessions.get(key, (0.0, 0, []))
+                sessions[key] = (max(used, stat.st_mtime), size + stat.st_size, paths + [Path(entry.path)])
+        return total, sorted(sessions.values(), key=lambda s: s[0])
+
+    def enforce_budget(self) -> int:
+        """Delete least recently used sessions until the directory fits in ``max_bytes``."""
+        total, sessions = self._scan()
+        evicted = 0
+        for _, size, paths in sessions:
+            if total <= self.max_bytes:
+                break
+            for path in paths:
+                path.unlink(missing_ok=True)
+            total -= size
+            evicted += 1
+        if evicted:
+            self.evictions += evicted
+            KV_STATE.labels("evicted").inc(evicted)
+            log.info("KV cache over %d MB: evicted %d saved sessions", self.max_bytes // (1024 * 1024), evicted)
+        return evicted
+
+    def snapshot(self) -> Dict[str, Any]:
+        total, sessions = self._scan() if self.enabled else (0, [])
+        return {
+            "kv_cache_enabled": self.enabled,
+            "kv_cache_bytes": total,
+            "kv_cache_max_bytes": self.max_bytes,
+            "kv_cache_sessions": len(sessions),
+            "kv_cache_saves": self.saves,
+            "kv_cache_restores": self.restores,
+            "kv_cache_evictions": self.evictions,
+        }
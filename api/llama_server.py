@@ -0,0 +1,242 @@
+# api/llama_server.py
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+from pathlib import Path
+from typing import AsyncGenerator, Dict, List, Optional
+
+import httpx
+
+from api.context import ContextWindow, Tokenizer, get_tokenizer
+from api.engine import (
+    MAX_TOKENS,
+    START_TIMEOUT_S,
+    SYSTEM_PROMPT,
+    WARMUP_PROMPT,
+    EngineBackend,
+    EngineCrashed,
+    EngineWorker,
+)
+from api.metrics import ENGINE_RESTARTS, turn_cancelled
+
+log = logging.getLogger(__name__)
+
+# A long-lived llama.cpp `llama-server`, e.g.
+#   llama-server -m <model> --parallel 4 --port 8080
+# or the stand-in: uvicorn api.mock_llama_server:app --port 8080
+LLAMA_SERVER_URL = os.getenv("ALSPEC_LLAMA_SERVER_URL", "http://127.0.0.1:8080")
+LLAMA_SERVER_MODEL = os.getenv("ALSPEC_LLAMA_SERVER_MODEL", "")
+
+# Number of server slots (--parallel). When set, worker N is pinned to slot
+# N % LLAMA_SERVER_SLOTS so its conversation stays in one slot's KV cache,
+# which can then be saved to disk and restored (start the server with
+# --slot-save-path set to ALSPEC_KV_CACHE_DIR).
+LLAMA_SERVER_SLOTS = int(os.getenv("ALSPEC_LLAMA_SERVER_SLOTS", "0"))
+
+# Keep-alive connection pool shared by all workers.
+HTTP_MAX_CONNECTIONS = int(os.getenv("ALSPEC_HTTP_MAX_CONNECTIONS", "32"))
+HTTP_KEEPALIVE_S = float(os.getenv("ALSPEC_HTTP_KEEPALIVE_S", "60"))
+HTTP_READ_TIMEOUT_S = float(os.getenv("ALSPEC_HTTP_READ_TIMEOUT_S", "120"))
+
+
+class LlamaServerBackend(EngineBackend):
+    """
+    Talks to llama-server over one pooled, keep-alive ``httpx.AsyncClient``.
+
+    Turns are streamed from the OpenAI-compatible /v1/chat/completions
+    endpoint, so no connection setup happens on the hot path once the pool
+    is warm.
+    """
+
+    name = "llama-server"
+
+    def __init__(
+        self,
+        base_url: str = LLAMA_SERVER_URL,
+        max_connections: int = HTTP_MAX_CONNECTIONS,
+        keepalive_expiry: float = HTTP_KEEPALIVE_S,
+        slots: int = LLAMA_SERVER_SLOTS,
+    ):
+        self.base_url = base_url
+        self.model = LLAMA_SERVER_MODEL or base_url
+        self.slots = slots
+        # Context tokens are estimated until prepare() has loaded the tokenizer
+        self.tokenizer: Tokenizer = Tokenizer()
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                # keepalive_expiry=0 disables reuse (a new connection per turn).
+                max_keepalive_connections=max_connections if keepalive_expiry > 0 else 0,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(HTTP_READ_TIMEOUT_S, connect=5.0),
+        )
+
+    async def prepare(self) -> None:
+        # ALSPEC_TOKENIZER_PATH wins; otherwise the tokenizer of the model the
+        # server reports, when that file is on this machine
+        self.tokenizer = await asyncio.to_thread(get_tokenizer, await self.served_model_path())
+
+    async def served_model_path(self) -> Optional[Path]:
+        """The model file llama-server was started with, from its /props."""
+        try:
+            resp = await self.client.get("/props")
+            resp.raise_for_status()
+            path = resp.json().get("model_path")
+        except (httpx.HTTPError, ValueError) as e:
+            log.warning("could not ask %s for its model: %s", self.base_url, e)
+            return None
+        return Path(path) if path else None
+
+    def create_worker(self, worker_id: int) -> EngineWorker:
+        slot = worker_id % self.slots if self.slots > 0 else None
+        return LlamaServerWorker(worker_id, self, slot)
+
+    async def healthy(self) -> bool:
+        try:
+            resp = await self.client.get("/health")
+        except httpx.HTTPError:
+            return False
+        return resp.status_code == 200
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+class LlamaServerWorker(EngineWorker):
+    """
+    One conversation on a llama-server.
+
+    The server is stateless between requests, so the worker keeps the message
+    history itself and resends it each turn; with ``cache_prompt`` and a
+    pinned slot the server only prefills the new tokens. The history is
+    held to the context budget by compacting and dropping old turns.
+    """
+
+    def __init__(self, worker_id: int, backend: LlamaServerBackend, slot: Optional[int] = None):
+        super().__init__(worker_id)
+        self.backend = backend
+        self.slot = slot
+        self.context = ContextWindow(SYSTEM_PROMPT, backend.tokenizer, backend.name, reserve=MAX_TOKENS)
+        self._started = False
+        self._failed = False
+
+    def __repr__(self) -> str:
+        return (
+            f"<LlamaServerWorker id={self.worker_id} slot={self.slot} "
+            f"url={self.backend.base_url} sessions={self.sessions}>"
+        )
+
+    @property
+    def failed(self) -> bool:
+        return self._started and self._failed
+
+    def is_alive(self) -> bool:
+        return self._started and not self._failed
+
+    async def start(self) -> None:
+        if self.is_alive():
+            return
+        if self.failed:
+            ENGINE_RESTARTS.labels("cold").inc()
+        self._started = True
+        self._failed = False
+        self._ready = False
+        await asyncio.wait_for(self._wait_until_ready(), timeout=START_TIMEOUT_S)
+        self._ready = True
+
+    async def _wait_until_ready(self) -> None:
+        # /health answers 503 while the model is still loading.
+        while not await self.backend.healthy():
+            await asyncio.sleep(0.25)
+        if WARMUP_PROMPT:
+            async for _ in self._stream(self.context.messages(WARMUP_PROMPT)):
+                pass
+
+    async def stop(self) -> None:
+        self._started = False
+        self._ready = False
+
+    def remember(self, user_msg: str, reply: str) -> None:
+        self.context.add(user_msg, reply)
+
+    async def reset(self) -> None:
+        self.context.clear()
+
+    @property
+    def can_save_state(self) -> bool:
+        return self.slot is not None
+
+    async def save_state(self, name: str) -> bool:
+        return await self._slot_action("save", name)
+
+    async def load_state(self, name: str) -> bool:
+        return await self._slot_action("restore", name)
+
+    async def _slot_action(self, action: str, filename: Optional[str] = None) -> bool:
+        """POST /slots/{id}?action=save|restore|erase on this worker's slot."""
+        if self.slot is None:
+            return False
+        body = {"filename": filename} if filename is not None else {}
+        try:
+            resp = await self.backend.client.post(f"/slots/{self.slot}", params={"action": action}, json=body)
+        except httpx.HTTPError as e:
+            log.warning("%r: slot %s failed: %s", self, action, e)
+            return False
+        if resp.status_code != 200:
+            log.warning("%r: slot %s failed: %s %s", self, action, resp.status_code, resp.text[:200])
+            return False
+        return True
+
+    async def generate(self, user_msg: str) -> AsyncGenerator[str, None]:
+        await self.start()
+        self.context.fit(user_msg)
+        reply: List[str] = []
+        stream = self._stream(self.context.messages(user_msg))
+        try:
+            async for text in stream:
+                reply.append(text)
+                yield text
+        except httpx.HTTPError as e:
+            # Reported like a llama-cli crash; the next turn reconnects
+            self._failed = True
+            raise EngineCrashed(f"llama-server at {self.backend.base_url} failed mid-turn: {e}") from e
+        except (asyncio.CancelledError, GeneratorExit):
+            # Keep the partial reply, as llama-cli does
+            turn_cancelled(self.backend.name, self.context.tokenizer.count("".join(reply)), MAX_TOKENS)
+            self.context.record(user_msg, "".join(reply))
+            raise
+        finally:
+            # Closing the stream drops its connection, and llama-server
+            # stops generating for a client that went away.
+            await stream.aclose()
+        self.context.record(user_msg, "".join(reply))
+
+    async def _stream(self, messages: List[Dict[str, str]]) -> AsyncGenerator[str, None]:
+        payload = {
+            "messages": messages,
+            "stream": True,
+            "max_tokens": MAX_TOKENS,
+            "cache_prompt": True,
+        }
+        if self.slot is not None:
+            payload["id_slot"] = self.slot
+
+        async with self.backend.client.stream("POST", "/v1/chat/completions", json=payload) as resp:
+            resp.raise_for_status()
+            async for line in resp.aiter_lines():
+                # Server-sent events: "data: {...}" per token, "data: [DONE]" at the end.
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                event = json.loads(data)
+                choices = event.get("choices") or [{}]
+                text = (choices[0].get("delta") or {}).get("content")
+                if text:
+                    yield text
@@ -0,0 +1,251 @@
+# api/metrics.py
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from fastapi import Response
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# Shared by api/server.py and api/mock_server.py. Each server process has
+# its own copy; /metrics exposes it for Prometheus and /system/stats
+# summarizes the same series with stats_snapshot().
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+CONTEXT_BUCKETS = (256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072)
+TOKEN_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+QUEUE_WAIT = Histogram(
+    "alspec_queue_wait_seconds", "Time a turn waited before generation started",
+    ["endpoint"], buckets=LATENCY_BUCKETS,
+)
+TTFT = Histogram(
+    "alspec_time_to_first_token_seconds", "Time from request arrival to the first output token",
+    ["endpoint"], buckets=LATENCY_BUCKETS,
+)
+TOKEN_LATENCY = Histogram(
+    "alspec_token_latency_seconds", "Time between consecutive output tokens (decode)",
+    ["endpoint"], buckets=TOKEN_BUCKETS,
+)
+TURN_TIME = Histogram(
+    "alspec_turn_seconds", "Total time per turn, from arrival to the last token",
+    ["endpoint"], buckets=LATENCY_BUCKETS,
+)
+REQUESTS = Counter("alspec_requests", "Finished turns by outcome", ["endpoint", "outcome"])
+TOKENS = Counter("alspec_tokens_generated", "Output tokens (stream chunks) generated", ["endpoint"])
+SPEC_DRAFT_TOKENS = Counter(
+    "alspec_speculative_draft_tokens", "Draft tokens proposed in speculative decoding, by outcome", ["outcome"]
+)
+ENGINE_RESTARTS = Counter(
+    "alspec_engine_restarts", "Engine workers restarted after they failed, by how", ["mode"]
+)
+ENGINE_RECOVERY = Histogram(
+    "alspec_engine_recovery_seconds", "Time from an engine exit until its worker could serve again",
+    ["mode"], buckets=LATENCY_BUCKETS + (120.0, 300.0),
+)
+EXPIRED_REQUESTS = Counter(
+    "alspec_expired_requests", "Requests dropped because their deadline passed before they started, by priority",
+    ["priority"],
+)
+CANCELLED_TURNS = Counter(
+    "alspec_cancelled_turns", "Turns cut short by the client, by reason (stop|disconnect)", ["endpoint", "reason"]
+)
+TOKENS_SAVED = Counter(
+    "alspec_tokens_saved",
+    "Output tokens left ungenerated because a turn was cancelled (the rest of its token budget, an upper bound)",
+    ["backend"],
+)
+TOKENS_DISCARDED = Counter(
+    "alspec_tokens_discarded", "Output chunks an engine produced after its turn was cancelled", ["backend"]
+)
+CANCEL_LATENCY = Histogram(
+    "alspec_cancel_seconds", "Time from cancelling a turn until its engine was idle again",
+    ["backend"], buckets=LATENCY_BUCKETS,
+)
+CONTEXT_TOKENS = Histogram(
+    "alspec_context_tokens", "Tokens in a conversation's context window after each turn",
+    ["backend"], buckets=CONTEXT_BUCKETS,
+)
+CONTEXT_TRIMMED = Counter(
+    "alspec_context_trimmed_turns", "Old turns compacted or dropped to keep conversations in their token budget",
+    ["backend", "action"],
+)
+KV_STATE = Counter(
+    "alspec_kv_state", "Session KV snapshots on disk by operation (saved|save_failed|restored|restore_failed|evicted)",
+    ["op"],
+)
+KV_RESUME = Histogram(
+    "alspec_kv_resume_seconds", "Time to bring an evicted session back onto a worker, by how (kv|history)",
+    ["mode"], buckets=LATENCY_BUCKETS,
+)
+ACTIVE_SESSIONS = Gauge("alspec_active_sessions", "Sessions or streams with a connected client")
+ENGINE_WORKERS = Gauge("alspec_engine_workers", "Engine workers by state", ["state"])
+
+START_TIME = time.time()
+
+
+class TurnTimer:
+    """
+    Records one turn into the histograms above.
+
+    Call ``admitted()`` once the turn may start generating, ``token()`` for
+    every output chunk, and ``finish()`` at the end; used as a context
+    manager, a turn that raises is recorded with outcome "error", or
+    "cancelled" if it was cancelled or its client went away. The turn time
+    is observed for every outcome except those, "rejected" and "expired".
+    """
+
+    def __init__(self, endpoint: str, started_at: Optional[float] = None):
+        self.endpoint = endpoint
+        self.started_at = time.monotonic() if started_at is None else started_at
+        self.tokens = 0
+        self.queue_wait_s: Optional[float] = None
+        self.ttft_s: Optional[float] = None
+        self._last_token: Optional[float] = None
+        self._finished = False
+
+    @property
+    def elapsed_s(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def __enter__(self) -> "TurnTimer":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.finish("ok")
+        elif issubclass(exc_type, (asyncio.CancelledError, GeneratorExit)):
+            self.finish("cancelled")
+        else:
+            self.finish("error")
+
+    def admitted(self, queue_wait_s: Optional[float] = None) -> None:
+        if queue_wait_s is None:
+            queue_wait_s = time.monotonic() - self.started_at
+        self.queue_wait_s = queue_wait_s
+        QUEUE_WAIT.labels(self.endpoint).observe(queue_wait_s)
+
+    def token(self) -> None:
+        now = time.monotonic()
+        if self._last_token is None:
+            self.ttft_s = now - self.started_at
+            TTFT.labels(self.endpoint).observe(self.ttft_s)
+        else:
+            TOKEN_LATENCY.labels(self.endpoint).observe(now - self._last_token)
+        self._last_token = now
+        self.tokens += 1
+        TOKENS.labels(self.endpoint).inc()
+
+    def finish(self, outcome: str = "ok") -> None:
+        if self._finished:
+            return
+        self._finished = True
+        if outcome not in ("error", "cancelled", "rejected", "expired"):
+            TURN_TIME.labels(self.endpoint).observe(time.monotonic() - self.started_at)
+        REQUESTS.labels(self.endpoint, outcome).inc()
+
+
+def turn_cancelled(backend: str, generated: int, budget: int) -> None:
+    """Count the compute a cancelled turn saved: what was left of its ``budget`` after ``generated`` tokens."""
+    TOKENS_SAVED.labels(backend).inc(max(0, budget - generated))
+
+
+def metrics_response() -> Response:
+    """The /metrics endpoint body in Prometheus text format."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+def _total(metric, suffix: str = "_total", **match: str) -> float:
+    return sum(
+        s.value
+        for m in metric.collect()
+        for s in m.samples
+        if s.name.endswith(suffix) and all(s.labels.get(k) == v for k, v in match.items())
+    )
+
+
+def _histogram(metric: Histogram) -> Tuple[float, float, Dict[float, float]]:
+    """Sum, count and cumulative bucket counts, merged across label sets."""
+    total = count = 0.0
+    buckets: Dict[float, float] = {}
+    for m in metric.collect():
+        for s in m.samples:
+            if s.name.endswith("_sum"):
+                total += s.value
+            elif s.name.endswith("_count"):
+                count += s.value
+            elif s.name.endswith("_bucket"):
+                le = float(s.labels["le"])
+                buckets[le] = buckets.get(le, 0.0) + s.value
+    return total, count, buckets
+
+
+def histogram_quantile(q: float, buckets: Dict[float, float]) -> Optional[float]:
+    """Estimate a quantile from cumulative buckets, as PromQL's histogram_quantile does."""
+    bounds = sorted(buckets)
+    if not bounds or buckets[bounds[-1]] == 0:
+        return None
+    rank = q * buckets[bounds[-1]]
+    lower, below = 0.0, 0.0
+    for le in bounds:
+        if buckets[le] >= rank:
+            if le == float("inf"):
+                return lower
+            in_bucket = buckets[le] - below
+            return lower + (le - lower) * ((rank - below) / in_bucket if in_bucket else 0.0)
+        lower, below = le, buckets[le]
+    return lower
+
+
+def _summary(name: str, metric: Histogram, quantiles: Iterable[float] = (0.5, 0.95, 0.99)) -> Dict[str, Optional[float]]:
+    total, count, buckets = _histogram(metric)
+    out: Dict[str, Optional[float]] = {f"{name}_ms_avg": 1000.0 * total / count if count else None}
+    for q in quantiles:
+        value = histogram_quantile(q, buckets)
+        out[f"{name}_ms_p{int(q * 100)}"] = 1000.0 * value if value is not None else None
+    return out
+
+
+def stats_snapshot() -> Dict[str, object]:
+    """Summary of the metrics above for /system/stats and the CLI."""
+    turn_total, turns, _ = _histogram(TURN_TIME)
+    stats: Dict[str, object] = {
+        "uptime_s": time.time() - START_TIME,
+        "total_inferences": _total(REQUESTS),
+        "failed_inferences": _total(REQUESTS, outcome="error"),
+        "rejected_inferences": _total(REQUESTS, outcome="rejected"),
+        "expired_inferences": _total(EXPIRED_REQUESTS),
+        "avg_latency": 1000.0 * turn_total / turns if turns else None,
+        "tokens_generated": _total(TOKENS),
+        "cancelled_inferences": _total(REQUESTS, outcome="cancelled"),
+        "cancelled_by_stop": _total(CANCELLED_TURNS, reason="stop"),
+        "cancelled_by_disconnect": _total(CANCELLED_TURNS, reason="disconnect"),
+        "tokens_saved": _total(TOKENS_SAVED),
+        "tokens_discarded": _total(TOKENS_DISCARDED),
+        "context_turns_compacted": _total(CONTEXT_TRIMMED, action="compacted"),
+        "context_turns_dropped": _total(CONTEXT_TRIMMED, action="dropped"),
+        "kv_sessions_saved": _total(KV_STATE, op="saved"),
+        "kv_sessions_restored": _total(KV_STATE, op="restored"),
+        "kv_sessions_evicted": _total(KV_STATE, op="evicted"),
+        "engine_restarts": _total(ENGINE_RESTARTS),
+        "engine_restarts_standby": _total(ENGINE_RESTARTS, mode="standby"),
+        "active_sessions": _total(ACTIVE_SESSIONS, suffix="sessions"),
+        "engine_workers_by_state": {
+            s.labels["state"]: s.value for m in ENGINE_WORKERS.collect() for s in m.samples
+        },
+    }
+    proposed = _total(SPEC_DRAFT_TOKENS)
+    if proposed:
+        stats["draft_acceptance_rate"] = _total(SPEC_DRAFT_TOKENS, outcome="accepted") / proposed
+    stats.update(_summary("turn", TURN_TIME))
+    stats.update(_summary("ttft", TTFT))
+    stats.update(_summary("queue_wait", QUEUE_WAIT))
+    stats.update(_summary("token_latency", TOKEN_LATENCY))
+    stats.update(_summary("engine_recovery", ENGINE_RECOVERY))
+    stats.update(_summary("cancel", CANCEL_LATENCY))
+    stats.update(_summary("kv_resume", KV_RESUME))
+    context_total, context_turns, context_buckets = _histogram(CONTEXT_TOKENS)
+    stats["context_tokens_avg"] = context_total / context_turns if context_turns else None
+    stats["context_tokens_p95"] = histogram_quantile(0.95, context_buckets)
+    return stats
@@ -2,8 +2,13 @@
 from __future__ import annotations
 
 import asyncio
+import time
+from uuid import uuid4
+
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 
+from api.frames import FrameCoalescer, select_protocol
+
 app = FastAPI(title="ALSpec Mock Chat Server")
 
 
@@ -13,21 +18,53 @@ async def ws_chat(ws: WebSocket):
     Very simple mock server for local testing.
 
     - Echoes the user text back with a prefix
-    - Streams word by word
-    - Uses the same [[END_OF_RESPONSE]] sentinel
+    - Streams word by word, through the same frame coalescer as the server
+    - Uses the same [[END_OF_RESPONSE]] sentinel, or the structured
+      protocol with ?protocol=json
+    - Echoes ?session_id= (or a new id) in the x-session-id header
     """
-    await ws.accept()
+    try:
+        proto = select_protocol(ws)
+    except ValueError:
+        await ws.close(code=1008)
+        return
+
+    session_id = ws.query_params.get("session_id") or uuid4().hex
+    await ws.accept(headers=[(b"x-session-id", session_id.encode())])
+    turn = 0
     try:
         while True:
-            prompt = await ws.receive_text()
+            message = await ws.receive_text()
+            turn += 1
+            start = time.monotonic()
+            try:
+                prompt = proto.parse(message)
+            except ValueError as e:
+                await proto.error(str(e))
+                await proto.end({"status": "error", "turn": turn})
+                continue
             reply = f"[MOCK] You said: {prompt}"
 
             # stream word-by-word to exercise the CLI streaming logic
+            frames = FrameCoalescer(proto.delta)
+            ttft = None
             for word in reply.split():
-                await ws.send_text(word + " ")
+                if ttft is None:
+                    ttft = time.monotonic() - start
+                await frames.push(word + " ")
                 await asyncio.sleep(0.02)
+            await frames.close()
 
-            await ws.send_text("[[END_OF_RESPONSE]]")
+            await proto.end({
+                "status": "ok",
+                "turn": turn,
+                "queue_ms": 0.0,
+                "ttft_ms": 1000.0 * (ttft or 0.0),
+                "total_ms": 1000.0 * (time.monotonic() - start),
+                "chunks": frames.chunks,
+                "frames": frames.frames,
+                "cached": False,
+            })
 
     except WebSocketDisconnect:
         return
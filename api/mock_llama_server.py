@@ -0,0 +1,151 @@
+# api/mock_llama_server.py
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, List
+from uuid import uuid4
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI(title="Mock llama-server")
+
+# Simulated model-load time (health answers 503 until it has passed),
+# per-token decode delay and per-token prefill delay for prompt tokens a
+# slot does not have cached.
+LOAD_S = float(os.getenv("ALSPEC_MOCK_LOAD_S", "0"))
+TOKEN_DELAY_S = float(os.getenv("ALSPEC_MOCK_TOKEN_DELAY_S", "0.01"))
+PREFILL_S_PER_TOKEN = float(os.getenv("ALSPEC_MOCK_PREFILL_S_PER_TOKEN", "0.0002"))
+
+# Like --slot-save-path: enables POST /slots/{id}?action=save|restore.
+# Saved files are padded to KV_BYTES_PER_TOKEN per cached token.
+SLOT_SAVE_PATH = os.getenv("ALSPEC_MOCK_SLOT_SAVE_PATH", "")
+KV_BYTES_PER_TOKEN = int(os.getenv("ALSPEC_MOCK_KV_BYTES_PER_TOKEN", "4096"))
+
+# Reported as "model_path" by GET /props, like -m
+MODEL_PATH = os.getenv("ALSPEC_MOCK_MODEL_PATH", "")
+
+# One "token" per 4 characters of the rendered prompt
+CHARS_PER_TOKEN = 4
+
+STARTED_AT = time.monotonic()
+
+# Rendered prompt + reply cached in each slot (its KV cache)
+slots: Dict[int, str] = {}
+
+
+def mock_reply(messages) -> list:
+    prompt = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+    return [word + " " for word in f"[MOCK] You said: {prompt}".split()]
+
+
+def render(messages: List[Dict[str, str]]) -> str:
+    return "".join(f"<|{m['role']}|>{m['content']}" for m in messages) + "<|assistant|>"
+
+
+def prefill_tokens(slot: int, prompt: str, cache_prompt: bool) -> int:
+    """Prompt tokens the slot has to process: those after its cached prefix."""
+    cached = slots.get(slot, "") if cache_prompt and slot >= 0 else ""
+    common = len(os.path.commonprefix([cached, prompt]))
+    return (len(prompt) - common) // CHARS_PER_TOKEN
+
+
+@app.get("/health")
+def health():
+    if time.monotonic() - STARTED_AT < LOAD_S:
+        return JSONResponse(status_code=503, content={"error": {"message": "Loading model"}})
+    return {"status": "ok"}
+
+
+@app.get("/props")
+def props():
+    return {"model_path": MODEL_PATH, "total_slots": len(slots)}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    """
+    Stand-in for llama.cpp's llama-server, for testing and benchmarking the
+    llama-server engine backend without a GPU.
+
+    - Echoes the last user message back with a prefix
+    - Waits PREFILL_S_PER_TOKEN for every prompt token not cached in the
+      request's slot (id_slot, with cache_prompt)
+    - Streams word by word as OpenAI chat-completion chunks (SSE)
+    """
+    body = await request.json()
+    messages = body.get("messages", [])
+    tokens = mock_reply(messages)[: body.get("max_tokens", 256)]
+    completion_id = f"chatcmpl-{uuid4().hex[:12]}"
+    slot = int(body.get("id_slot", -1))
+    prompt = render(messages)
+    await asyncio.sleep(PREFILL_S_PER_TOKEN * prefill_tokens(slot, prompt, body.get("cache_prompt", False)))
+    if slot >= 0:
+        slots[slot] = prompt + "".join(tokens)
+
+    if not body.get("stream"):
+        await asyncio.sleep(TOKEN_DELAY_S * len(tokens))
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(tokens)},
+                "finish_reason": "stop",
+            }],
+        }
+
+    async def events():
+        for token in tokens:
+            await asyncio.sleep(TOKEN_DELAY_S)
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+        done = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+        }
+        yield f"data: {json.dumps(done)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.post("/slots/{slot_id}")
+async def slot_action(slot_id: int, action: str, request: Request):
+    """llama-server's slot save/restore/erase, with the slot cache as the KV state."""
+    if action == "erase":
+        n_erased = len(slots.pop(slot_id, "")) // CHARS_PER_TOKEN
+        return {"id_slot": slot_id, "n_erased": n_erased}
+    if action not in ("save", "restore"):
+        return JSONResponse(status_code=400, content={"error": {"message": f"invalid action {action!r}"}})
+    if not SLOT_SAVE_PATH:
+        return JSONResponse(status_code=501, content={"error": {"message": "This server does not support slots action."}})
+    filename = (await request.json()).get("filename", "")
+    if not filename or "/" in filename or filename.startswith("."):
+        return JSONResponse(status_code=400, content={"error": {"message": "Invalid filename"}})
+    path = Path(SLOT_SAVE_PATH) / filename
+    start = time.perf_counter()
+    if action == "save":
+        cached = slots.get(slot_id, "")
+        n_tokens = len(cached) // CHARS_PER_TOKEN
+        data = json.dumps({"cache": cached}).encode("utf-8")
+        data += b"\0" * max(0, n_tokens * KV_BYTES_PER_TOKEN - len(data))
+        path.write_bytes(data)
+        return {"id_slot": slot_id, "filename": filename, "n_saved": n_tokens, "n_written": len(data),
+                "timings": {"save_ms": 1000.0 * (time.perf_counter() - start)}}
+    if not path.is_file():
+        return JSONResponse(status_code=400, content={"error": {"message": "Failed to restore slot"}})
+    data = path.read_bytes()
+    cached = json.loads(data.rstrip(b"\0"))["cache"]
+    slots[slot_id] = cached
+    return {"id_slot": slot_id, "filename": filename, "n_restored": len(cached) // CHARS_PER_TOKEN,
+            "n_read": len(data), "timings": {"restore_ms": 1000.0 * (time.perf_counter() - start)}}
@@ -1,23 +1,72 @@
 # api/mock_server.py
 from fastapi import FastAPI, UploadFile, File, Form, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.requests import ClientDisconnect
 from pydantic import BaseModel
-from typing import Optional
-from uuid import uuid4
+from typing import Optional, List
+from contextlib import asynccontextmanager
+import asyncio
+import json
+import os
 import time
+from api.batching import MicroBatcher
+from api.gguf_catalog import ModelCatalog, catalog_metadata
+from api.jobs import Job, JobRunner, JobStore, JobStoreFull
+from api.metrics import ACTIVE_SESSIONS, TurnTimer, metrics_response, stats_snapshot
+from api.model_registry import MB, ModelRegistry, ModelSpec, ModelTooLarge
 
-app = FastAPI(title="Local Inference Mock Server")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    for spec in DEMO_MODELS:
+        registry.register(spec)
+        await registry.ensure(spec.name)
+    registry.active = DEMO_MODELS[0].name
+    await sync_catalog()
+    jobs.start()
+    try:
+        yield
+    finally:
+        await jobs.close()
+        await batcher.close()
 
-STATE = {
-    "active_model": "demo-base",
-    "models": [
-        {"model_name": "demo-base", "precision": "fp16", "device": "cuda"},
-        {"model_name": "demo-graph", "precision": "fp16", "device": "cuda"},
-    ],
-    "jobs": {}
-}
+app = FastAPI(title="Local Inference Mock Server", lifespan=lifespan)
 
 # ----- models -----
+# Simulated load time per GB of weights
+MOCK_LOAD_S_PER_GB = float(os.getenv("ALSPEC_MOCK_LOAD_S_PER_GB", "0.1"))
+
+async def load_weights(spec: ModelSpec):
+    await asyncio.sleep(MOCK_LOAD_S_PER_GB * spec.size_bytes / (1024 * MB))
+    return {"model_name": spec.name}
+
+registry = ModelRegistry(load_weights)
+
+DEMO_MODELS = [
+    ModelSpec("demo-base", precision="fp16", device="cuda"),
+    ModelSpec("demo-graph", precision="fp16", device="cuda"),
+]
+
+# GGUF files under ALSPEC_MODEL_DIR are registered (not loaded) with the
+# sizes and quantization read from their headers.
+catalog = ModelCatalog()
+
+async def sync_catalog():
+    for entry in await asyncio.to_thread(catalog.scan):
+        if "error" in entry:
+            continue
+        known = registry.get(entry["name"])
+        if known is not None and known.path != entry["path"]:
+            continue
+        registry.register(ModelSpec(
+            entry["name"], entry["path"],
+            precision=entry.get("quantization") or "unknown",
+            size_bytes=entry["size_bytes"],
+            metadata=catalog_metadata(entry),
+        ))
+
+def active_model():
+    return registry.active or DEMO_MODELS[0].name
+
 class LoadModelReq(BaseModel):
     model_name: str
     model_path: Optional[str] = None
@@ -30,39 +79,277 @@ class SwitchReq(BaseModel):
 class UnloadReq(BaseModel):
     model_name: str
 
+def load_response(result, start):
+    return {
+        "ok": True,
+        "model_name": result.model.spec.name,
+        "status": "resident" if result.hit else "loaded",
+        "active_model": registry.active,
+        "load_time": result.model.load_s if not result.hit else 0.0,
+        "elapsed_ms": 1000.0 * (time.perf_counter() - start),
+        "size_mb": result.model.spec.size_bytes / MB,
+        "evicted": result.evicted,
+    }
+
 @app.get("/models")
-def list_models():
-    return {"models": STATE["models"], "active_model": STATE["active_model"]}
+async def list_models():
+    await sync_catalog()
+    return {"models": registry.models(), "active_model": registry.active,
+            "registry": registry.snapshot(), "catalog": catalog.snapshot()}
 
 @app.post("/models/load")
-def load_model(req: LoadModelReq):
-    if not any(m["model_name"] == req.model_name for m in STATE["models"]):
-        STATE["models"].append({
-            "model_name": req.model_name,
-            "precision": req.precision,
-            "device": req.device
-        })
-    STATE["active_model"] = req.model_name
-    return {"ok": True, "active_model": STATE["active_model"]}
+async def load_model(req: LoadModelReq):
+    start = time.perf_counter()
+    try:
+        result = await registry.load(req.model_name, req.model_path, req.precision, req.device)
+    except ModelTooLarge as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    registry.active = req.model_name
+    return load_response(result, start)
 
 @app.post("/models/switch")
-def switch_model(req: SwitchReq):
-    if not any(m["model_name"] == req.model_name for m in STATE["models"]):
+async def switch_model(req: SwitchReq):
+    # Instant when the model is resident; an evicted model is reloaded
+    start = time.perf_counter()
+    if req.model_name not in registry:
         return JSONResponse(status_code=400, content={"error": "model not found"})
-    STATE["active_model"] = req.model_name
-    return {"ok": True, "active_model": STATE["active_model"]}
+    try:
+        result = await registry.switch(req.model_name)
+    except ModelTooLarge as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    return load_response(result, start)
 
 @app.post("/models/unload")
-def unload_model(req: UnloadReq):
-    STATE["models"] = [m for m in STATE["models"] if m["model_name"] != req.model_name]
-    if STATE["active_model"] == req.model_name:
-        STATE["active_model"] = STATE["models"][0]["model_name"] if STATE["models"] else None
-    return {"ok": True, "active_model": STATE["active_model"]}
+async def unload_model(req: UnloadReq):
+    if not await registry.unload(req.model_name):
+        return JSONResponse(status_code=400, content={"error": "model not found"})
+    return {"ok": True, "active_model": registry.active}
 
 # ----- inference -----
+def run_model_batch(model_name: str, inputs: List[str]) -> List[dict]:
+    # Stand-in for one batched forward pass: fixed overhead plus a small
+    # per-item cost, so batching amortizes the overhead.
+    time.sleep(0.05 + 0.002 * len(inputs))
+    return [{"echo": text} for text in inputs]
+
+async def run_batch(model_name: str, inputs: List[str]) -> List[dict]:
+    return await asyncio.to_thread(run_model_batch, model_name, inputs)
+
+batcher = MicroBatcher(run_batch)
+
+# Simulated prefill time and per-token decode delay for streamed requests
+PREFILL_S = float(os.getenv("ALSPEC_MOCK_PREFILL_S", "0.05"))
+TOKEN_DELAY_S = float(os.getenv("ALSPEC_MOCK_TOKEN_DELAY_S", "0.01"))
+
+async def generate_tokens(model_name: str, text: str):
+    await asyncio.sleep(PREFILL_S)
+    for word in text.split():
+        await asyncio.sleep(TOKEN_DELAY_S)
+        yield word + " "
+
+def sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def stream_tokens(model_name: str, text: str):
+    """
+    Server-sent events: one "token" event per generated token, then a
+    "done" event with timing, or an "error" event.
+    """
+    start = time.perf_counter()
+    first = None
+    count = 0
+    timer = TurnTimer("inference_stream")
+    ACTIVE_SESSIONS.inc()
+    outcome = "cancelled"
+    try:
+        timer.admitted()
+        async for token in generate_tokens(model_name, text):
+            if first is None:
+                first = time.perf_counter() - start
+            count += 1
+            timer.token()
+            yield sse("token", {"token": token})
+        outcome = "ok"
+    except Exception as e:
+        outcome = "error"
+        yield sse("error", {"error": str(e)})
+        return
+    finally:
+        timer.finish(outcome)
+        ACTIVE_SESSIONS.dec()
+    total = time.perf_counter() - start
+    yield sse("done", {
+        "model": model_name,
+        "tokens": count,
+        "ttft_ms": 1000.0 * (first if first is not None else total),
+        "total_ms": 1000.0 * total,
+    })
+
+async def ensure_model(model_name: str):
+    # Known models are made resident (reloading them if evicted) and marked
+    # as recently used; unknown names are served as-is by the mock.
+    if model_name in registry:
+        await registry.ensure(model_name)
+
+async def run_job(job: Job):
+    # Concurrent jobs for the same model share one batched call
+    await ensure_model(job.model)
+    with TurnTimer("inference", started_at=job.created_at) as timer:
+        timer.admitted(job.started_at - job.created_at)
+        result = await batcher.submit(job.model, job.input, job.batch_size)
+        timer.token()
+        return result
+
+jobs = JobRunner(run_job, JobStore())
+
+# Streamed uploads: at most STREAM_WINDOW records in flight per request, and
+# no record may exceed MAX_RECORD_BYTES, so memory stays flat however large
+# the upload is.
+STREAM_WINDOW = int(os.getenv("ALSPEC_STREAM_WINDOW", "64"))
+MAX_RECORD_BYTES = int(os.getenv("ALSPEC_MAX_RECORD_BYTES", str(1024 * 1024)))
+NDJSON_TYPES = ("application/x-ndjson", "application/jsonl", "text/plain")
+
+async def iter_records(chunks):
+    """Yield newline-delimited records from body chunks as they arrive."""
+    pending = b""
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        if len(pending) > MAX_RECORD_BYTES:
+            raise ValueError(f"record exceeds {MAX_RECORD_BYTES} bytes")
+        for line in lines:
+            if line.strip():
+                yield line
+    if pending.strip():
+        yield pending
+
+def parse_record(line: bytes):
+    # A record is either a JSON object with an "input" field or plain text
+    text = line.decode("utf-8", errors="replace").strip()
+    if text.startswith("{"):
+        try:
+            return json.loads(text).get("input", text)
+        except ValueError:
+            pass
+    return text
+
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    A StreamingResponse that can keep reading the request body while it
+    sends. Under ASGI servers older than spec 2.4, Starlette's version reads
+    receive() to watch for disconnects, which swallows the rest of the
+    upload; here the endpoint reads receive() itself and sees the
+    disconnect there instead.
+    """
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+
+async def stream_jsonl(request: Request, model_name: str, batch_size: int):
+    """
+    Run every record of a streamed upload and stream the results back as
+    JSON Lines, in input order. Records are dispatched while the upload is
+    still arriving; once STREAM_WINDOW results are waiting to be sent, the
+    body stops being read, which pushes back on the client. When the
+    client goes away, records still running are cancelled.
+    """
+    window = asyncio.Queue(maxsize=STREAM_WINDOW)
+    chunks = asyncio.Queue(maxsize=1)
+    tasks = set()
+    gone = asyncio.Event()
+
+    async def run_record(line: bytes):
+        with TurnTimer("inference_file") as timer:
+            timer.admitted(0.0)
+            result = await batcher.submit(model_name, parse_record(line), batch_size)
+            timer.token()
+            return result
+
+    async def read_body():
+        # The only reader of receive(). It stays at most one chunk ahead of
+        # the records being dispatched, so backpressure still reaches the
+        # client, and it keeps reading once the body is in: an ASGI server
+        # reports a client that left only through receive().
+        while True:
+            message = await request.receive()
+            if message["type"] == "http.disconnect":
+                gone.set()
+                return
+            await chunks.put(message)
+
+    async def body_chunks():
+        while True:
+            message = await chunks.get()
+            if message.get("body"):
+                yield message["body"]
+            if not message.get("more_body", False):
+                return
+
+    async def produce():
+        try:
+            index = 0
+            async for line in iter_records(body_chunks()):
+                task = asyncio.create_task(run_record(line))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                await window.put((index, task))
+                index += 1
+        except Exception as e:
+            await window.put((None, e))
+        await window.put(None)
+
+    async def unless_gone(aw):
+        """The result of ``aw``, or ClientDisconnect if the client leaves first."""
+        fut = asyncio.ensure_future(aw)
+        waiter = asyncio.ensure_future(gone.wait())
+        try:
+            await asyncio.wait({fut, waiter}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            waiter.cancel()
+        if not fut.done():
+            fut.cancel()
+            raise ClientDisconnect()
+        return fut.result()
+
+    reader = asyncio.create_task(read_body())
+    producer = asyncio.create_task(produce())
+    ACTIVE_SESSIONS.inc()
+    try:
+        while True:
+            item = await unless_gone(window.get())
+            if item is None:
+                break
+            index, task = item
+            if index is None:
+                yield json.dumps({"error": str(task)}) + "\n"
+                continue
+            try:
+                line = {"index": index, "result": await unless_gone(task)}
+            except ClientDisconnect:
+                raise
+            except Exception as e:
+                line = {"index": index, "error": str(e)}
+            yield json.dumps(line) + "\n"
+    except ClientDisconnect:
+        return
+    finally:
+        # Stop the records nobody will read
+        reader.cancel()
+        producer.cancel()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(reader, producer, *tasks, return_exceptions=True)
+        ACTIVE_SESSIONS.dec()
+
 # Accept BOTH JSON and multipart:
 # - JSON: {"model_name": "...", "input": "...", "batch_size": 1, "stream": false}
 # - multipart: form fields + file "input"
+# - newline-delimited records (application/x-ndjson or text/plain) with
+#   model_name/batch_size in the query string; results stream back as
+#   JSON Lines, see stream_jsonl
+#
+# Returns 202 with a job_id as soon as the job is queued; poll GET /jobs/{id}
+# (optionally with ?wait_s= to block until it finishes). With stream=true the
+# output is streamed back as server-sent events instead.
 @app.post("/inference")
 async def inference(
     request: Request,
@@ -73,8 +360,15 @@ async def inference(
 ):
     preview = None
 
-    # If JSON request
     ct = request.headers.get("content-type", "")
+    if ct.startswith(NDJSON_TYPES):
+        model_name = request.query_params.get("model_name") or active_model()
+        batch_size = int(request.query_params.get("batch_size", 1))
+        await ensure_model(model_name)
+        return DuplexStreamingResponse(stream_jsonl(request, model_name, batch_size),
+                                       media_type="application/x-ndjson")
+
+    # If JSON request
     if "application/json" in ct:
         data = await request.json()
         model_name = data.get("model_name", model_name)
@@ -85,29 +379,51 @@ async def inference(
     else:
         # Multipart/form-data path
         if input is not None:
-            content = await input.read()
-            preview = content[:64].decode(errors="ignore")
+            # Only the preview is needed; don't pull the whole file into memory
+            content = await input.read(64)
+            preview = content.decode(errors="ignore")
         else:
             preview = "(no file)"
         # model_name may come via form; if not provided, fallback below
 
     if model_name is None:
-        model_name = STATE["active_model"]
+        model_name = active_model()
+
+    if stream:
+        await ensure_model(model_name)
+        return StreamingResponse(stream_tokens(model_name, preview), media_type="text/event-stream")
 
-    job_id = str(uuid4())[:8]
-    STATE["jobs"][job_id] = {"status": "queued", "model": model_name, "preview": preview}
-    time.sleep(0.05)  # simulate brief work
-    STATE["jobs"][job_id]["status"] = "succeeded"
-    return {"job_id": job_id, "status": "succeeded", "result": {"echo": preview}, "model": model_name}
+    try:
+        job = jobs.submit(Job(model=model_name, input=preview, batch_size=batch_size or 1))
+    except JobStoreFull as e:
+        return JSONResponse(status_code=503, content={"error": str(e)})
+    return JSONResponse(status_code=202, content=job.to_dict())
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait_s: float = 0.0):
+    job = jobs.store.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "job not found"})
+    await jobs.wait(job, min(wait_s, 60.0))
+    return job.to_dict()
 
 # ----- system -----
 @app.get("/system/status")
 def system_status():
-    return {"ok": True, "active_model": STATE["active_model"], "models_count": len(STATE["models"])}
+    return {"ok": True, "active_model": registry.active, "models_count": len(registry.models())}
 
 @app.get("/system/stats")
 def system_stats():
-    return {"uptime_s": 123, "jobs_total": len(STATE["jobs"])}
+    stats = stats_snapshot()
+    stats.update(registry.snapshot())
+    stats["models_loaded"] = stats["models_resident"]
+    stats["batching"] = batcher.snapshot()
+    stats.update(jobs.store.snapshot())
+    return stats
+
+@app.get("/metrics")
+def metrics():
+    return metrics_response()
 
 if __name__ == "__main__":
     import uvicorn
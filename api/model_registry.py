@@ -0,0 +1,240 @@
+# api/model_registry.py
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# Resident models may use at most MODEL_MEMORY_BUDGET_MB between them; the
+# least recently used ones are evicted to make room for a new load.
+MODEL_MEMORY_BUDGET_MB = float(os.getenv("ALSPEC_MODEL_MEMORY_BUDGET_MB", "8192"))
+
+# Footprint estimate for a model without a weights file on disk: parameter
+# count times bytes per parameter at the requested precision.
+DEFAULT_MODEL_PARAMS = float(os.getenv("ALSPEC_DEFAULT_MODEL_PARAMS", "1.2e9"))
+BYTES_PER_PARAM = {"fp32": 4.0, "fp16": 2.0, "int8": 1.0}
+
+MB = 1024 * 1024
+
+
+class ModelTooLarge(Exception):
+    """Raised when a model would not fit in the budget even with nothing else resident."""
+
+
+def estimate_size(path: Optional[str], precision: str = "fp16") -> int:
+    """
+    Bytes a model is expected to occupy once loaded. A weights file on disk
+    (e.g. a GGUF, which is mapped as is) counts at its file size.
+    """
+    if path and os.path.isfile(path):
+        return os.path.getsize(path)
+    return int(DEFAULT_MODEL_PARAMS * BYTES_PER_PARAM.get(precision, 2.0))
+
+
+@dataclass
+class ModelSpec:
+    name: str
+    path: Optional[str] = None
+    precision: str = "fp16"
+    device: str = "cuda"
+    size_bytes: int = 0
+    # Header fields from the model catalog (quantization, context_length, ...)
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class ResidentModel:
+    spec: ModelSpec
+    handle: Any
+    load_s: float
+    loaded_at: float = field(default_factory=time.monotonic)
+    last_used: float = field(default_factory=time.monotonic)
+    uses: int = 0
+
+
+@dataclass
+class LoadResult:
+    model: ResidentModel
+    hit: bool
+    evicted: List[str] = field(default_factory=list)
+
+
+Loader = Callable[[ModelSpec], Awaitable[Any]]
+Unloader = Callable[[ModelSpec, Any], Awaitable[None]]
+
+
+class ModelRegistry:
+    """
+    Models indexed by name, with the resident ones kept in LRU order against
+    a memory budget.
+
+    A model is registered once (``load`` or ``register``) and may then be
+    evicted and transparently reloaded by ``ensure``. Requests for a
+    resident model are hits and return without touching the loader, so
+    switching to one is instant; loads and evictions are serialized.
+    """
+
+    def __init__(
+        self,
+        loader: Loader,
+        budget_bytes: int = int(MODEL_MEMORY_BUDGET_MB * MB),
+        unloader: Optional[Unloader] = None,
+    ):
+        self.loader = loader
+        self.unloader = unloader
+        self.budget_bytes = budget_bytes
+        self.active: Optional[str] = None
+        self._specs: Dict[str, ModelSpec] = {}
+        self._resident: "OrderedDict[str, ResidentModel]" = OrderedDict()
+        self._lock = asyncio.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.evictions = 0
+        self.total_load_s = 0.0
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._specs
+
+    @property
+    def used_bytes(self) -> int:
+        return sum(m.spec.size_bytes for m in self._resident.values())
+
+    def get(self, name: str) -> Optional[ModelSpec]:
+        return self._specs.get(name)
+
+    def is_resident(self, name: str) -> bool:
+        return name in self._resident
+
+    def register(self, spec: ModelSpec) -> ModelSpec:
+        if not spec.size_bytes:
+            spec.size_bytes = estimate_size(spec.path, spec.precision)
+        self._specs[spec.name] = spec
+        return spec
+
+    async def load(self, name: str, path: Optional[str] = None, precision: str = "fp16",
+                   device: str = "cuda", size_bytes: int = 0) -> LoadResult:
+        """
+        Register ``name`` (replacing a different spec of the same name) and
+        make it resident. Without a path, a registered model (e.g. one found
+        by the GGUF catalog) is loaded as registered.
+        """
+        spec = ModelSpec(name, path, precision, device, size_bytes)
+        known = self._specs.get(name)
+        if known is not None and path is None:
+            return await self.ensure(name)
+        if known is not None and (known.path, known.precision, known.device) != (path, precision, device):
+            await self.unload(name)
+            known = None
+        if known is None:
+            self.register(spec)
+            try:
+                return await self.ensure(name)
+            except ModelTooLarge:
+                del self._specs[name]
+                raise
+        return await self.ensure(name)
+
+    async def ensure(self, name: str) -> LoadResult:
+        """Return the resident model, loading it (and evicting others) if needed."""
+        resident = self._hit(name)
+        if resident is not None:
+            return LoadResult(resident, hit=True)
+        if name not in self._specs:
+            raise KeyError(name)
+
+        async with self._lock:
+            # Someone else may have loaded it while we waited
+            resident = self._hit(name)
+            if resident is not None:
+                return LoadResult(resident, hit=True)
+            self.misses += 1
+            spec = self._specs[name]
+            if spec.size_bytes > self.budget_bytes:
+                raise ModelTooLarge(
+                    f"{name} needs {spec.size_bytes / MB:.0f} MB, budget is {self.budget_bytes / MB:.0f} MB"
+                )
+            evicted = []
+            while self._resident and self.used_bytes + spec.size_bytes > self.budget_bytes:
+                evicted.append(await self._evict_lru())
+
+            start = time.perf_counter()
+            handle = await self.loader(spec)
+            load_s = time.perf_counter() - start
+            self.loads += 1
+            self.total_load_s += load_s
+            resident = self._resident[name] = ResidentModel(spec, handle, load_s)
+            resident.uses += 1
+            return LoadResult(resident, hit=False, evicted=evicted)
+
+    def _hit(self, name: str) -> Optional[ResidentModel]:
+        resident = self._resident.get(name)
+        if resident is not None:
+            self._resident.move_to_end(name)
+            resident.last_used = time.monotonic()
+            resident.uses += 1
+            self.hits += 1
+        return resident
+
+    async def _evict_lru(self) -> str:
+        name, resident = self._resident.popitem(last=False)
+        self.evictions += 1
+        if self.unloader is not None:
+            await self.unloader(resident.spec, resident.handle)
+        return name
+
+    async def switch(self, name: str) -> LoadResult:
+        result = await self.ensure(name)
+        self.active = name
+        return result
+
+    async def unload(self, name: str) -> bool:
+        """Drop ``name`` entirely; returns False if it was not known."""
+        spec = self._specs.pop(name, None)
+        async with self._lock:
+            resident = self._resident.pop(name, None)
+            if resident is not None and self.unloader is not None:
+                await self.unloader(resident.spec, resident.handle)
+        if self.active == name:
+            self.active = next(reversed(self._resident), None)
+        return spec is not None
+
+    def models(self) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        out = []
+        for name, spec in self._specs.items():
+            resident = self._resident.get(name)
+            out.append({
+                **spec.metadata,
+                "model_name": name,
+                "name": name,
+                "loaded": resident is not None,
+                "active": name == self.active,
+                "precision": spec.precision,
+                "device": spec.device,
+                "path": spec.path,
+                "size_mb": spec.size_bytes / MB,
+                "load_ms": 1000.0 * resident.load_s if resident else None,
+                "uses": resident.uses if resident else 0,
+                "idle_s": now - resident.last_used if resident else None,
+            })
+        return out
+
+    def snapshot(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "models_known": len(self._specs),
+            "models_resident": len(self._resident),
+            "memory_budget_mb": self.budget_bytes / MB,
+            "memory_used_mb": self.used_bytes / MB,
+            "model_hits": self.hits,
+            "model_misses": self.misses,
+            "model_hit_rate": self.hits / lookups if lookups else 0.0,
+            "model_loads": self.loads,
+            "model_evictions": self.evictions,
+            "avg_load_ms": 1000.0 * self.total_load_s / self.loads if self.loads else 0.0,
+        }
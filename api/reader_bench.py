@@ -0,0 +1,73 @@
+# api/reader_bench.py
+"""
+Micro-benchmark for the engine stdout reader.
+
+Replays a synthetic llama-cli response, one token per read, through the old
+reader (``buffer += text`` plus a full rescan for the prompt on every chunk)
+and through ``SentinelMatcher`` with an incremental UTF-8 decoder, and prints
+the per-token overhead at increasing output lengths.
+
+    python -m api.reader_bench [--tokens 1000 10000 100000]
+"""
+from __future__ import annotations
+
+import argparse
+import codecs
+import time
+from typing import Callable, List
+
+from api.stream_reader import PROMPT_SENTINEL, SentinelMatcher
+
+# Mix of ASCII and multi-byte tokens, one per read.
+TOKENS = ["the ", "quick ", "brown ", "fox ", "→ ", "naïve ", "日本 ", "\n"]
+
+
+def make_chunks(n_tokens: int) -> List[bytes]:
+    chunks = [TOKENS[i % len(TOKENS)].encode("utf-8") for i in range(n_tokens)]
+    chunks.append(PROMPT_SENTINEL.encode("utf-8"))
+    return chunks
+
+
+def legacy_reader(chunks: List[bytes]) -> int:
+    buffer = ""
+    for chunk in chunks:
+        text = chunk.decode("utf-8", errors="ignore")
+        buffer += text
+        if "\n> " in buffer or buffer.endswith("\n> ") or buffer.endswith("> "):
+            break
+    return len(buffer)
+
+
+def incremental_reader(chunks: List[bytes]) -> int:
+    matcher = SentinelMatcher()
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    emitted = 0
+    for chunk in chunks:
+        emitted += len(matcher.feed(decoder.decode(chunk)))
+        if matcher.matched:
+            break
+    return emitted
+
+
+def time_per_token(reader: Callable[[List[bytes]], int], chunks: List[bytes]) -> float:
+    start = time.perf_counter()
+    reader(chunks)
+    return (time.perf_counter() - start) / len(chunks) * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tokens", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    args = parser.parse_args()
+
+    print(f"{'tokens':>10} | {'legacy us/tok':>14} | {'incremental us/tok':>18}")
+    print("-" * 50)
+    for n in args.tokens:
+        chunks = make_chunks(n)
+        legacy = time_per_token(legacy_reader, chunks)
+        incremental = time_per_token(incremental_reader, chunks)
+        print(f"{n:>10} | {legacy:>14.3f} | {incremental:>18.3f}")
+
+
+if __name__ == "__main__":
+    main()
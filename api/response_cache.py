@@ -0,0 +1,107 @@
+# api/response_cache.py
+from __future__ import annotations
+
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+# Opt-in: the cache is disabled unless ALSPEC_RESPONSE_CACHE_MB is set > 0.
+RESPONSE_CACHE_MB = float(os.getenv("ALSPEC_RESPONSE_CACHE_MB", "0"))
+RESPONSE_CACHE_TTL_S = float(os.getenv("ALSPEC_RESPONSE_CACHE_TTL_S", "300"))
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapse runs of whitespace so trivially different prompts share an entry."""
+    return " ".join(prompt.split())
+
+
+@dataclass
+class CacheEntry:
+    chunks: List[str]
+    size: int
+    expires_at: float
+    generation_s: float
+
+
+class ResponseCache:
+    """
+    LRU cache of completed responses, bounded in bytes and by TTL.
+
+    Entries keep the original chunk boundaries so a hit can be replayed
+    through the same streaming protocol as a fresh generation.
+    """
+
+    def __init__(self, max_bytes: int, ttl_s: float = RESPONSE_CACHE_TTL_S):
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self.bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.generation_s_saved = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def key(prompt: str, system_prompt: str, model: str) -> str:
+        h = hashlib.sha256()
+        for part in (model, system_prompt, normalize_prompt(prompt)):
+            h.update(part.encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def get(self, key: str) -> Optional[List[str]]:
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at <= time.monotonic():
+            self._remove(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        self.generation_s_saved += entry.generation_s
+        return entry.chunks
+
+    def put(self, key: str, chunks: List[str], generation_s: float = 0.0) -> None:
+        size = sum(len(c.encode("utf-8")) for c in chunks)
+        if not self.enabled or size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = CacheEntry(
+            chunks=list(chunks),
+            size=size,
+            expires_at=time.monotonic() + self.ttl_s,
+            generation_s=generation_s,
+        )
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self.bytes -= entry.size
+
+    def snapshot(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "cache_enabled": self.enabled,
+            "cache_entries": len(self._entries),
+            "cache_bytes": self.bytes,
+            "cache_max_bytes": self.max_bytes,
+            "cache_hits": self.hits,
+            "cache_misses": self.misses,
+            "cache_hit_rate": self.hits / lookups if lookups else 0.0,
+            "cache_evictions": self.evictions,
+            "cache_generation_s_saved": self.generation_s_saved,
+        }
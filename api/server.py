@@ -1,10 +1,115 @@
 # api/server.py
 from __future__ import annotations
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from api.engine import send_and_stream
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
 
-app = FastAPI(title="ALSpec Chat Server")
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from starlette.requests import HTTPConnection
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from api.admission import BATCH, INTERACTIVE, PRIORITIES, AdmissionController, DeadlineExceeded, QueueFull
+from api.engine import MODEL_PATH, SYSTEM_PROMPT, EngineCrashed, get_pool
+from api.gguf_catalog import ModelCatalog
+from api.frames import FrameCoalescer, Inbox, TextProtocol, TurnCancelled, select_protocol
+from api.jobs import Job, JobExpired, JobRunner, JobStore, JobStoreFull
+from api.metrics import (
+    ACTIVE_SESSIONS,
+    CANCELLED_TURNS,
+    ENGINE_WORKERS,
+    TurnTimer,
+    metrics_response,
+    stats_snapshot,
+)
+from api.response_cache import RESPONSE_CACHE_MB, ResponseCache
+from api.sessions import ChatSession, SessionManager
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load and warm the engine before accepting traffic, so the first user
+    # does not pay the model-load latency.
+    pool = get_pool()
+    await pool.start()
+    sessions.start()
+    jobs.start()
+    try:
+        yield
+    finally:
+        await jobs.close()
+        await sessions.close()
+        await pool.close()
+
+
+app = FastAPI(title="ALSpec Chat Server", lifespan=lifespan)
+
+admission = AdmissionController()
+sessions = SessionManager(get_pool())
+response_cache = ResponseCache(max_bytes=int(RESPONSE_CACHE_MB * 1024 * 1024))
+catalog = ModelCatalog()
+
+# Gauges are read when /metrics or /system/stats is scraped.
+ACTIVE_SESSIONS.set_function(lambda: sessions.connected)
+ENGINE_WORKERS.labels("total").set_function(lambda: len(get_pool().workers))
+ENGINE_WORKERS.labels("alive").set_function(lambda: sum(w.is_alive() for w in get_pool().workers))
+ENGINE_WORKERS.labels("ready").set_function(lambda: sum(w.ready for w in get_pool().workers))
+ENGINE_WORKERS.labels("busy").set_function(lambda: sum(w.lock.locked() for w in get_pool().workers))
+
+
+@app.get("/ready")
+def ready():
+    """Readiness probe: 200 once at least one warm engine worker is up, else 503."""
+    pool = get_pool()
+    body = {
+        "ready": pool.ready,
+        "workers_ready": sum(w.ready for w in pool.workers),
+        "workers": len(pool.workers),
+        "standby_ready": pool.supervisor.standby_ready,
+    }
+    return JSONResponse(status_code=200 if pool.ready else 503, content=body)
+
+
+@app.get("/metrics")
+def metrics():
+    return metrics_response()
+
+
+@app.get("/models")
+async def list_models():
+    """GGUF files in the model directory, from their headers; the served one is loaded."""
+    served = str(MODEL_PATH.resolve())
+    models = []
+    for entry in await asyncio.to_thread(catalog.scan):
+        loaded = entry["path"] == served
+        models.append({
+            **entry,
+            "model_name": entry["name"],
+            "loaded": loaded,
+            "active": loaded,
+            "precision": entry.get("quantization"),
+            "device": "cuda",
+            "size_mb": entry["size_bytes"] / (1024 * 1024),
+        })
+    return {"models": models, "active_model": MODEL_PATH.stem, "catalog": catalog.snapshot()}
+
+
+@app.get("/system/stats")
+def system_stats():
+    pool = get_pool()
+    stats = stats_snapshot()
+    stats.update(admission.snapshot())
+    stats.update(jobs.store.snapshot())
+    stats.update(sessions.snapshot())
+    stats.update(sessions.store.snapshot())
+    stats.update(response_cache.snapshot())
+    stats.update(pool.supervisor.snapshot())
+    stats["models_loaded"] = 1
+    stats["engine_workers"] = len(pool.workers)
+    stats["engine_workers_alive"] = sum(w.is_alive() for w in pool.workers)
+    stats["engine_workers_ready"] = sum(w.ready for w in pool.workers)
+    return stats
 
 
 @app.websocket("/ws/chat")
@@ -12,22 +117,276 @@ async def ws_chat(ws: WebSocket):
     """
     WebSocket protocol:
 
+    Connect to /ws/chat?session_id=<id> to resume a conversation; without
+    it (or once the session has been evicted) a new one is started. The
+    session id is returned in the "x-session-id" handshake header.
+
     Client sends: raw text (one user message)
 
     Server responds:
       - many text frames with partial output
       - a final frame equal to "[[END_OF_RESPONSE]]"
+
+    If the admission queue is full the turn is rejected: the server sends a
+    single "[[BUSY]] ..." frame with the queue position, then the usual
+    "[[END_OF_RESPONSE]]", and the client may retry.
+
+    Sending "[[STOP]]" while a reply is streaming stops it: the engine is
+    interrupted, the turn ends early with "[[END_OF_RESPONSE]]", and the
+    partial reply stays in the conversation. Disconnecting mid-reply stops
+    generation the same way. Messages sent during a reply are answered in
+    order after it.
+
+    Connecting with ?protocol=json selects the structured protocol instead
+    (typed messages, an "end" message with per-turn timing; see
+    api.frames.JsonProtocol).
+
+    Output is coalesced into fewer, larger frames while tokens arrive
+    faster than ALSPEC_COALESCE_WINDOW_MS; the first token of a turn is
+    always sent immediately.
+
+    Turns are interactive traffic for the admission scheduler and go ahead
+    of batch /inference jobs. ?client_id= (or an x-client-id header; the
+    peer address by default) names the client for fair sharing, and
+    ?deadline_ms= gives every turn a deadline, counted from when the turn
+    starts waiting; a turn that cannot start in time is dropped with an
+    error. With the JSON protocol a message may set its own "deadline_ms".
+
+    Each session is pinned to one engine worker, which keeps its history
+    warm in the KV cache between turns and across reconnects. If the
+    engine dies mid-reply the turn ends with an error and the worker is
+    recovered from a warm standby; the client may resend the message.
     """
-    await ws.accept()
     try:
+        proto = select_protocol(ws)
+        default_deadline_ms = optional_float(ws.query_params.get("deadline_ms"))
+    except ValueError:
+        await ws.close(code=1008)
+        return
+    client = client_id(ws)
+
+    session = await sessions.attach(ws.query_params.get("session_id"))
+    inbox = Inbox(ws, proto)
+    try:
+        await ws.accept(headers=[(b"x-session-id", session.session_id.encode())])
+        inbox.start()
         while True:
-            user_msg = await ws.receive_text()
+            message = await inbox.get()
+            if message is None:
+                return
 
-            async for chunk in send_and_stream(user_msg):
-                await ws.send_text(chunk)
+            timing = {"status": "ok", "turn": session.turns + 1}
+            try:
+                user_msg = proto.parse(message)
+                deadline_ms = proto.deadline_ms(message)
+                deadline = deadline_at(default_deadline_ms if deadline_ms is None else deadline_ms)
+                timing.update(await inbox.run(run_turn(proto, session, user_msg, client, deadline)))
+            except TurnCancelled as e:
+                CANCELLED_TURNS.labels("chat", e.reason).inc()
+                # The partial reply is part of the conversation now
+                session.turns += 1
+                if inbox.disconnected:
+                    return
+                timing["status"] = "stopped"
+            except QueueFull as e:
+                timing["status"] = "busy"
+                await proto.busy(e.position, e.capacity)
+            except DeadlineExceeded as e:
+                timing["status"] = "expired"
+                await proto.error(f"[{e}]")
+            except ValueError as e:
+                timing["status"] = "error"
+                await proto.error(str(e))
+            except EngineCrashed:
+                # The supervisor is already swapping in a standby engine
+                timing["status"] = "error"
+                await proto.error("[engine restarted mid-reply, please resend your message]")
+            session.touch()
 
-            # Sentinel for the client so it knows this turn is done
-            await ws.send_text("[[END_OF_RESPONSE]]")
+            # Tells the client this turn is done
+            await proto.end(timing)
+            # Messages dropped while this one waited, answered in the order they came
+            for _ in range(inbox.take_rejected()):
+                await proto.busy(inbox.capacity + 1, inbox.capacity)
+                await proto.end({"status": "busy"})
 
     except WebSocketDisconnect:
         return
+    finally:
+        await inbox.close()
+        sessions.detach(session)
+
+
+async def run_turn(
+    proto: TextProtocol,
+    session: ChatSession,
+    user_msg: str,
+    client: str = "",
+    deadline: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    Stream one turn to the client, from the response cache when possible,
+    and return its timing.
+
+    Only a session's opening turn is cached: later replies depend on the
+    conversation so far, which the key does not cover. A replayed reply is
+    added to the worker's history where the backend allows it.
+    """
+    worker = session.worker
+    timer = TurnTimer("chat")
+    frames = FrameCoalescer(proto.delta)
+    cache_key = None
+    if response_cache.enabled and session.turns == 0:
+        cache_key = response_cache.key(user_msg, SYSTEM_PROMPT, get_pool().backend.model)
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            with timer:
+                for chunk in cached:
+                    await frames.push(chunk)
+                await frames.close()
+                timer.finish("cache_hit")
+            worker.remember(user_msg, "".join(cached))
+            session.turns += 1
+            return turn_timing(timer, frames, cached=True)
+
+    chunks = []
+    with timer:
+        try:
+            async with admission.admit(worker, INTERACTIVE, deadline, client) as ticket:
+                timer.admitted(ticket.queue_wait_s)
+                # Closed explicitly, so a turn cancelled while sending a
+                # frame still stops the engine at once
+                stream = worker.generate(user_msg)
+                try:
+                    async for chunk in stream:
+                        timer.token()
+                        chunks.append(chunk)
+                        await frames.push(chunk)
+                    await frames.close()
+                finally:
+                    frames.discard()
+                    await stream.aclose()
+        except QueueFull:
+            timer.finish("rejected")
+            raise
+        except DeadlineExceeded:
+            timer.finish("expired")
+            raise
+    session.turns += 1
+
+    if cache_key is not None and chunks:
+        response_cache.put(cache_key, chunks, ticket.generation_s)
+    timing = turn_timing(timer, frames, cached=False)
+    engine_stats = worker.turn_stats()
+    if engine_stats:
+        timing["engine"] = engine_stats
+    if worker.context is not None and worker.context.last:
+        timing["context"] = dict(worker.context.last)
+    return timing
+
+
+def turn_timing(timer: TurnTimer, frames: FrameCoalescer, cached: bool) -> Dict[str, Any]:
+    def ms(seconds: Optional[float]) -> Optional[float]:
+        return None if seconds is None else round(1000.0 * seconds, 3)
+
+    return {
+        "queue_ms": ms(timer.queue_wait_s),
+        "ttft_ms": ms(timer.ttft_s),
+        "total_ms": ms(timer.elapsed_s),
+        "chunks": frames.chunks,
+        "frames": frames.frames,
+        "cached": cached,
+    }
+
+
+def client_id(conn: HTTPConnection) -> str:
+    """The API client a request counts against for fair sharing."""
+    return (
+        conn.query_params.get("client_id")
+        or conn.headers.get("x-client-id")
+        or (conn.client.host if conn.client else "anonymous")
+    )
+
+
+def optional_float(value: Optional[str]) -> Optional[float]:
+    return float(value) if value not in (None, "") else None
+
+
+def deadline_at(deadline_ms: Optional[float]) -> Optional[float]:
+    """A relative deadline in ms as a time.monotonic() value."""
+    return None if deadline_ms is None else time.monotonic() + deadline_ms / 1000.0
+
+
+class InferenceReq(BaseModel):
+    input: str
+    priority: str = BATCH
+    deadline_ms: Optional[float] = None
+    client_id: Optional[str] = None
+    stream: bool = False
+
+
+async def run_job(job: Job) -> Dict[str, Any]:
+    """
+    One prompt on the engine, scheduled as ``job.priority`` (batch by
+    default). The job gets a worker to itself with an empty conversation
+    (see SessionManager.borrow), so it neither sees nor joins a chat
+    session's history, and waits for one while every worker is in use.
+    """
+    chunks: List[str] = []
+    with TurnTimer("inference", started_at=job.created_at) as timer:
+        try:
+            async with sessions.borrow(job.deadline) as worker:
+                async with admission.admit(worker, job.priority, job.deadline, job.client):
+                    timer.admitted(time.monotonic() - job.created_at)
+                    stream = worker.generate(job.input)
+                    try:
+                        async for chunk in stream:
+                            timer.token()
+                            chunks.append(chunk)
+                    finally:
+                        await stream.aclose()
+        except QueueFull:
+            timer.finish("rejected")
+            raise
+        except DeadlineExceeded as e:
+            timer.finish("expired")
+            raise JobExpired(str(e)) from e
+    return {"output": "".join(chunks)}
+
+
+jobs = JobRunner(run_job, JobStore())
+
+
+@app.post("/inference")
+async def inference(req: InferenceReq, request: Request):
+    """
+    Queue one prompt as a job and answer 202 with its job_id; poll
+    GET /jobs/{job_id}. Jobs are batch traffic unless "priority" says
+    otherwise. A job whose "deadline_ms" (from submission) passes before it
+    reaches the engine ends with status "expired" instead of running.
+    """
+    if req.stream:
+        return JSONResponse(status_code=400, content={"error": "streaming is served over /ws/chat"})
+    if req.priority not in PRIORITIES:
+        return JSONResponse(status_code=400, content={"error": f"priority must be one of {list(PRIORITIES)}"})
+    job = Job(
+        model=get_pool().backend.model,
+        input=req.input,
+        client=req.client_id or client_id(request),
+        priority=req.priority,
+        deadline=deadline_at(req.deadline_ms),
+    )
+    try:
+        jobs.submit(job)
+    except JobStoreFull as e:
+        return JSONResponse(status_code=503, content={"error": str(e)})
+    return JSONResponse(status_code=202, content=job.to_dict())
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait_s: float = 0.0):
+    job = jobs.store.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "job not found"})
+    await jobs.wait(job, min(wait_s, 60.0))
+    return job.to_dict()
@@ -0,0 +1,374 @@
+# api/sessions.py
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+from api.admission import DeadlineExceeded
+from api.engine import EngineWorker, WorkerPool
+from api.kv_store import KV_SNAPSHOT_IDLE_S, KVStore
+from api.metrics import KV_RESUME, KV_STATE
+
+log = logging.getLogger(__name__)
+
+# Disconnected sessions keep their worker (and its warm KV cache) for this
+# long; after that, or sooner when a new session needs the worker, the least
+# recently used one is evicted.
+SESSION_IDLE_TIMEOUT_S = float(os.getenv("ALSPEC_SESSION_IDLE_TIMEOUT_S", "600"))
+SESSION_SWEEP_INTERVAL_S = float(os.getenv("ALSPEC_SESSION_SWEEP_INTERVAL_S", "30"))
+
+
+@dataclass
+class ChatSession:
+    session_id: str
+    worker: EngineWorker
+    created_at: float = field(default_factory=time.monotonic)
+    last_used: float = field(default_factory=time.monotonic)
+    connections: int = 0
+    turns: int = 0
+    # Turns covered by the session's KV snapshot on disk
+    saved_turns: int = 0
+    # Set once a new session's worker is cleaned and its saved state restored
+    ready: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+    def touch(self) -> None:
+        self.last_used = time.monotonic()
+
+    def idle_for(self, now: Optional[float] = None) -> float:
+        return (now if now is not None else time.monotonic()) - self.last_used
+
+
+class SessionManager:
+    """
+    Pins each chat session to one engine worker.
+
+    A worker holds exactly one conversation, so a session that comes back
+    (same ``session_id``) lands on the engine that already has its history in
+    the KV cache and only the new turn is prefilled. Sessions are kept in LRU
+    order; a new session that finds no free worker takes over the worker of
+    the least recently used disconnected session, whose conversation is
+    reset. Only when every worker belongs to a connected session do sessions
+    share a worker (and its conversation).
+
+    Where the backend can save its KV state, a disconnected session is
+    saved to the KV store once it has been idle for ``snapshot_idle_s``, and
+    at the latest when it is evicted. Coming back after eviction restores
+    the state and history instead of starting over; if the state cannot be
+    loaded, the history alone is restored and prefilled on the next turn.
+    Saves run outside the manager's lock, so a slow engine save never holds
+    up other sessions; restoring a session waits for its save to finish.
+
+    Jobs borrow a worker the same way for the length of one prompt, but
+    never share one: they wait until a worker is free instead.
+    """
+
+    def __init__(
+        self,
+        pool: WorkerPool,
+        idle_timeout: float = SESSION_IDLE_TIMEOUT_S,
+        sweep_interval: float = SESSION_SWEEP_INTERVAL_S,
+        store: Optional[KVStore] = None,
+        snapshot_idle_s: float = KV_SNAPSHOT_IDLE_S,
+    ):
+        self.pool = pool
+        self.idle_timeout = idle_timeout
+        self.sweep_interval = sweep_interval
+        self.store = store if store is not None else KVStore()
+        self.snapshot_idle_s = snapshot_idle_s
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._lock = asyncio.Lock()
+        # Snapshots being written, by session id
+        self._saves: Dict[str, asyncio.Task] = {}
+        # Set whenever a worker may have become free for a waiting job
+        self._freed = asyncio.Event()
+        self._sweep_task: Optional[asyncio.Task] = None
+
+        self.created = 0
+        self.resumed = 0
+        self.evicted = 0
+        self.restored = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get(self, session_id: str) -> Optional[ChatSession]:
+        return self._sessions.get(session_id)
+
+    def start(self) -> None:
+        if self._sweep_task is None:
+            self._sweep_task = asyncio.create_task(self._sweep_loop())
+
+    async def close(self) -> None:
+        if self._sweep_task is not None:
+            self._sweep_task.cancel()
+            self._sweep_task = None
+        async with self._lock:
+            for session in self._sessions.values():
+                self.pool.release(session.worker)
+            self._sessions.clear()
+
+    async def attach(self, session_id: Optional[str] = None) -> ChatSession:
+        """Resume ``session_id`` if it is still resident, else start a new session."""
+        save: Optional[asyncio.Task] = None
+        async with self._lock:
+            session = self._sessions.get(session_id) if session_id else None
+            created = session is None
+            if created:
+                worker, save = await self._claim_worker()
+                session = ChatSession(session_id or uuid4().hex, worker)
+                self._sessions[session.session_id] = session
+                self.created += 1
+            else:
+                self.resumed += 1
+            self._sessions.move_to_end(session.session_id)
+            session.connections += 1
+            session.touch()
+
+        if not created:
+            await session.ready.wait()
+            return session
+        try:
+            if save is not None:
+                await self._hand_over(session.worker, save)
+            if session_id:
+                await self._restore(session)
+        finally:
+            session.ready.set()
+        return session
+
+    def detach(self, session: ChatSession) -> None:
+        session.connections = max(0, session.connections - 1)
+        session.touch()
+        self._freed.set()
+
+    @asynccontextmanager
+    async def borrow(self, deadline: Optional[float] = None) -> AsyncIterator[EngineWorker]:
+        """
+        Hold a worker with an empty conversation for one job: an idle one,
+        or one taken over from a disconnected session. While every worker
+        belongs to a connected session this waits, raising DeadlineExceeded
+        if ``deadline`` (a time.monotonic() value) passes first. The
+        conversation is reset again before the worker is given back.
+        """
+        worker = await self._wait_for_worker(deadline)
+        try:
+            async with worker.lock:
+                # Idle workers used outside sessions may still hold a conversation
+                if worker.context is None or worker.context.turns:
+                    await worker.reset()
+            yield worker
+        finally:
+            try:
+                async with worker.lock:
+                    await worker.reset()
+            finally:
+                self.pool.release(worker)
+                self._freed.set()
+
+    async def _wait_for_worker(self, deadline: Optional[float]) -> EngineWorker:
+        while True:
+            self._freed.clear()
+            async with self._lock:
+                worker, save = await self._take_worker()
+            if worker is not None:
+                if save is not None:
+                    try:
+                        await self._hand_over(worker, save)
+                    except BaseException:
+                        self.pool.release(worker)
+                        self._freed.set()
+                        raise
+                return worker
+            timeout = None if deadline is None else deadline - time.monotonic()
+            try:
+                if timeout is not None and timeout <= 0:
+                    raise asyncio.TimeoutError
+                await asyncio.wait_for(self._freed.wait(), timeout)
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded(time.monotonic() - deadline) from None
+
+    async def _claim_worker(self) -> Tuple[EngineWorker, Optional[asyncio.Task]]:
+        worker, save = await self._take_worker()
+        if worker is not None:
+            return worker, save
+
+        log.warning("all %d workers are pinned to connected sessions; sharing", len(self.pool.workers))
+        worker = await self.pool.acquire(share=True)
+        assert worker is not None
+        return worker, None
+
+    async def _take_worker(self) -> Tuple[Optional[EngineWorker], Optional[asyncio.Task]]:
+        """
+        A worker no session uses, or None if every worker belongs to a
+        connected session. Called under ``_lock``. A worker taken over from
+        a disconnected session comes with that session's save, which the
+        caller passes to _hand_over once it has released the lock.
+        """
+        worker = await self.pool.acquire(share=False)
+        if worker is not None:
+            return worker, None
+
+        # Oldest first: take over the LRU disconnected session's worker,
+        # unless a connected session shares it
+        victim = next(
+            (s for s in self._sessions.values() if s.connections == 0 and s.worker.sessions == 1), None
+        )
+        if victim is None:
+            return None, None
+        save = self._start_save(victim)
+        self._drop(victim)
+        # The worker passes straight to the caller, so its session count stays
+        return victim.worker, save
+
+    async def _hand_over(self, worker: EngineWorker, save: asyncio.Task) -> None:
+        """Let the previous session's save finish, then clear its conversation."""
+        try:
+            await asyncio.shield(save)
+        finally:
+            async with worker.lock:
+                await worker.reset()
+
+    def _drop(self, session: ChatSession) -> None:
+        del self._sessions[session.session_id]
+        self.evicted += 1
+        log.info("evicted session %s after %.0fs idle", session.session_id, session.idle_for())
+
+    async def evict_idle(self) -> int:
+        """Evict disconnected sessions idle longer than ``idle_timeout``."""
+        now = time.monotonic()
+        async with self._lock:
+            expired = [
+                s for s in self._sessions.values()
+                if s.connections == 0 and s.idle_for(now) > self.idle_timeout
+            ]
+            saves = [self._start_save(session) for session in expired]
+            for session in expired:
+                self._drop(session)
+        for session, save in zip(expired, saves):
+            worker = session.worker
+            try:
+                await asyncio.shield(save)
+                # Still held for the dropped session, so no one else has it yet
+                if worker.sessions == 1:
+                    async with worker.lock:
+                        await worker.reset()
+            finally:
+                self.pool.release(worker)
+        if expired:
+            self._freed.set()
+        return len(expired)
+
+    def _start_save(self, session: ChatSession) -> asyncio.Task:
+        """Snapshot ``session`` in the background, or join the save already under way."""
+        task = self._saves.get(session.session_id)
+        if task is None or task.done():
+            task = asyncio.create_task(self._save(session))
+            self._saves[session.session_id] = task
+            task.add_done_callback(self._save_done)
+        return task
+
+    def _save_done(self, task: asyncio.Task) -> None:
+        for session_id, pending in list(self._saves.items()):
+            if pending is task:
+                del self._saves[session_id]
+
+    async def _save(self, session: ChatSession) -> bool:
+        """
+        Snapshot a disconnected session's KV state and history, unless the
+        snapshot is current. Returns whether a save was attempted.
+        """
+        worker = session.worker
+        if not self.store.enabled or not worker.can_save_state or session.turns <= session.saved_turns:
+            return False
+        # A shared worker's conversation is not this session's alone
+        if worker.context is None or worker.sessions > 1:
+            return False
+        async with worker.lock:
+            # The engine writes the state file itself
+            self.store.ensure_directory()
+            saved = await worker.save_state(self.store.state_name(session.session_id))
+            if saved:
+                self.store.save(session.session_id, {"turns": session.turns, "history": worker.context.export()})
+            else:
+                # An older snapshot would resume the session without its latest turns
+                self.store.discard(session.session_id)
+        KV_STATE.labels("saved" if saved else "save_failed").inc()
+        # Not retried until the session has new turns
+        session.saved_turns = session.turns
+        return True
+
+    async def _restore(self, session: ChatSession) -> None:
+        """Bring a saved session back onto its new worker."""
+        if not self.store.enabled or not session.worker.can_save_state:
+            return
+        # The session may have been evicted moments ago and still be saving
+        pending = self._saves.get(session.session_id)
+        if pending is not None:
+            await asyncio.wait({pending})
+        saved = self.store.load(session.session_id)
+        if saved is None:
+            return
+        worker = session.worker
+        if worker.sessions > 1:
+            log.warning("session %s resumed on a shared worker; its saved history is not restored", session.session_id)
+            return
+        start = time.perf_counter()
+        async with worker.lock:
+            await worker.reset()
+            loaded = await worker.load_state(self.store.state_name(session.session_id))
+            for user_msg, reply in saved["history"]:
+                worker.remember(user_msg, reply)
+        mode = "kv" if loaded else "history"
+        KV_STATE.labels("restored" if loaded else "restore_failed").inc()
+        KV_RESUME.labels(mode).observe(time.perf_counter() - start)
+        session.turns = session.saved_turns = saved["turns"]
+        self.restored += 1
+        log.info("restored session %s (%d turns) from its %s", session.session_id, session.turns,
+                 "KV snapshot" if loaded else "history")
+
+    async def snapshot_idle(self) -> int:
+        """Save disconnected sessions idle longer than ``snapshot_idle_s``."""
+        now = time.monotonic()
+        async with self._lock:
+            saves: List[asyncio.Task] = [
+                self._start_save(s) for s in self._sessions.values()
+                if s.connections == 0 and s.idle_for(now) > self.snapshot_idle_s and s.turns > s.saved_turns
+            ]
+        saved = 0
+        for save in saves:
+            saved += await asyncio.shield(save)
+        return saved
+
+    async def sweep(self) -> None:
+        """One pass of the background sweep: snapshot, then evict, idle sessions."""
+        await self.snapshot_idle()
+        await self.evict_idle()
+
+    async def _sweep_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.sweep()
+            except Exception:
+                log.exception("session sweep failed")
+
+    @property
+    def connected(self) -> int:
+        return sum(s.connections > 0 for s in self._sessions.values())
+
+    def snapshot(self) -> Dict[str, int]:
+        return {
+            "sessions": len(self._sessions),
+            "sessions_connected": self.connected,
+            "sessions_created": self.created,
+            "sessions_resumed": self.resumed,
+            "sessions_evicted": self.evicted,
+            "sessions_restored": self.restored,
+        }
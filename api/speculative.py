@@ -0,0 +1,589 @@
+# api/speculative.py
+"""
+Speculative decoding behind the engine interface.
+
+A small draft model proposes ``k`` tokens one at a time; the target model
+scores all of them in a single forward pass and keeps the longest prefix it
+agrees with, plus one token of its own. With sampling, drafts are accepted
+with probability min(1, p/q) and a rejection is resampled from the residual
+max(0, p - q), so the output has exactly the target's distribution; greedy
+decoding (temperature 0) reproduces target-only greedy output token for
+token.
+
+Both models are tiny byte-level transformers that run on CPU, so
+correctness and speedup can be checked without a GPU:
+
+    python -m api.speculative --tokens 200
+    ALSPEC_ENGINE_BACKEND=speculative uvicorn api.server:app --port 8000
+
+Without checkpoints (ALSPEC_SPEC_TARGET_PATH / ALSPEC_SPEC_DRAFT_PATH) the
+weights are random and the text is noise; the draft is then the target
+truncated to its first layers, which agrees with it often enough for
+speculation to pay off.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import codecs
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator, Dict, Iterator, List, Optional, Tuple
+
+import torch
+import torch.nn.functional as F
+from torch import nn
+
+from api.engine import SYSTEM_PROMPT, WARMUP_PROMPT, EngineBackend, EngineWorker
+from api.metrics import CANCEL_LATENCY, SPEC_DRAFT_TOKENS, TOKENS_DISCARDED, turn_cancelled
+
+# Model shapes (ignored for a part that is loaded from a checkpoint).
+SPEC_D_MODEL = int(os.getenv("ALSPEC_SPEC_D_MODEL", "256"))
+SPEC_HEADS = int(os.getenv("ALSPEC_SPEC_HEADS", "4"))
+SPEC_TARGET_LAYERS = int(os.getenv("ALSPEC_SPEC_TARGET_LAYERS", "6"))
+SPEC_DRAFT_LAYERS = int(os.getenv("ALSPEC_SPEC_DRAFT_LAYERS", "1"))
+SPEC_CONTEXT = int(os.getenv("ALSPEC_SPEC_CONTEXT", "1024"))
+SPEC_SEED = int(os.getenv("ALSPEC_SPEC_SEED", "0"))
+SPEC_TARGET_PATH = os.getenv("ALSPEC_SPEC_TARGET_PATH", "")
+SPEC_DRAFT_PATH = os.getenv("ALSPEC_SPEC_DRAFT_PATH", "")
+
+# Draft length: starts at SPEC_K and, when adaptive, moves within
+# [SPEC_K_MIN, SPEC_K_MAX] with the running acceptance rate.
+SPEC_K = int(os.getenv("ALSPEC_SPEC_K", "4"))
+SPEC_K_MIN = int(os.getenv("ALSPEC_SPEC_K_MIN", "1"))
+SPEC_K_MAX = int(os.getenv("ALSPEC_SPEC_K_MAX", "8"))
+SPEC_ADAPTIVE = os.getenv("ALSPEC_SPEC_ADAPTIVE", "1") != "0"
+
+# 0 is greedy; above 0, tokens are sampled at that temperature.
+SPEC_TEMPERATURE = float(os.getenv("ALSPEC_SPEC_TEMPERATURE", "0"))
+MAX_TOKENS = int(os.getenv("ALSPEC_MAX_TOKENS", "256"))
+
+VOCAB_SIZE = 256  # bytes
+EOS = 0  # a NUL byte ends the reply
+
+
+def encode(text: str) -> List[int]:
+    return list(text.encode("utf-8"))
+
+
+class TinyLM(nn.Module):
+    """Byte-level causal transformer (pre-norm, learned positions, no KV cache)."""
+
+    def __init__(
+        self,
+        d_model: int = SPEC_D_MODEL,
+        n_layers: int = SPEC_TARGET_LAYERS,
+        n_heads: int = SPEC_HEADS,
+        max_len: int = SPEC_CONTEXT,
+    ):
+        super().__init__()
+        self.max_len = max_len
+        self.embed = nn.Embedding(VOCAB_SIZE, d_model)
+        self.pos = nn.Embedding(max_len, d_model)
+        self.blocks = nn.ModuleList(
+            nn.TransformerEncoderLayer(
+                d_model, n_heads, 4 * d_model, dropout=0.0, batch_first=True, norm_first=True
+            )
+            for _ in range(n_layers)
+        )
+        self.norm = nn.LayerNorm(d_model)
+        self.head = nn.Linear(d_model, VOCAB_SIZE, bias=False)
+
+    def forward(self, ids: torch.Tensor) -> torch.Tensor:
+        """(1, T) token ids -> (1, T, VOCAB_SIZE) next-token logits."""
+        n = ids.shape[1]
+        x = self.embed(ids) + self.pos(torch.arange(n, device=ids.device))
+        mask = nn.Transformer.generate_square_subsequent_mask(n, device=ids.device)
+        for block in self.blocks:
+            x = block(x, src_mask=mask, is_causal=True)
+        return self.head(self.norm(x))
+
+
+def build_models(
+    d_model: int = SPEC_D_MODEL,
+    n_heads: int = SPEC_HEADS,
+    target_layers: int = SPEC_TARGET_LAYERS,
+    draft_layers: int = SPEC_DRAFT_LAYERS,
+    max_len: int = SPEC_CONTEXT,
+    seed: int = SPEC_SEED,
+    target_path: str = SPEC_TARGET_PATH,
+    draft_path: str = SPEC_DRAFT_PATH,
+) -> Tuple[TinyLM, TinyLM]:
+    """
+    The (target, draft) pair, from checkpoints (state dicts saved with
+    torch.save) where given. A random target uses GPT-2 style scaled
+    residual projections; a random draft is the target's embeddings, first
+    ``draft_layers`` blocks and head.
+    """
+    gen_state = torch.random.get_rng_state()
+    torch.manual_seed(seed)
+    try:
+        target = TinyLM(d_model, target_layers, n_heads, max_len)
+        if target_path:
+            target.load_state_dict(torch.load(target_path, map_location="cpu"))
+        else:
+            scale = (2 * target_layers) ** -0.5
+            with torch.no_grad():
+                for block in target.blocks:
+                    block.self_attn.out_proj.weight.mul_(scale)
+                    block.linear2.weight.mul_(scale)
+                    block.linear2.bias.mul_(scale)
+
+        draft = TinyLM(d_model, draft_layers, n_heads, max_len)
+        if draft_path:
+            draft.load_state_dict(torch.load(draft_path, map_location="cpu"))
+        else:
+            # Keys for blocks the draft does not have are ignored
+            draft.load_state_dict(target.state_dict(), strict=False)
+    finally:
+        torch.random.set_rng_state(gen_state)
+    return target.eval(), draft.eval()
+
+
+class AdaptiveDraftLength:
+    """
+    Picks the draft length k from the running acceptance rate.
+
+    With per-token acceptance probability a, a pass over k drafts yields
+    (1 - a^(k+1)) / (1 - a) tokens on average and costs k draft steps plus
+    one target pass. k is the length that maximizes tokens per unit of cost,
+    given the measured cost of a draft step relative to a target pass.
+    Acceptance and cost are exponential moving averages.
+    """
+
+    def __init__(
+        self,
+        k: int = SPEC_K,
+        k_min: int = SPEC_K_MIN,
+        k_max: int = SPEC_K_MAX,
+        adaptive: bool = SPEC_ADAPTIVE,
+        decay: float = 0.9,
+    ):
+        if not 1 <= k_min <= k_max:
+            raise ValueError(f"invalid draft length bounds: k_min={k_min}, k_max={k_max}")
+        self.k = min(max(k, k_min), k_max)
+        self.k_min = k_min
+        self.k_max = k_max
+        self.adaptive = adaptive
+        self.decay = decay
+        # Pseudo-counts for the acceptance estimate: accepted drafts and
+        # drafts examined (each pass examines its accepted drafts plus the
+        # one that was rejected, if any).
+        self._accepted = 2.0
+        self._examined = 3.0
+        self.cost_ratio: Optional[float] = None
+
+    @property
+    def acceptance(self) -> float:
+        return self._accepted / self._examined
+
+    @staticmethod
+    def expected_tokens(a: float, k: int) -> float:
+        if a >= 1.0:
+            return k + 1.0
+        return (1.0 - a ** (k + 1)) / (1.0 - a)
+
+    def update(self, proposed: int, accepted: int, draft_step_s: float, target_pass_s: float) -> int:
+        if proposed:
+            examined = accepted + (1 if accepted < proposed else 0)
+            self._accepted = self.decay * self._accepted + accepted
+            self._examined = self.decay * self._examined + examined
+        if draft_step_s > 0 and target_pass_s > 0:
+            ratio = draft_step_s / target_pass_s
+            self.cost_ratio = ratio if self.cost_ratio is None else (
+                self.decay * self.cost_ratio + (1 - self.decay) * ratio
+            )
+        if self.adaptive and self.cost_ratio is not None:
+            a = min(self.acceptance, 0.99)
+            c = self.cost_ratio
+            self.k = max(
+                range(self.k_min, self.k_max + 1),
+                key=lambda k: self.expected_tokens(a, k) / (1.0 + c * k),
+            )
+        return self.k
+
+
+@dataclass
+class SpecStats:
+    """Per-turn speculation counters."""
+
+    tokens: int = 0
+    proposed: int = 0
+    accepted: int = 0
+    target_passes: int = 0
+    draft_steps: int = 0
+    target_s: float = 0.0
+    draft_s: float = 0.0
+    elapsed_s: float = 0.0
+    k: int = 0
+
+    @property
+    def acceptance_rate(self) -> Optional[float]:
+        return self.accepted / self.proposed if self.proposed else None
+
+    @property
+    def wasted(self) -> int:
+        """Draft tokens that were computed and thrown away."""
+        return self.proposed - self.accepted
+
+    @property
+    def est_speedup(self) -> Optional[float]:
+        """
+        Estimated speedup over target-only decoding, which would take one
+        target pass per token. Without a KV cache a pass costs about the
+        same for one token as for k + 1.
+        """
+        if not self.target_passes or self.elapsed_s <= 0:
+            return None
+        return self.tokens * (self.target_s / self.target_passes) / self.elapsed_s
+
+    def as_dict(self) -> Dict[str, Any]:
+        def r(value: Optional[float], digits: int = 3) -> Optional[float]:
+            return None if value is None else round(value, digits)
+
+        return {
+            "tokens": self.tokens,
+            "draft_proposed": self.proposed,
+            "draft_accepted": self.accepted,
+            "draft_wasted": self.wasted,
+            "acceptance_rate": r(self.acceptance_rate),
+            "target_passes": self.target_passes,
+            "tokens_per_pass": r(self.tokens / self.target_passes if self.target_passes else None),
+            "draft_ms": r(1000.0 * self.draft_s),
+            "target_ms": r(1000.0 * self.target_s),
+            "est_speedup": r(self.est_speedup),
+            "k": self.k,
+        }
+
+
+class SpeculativeDecoder:
+    """
+    Draft/target decoding loop. ``steps()`` yields the tokens produced by
+    each verify pass; ``stats`` describes the last (or current) run.
+    """
+
+    def __init__(
+        self,
+        target: TinyLM,
+        draft: TinyLM,
+        policy: Optional[AdaptiveDraftLength] = None,
+        temperature: float = SPEC_TEMPERATURE,
+        seed: Optional[int] = None,
+    ):
+        self.target = target
+        self.draft = draft
+        self.policy = policy if policy is not None else AdaptiveDraftLength()
+        self.temperature = temperature
+        self.generator = torch.Generator()
+        if seed is not None:
+            self.generator.manual_seed(seed)
+        self.stats = SpecStats()
+
+    @property
+    def max_len(self) -> int:
+        return min(self.target.max_len, self.draft.max_len)
+
+    def _probs(self, logits: torch.Tensor) -> torch.Tensor:
+        return F.softmax(logits / self.temperature, dim=-1)
+
+    def _pick(self, logits: torch.Tensor) -> Tuple[int, Optional[torch.Tensor]]:
+        """Next token from one row of logits, and the distribution it was drawn from."""
+        if self.temperature <= 0:
+            return int(logits.argmax()), None
+        probs = self._probs(logits)
+        return int(torch.multinomial(probs, 1, generator=self.generator)), probs
+
+    def _verify(
+        self, drafts: List[int], draft_probs: List[Optional[torch.Tensor]], logits: torch.Tensor
+    ) -> List[int]:
+        """
+        Tokens kept from one pass: the accepted drafts, then either the
+        target's correction at the first rejection or a bonus token after
+        the last draft. ``logits`` has one row per draft plus one.
+        """
+        out: List[int] = []
+        for i, token in enumerate(drafts):
+            if self.temperature <= 0:
+                best = int(logits[i].argmax())
+                if best != token:
+                    out.append(best)
+                    return out
+            else:
+                p = self._probs(logits[i])
+                q = draft_probs[i]
+                if float(torch.rand(1, generator=self.generator)) * float(q[token]) >= float(p[token]):
+                    residual = torch.clamp(p - q, min=0.0)
+                    total = float(residual.sum())
+                    residual = residual / total if total > 0 else p
+                    out.append(int(torch.multinomial(residual, 1, generator=self.generator)))
+                    return out
+            out.append(token)
+        out.append(self._pick(logits[len(drafts)])[0])
+        return out
+
+    @torch.no_grad()
+    def steps(self, ids: List[int], max_new_tokens: int = MAX_TOKENS) -> Iterator[List[int]]:
+        """Decode up to ``max_new_tokens`` after ``ids``, stopping after EOS."""
+        # Drafts never run past the last new token, so this is the longest sequence
+        if len(ids) + max_new_tokens > self.max_len:
+            raise ValueError(
+                f"{len(ids)} prompt tokens + {max_new_tokens} new do not fit "
+                f"in a context of {self.max_len}"
+            )
+        stats = self.stats = SpecStats(k=self.policy.k)
+        start = time.perf_counter()
+        seq = torch.tensor([ids], dtype=torch.long)
+        while stats.tokens < max_new_tokens:
+            n = seq.shape[1]
+            k = min(self.policy.k, max_new_tokens - stats.tokens - 1)
+
+            t0 = time.perf_counter()
+            drafts: List[int] = []
+            draft_probs: List[Optional[torch.Tensor]] = []
+            x = seq
+            for _ in range(k):
+                token, probs = self._pick(self.draft(x)[0, -1])
+                drafts.append(token)
+                draft_probs.append(probs)
+                x = torch.cat([x, torch.tensor([[token]], dtype=torch.long)], dim=1)
+            t1 = time.perf_counter()
+            logits = self.target(x)[0, n - 1:]
+            t2 = time.perf_counter()
+
+            tokens = self._verify(drafts, draft_probs, logits)
+            accepted = len(tokens) - 1
+            if EOS in tokens:
+                tokens = tokens[:tokens.index(EOS) + 1]
+            tokens = tokens[:max_new_tokens - stats.tokens]
+
+            stats.proposed += k
+            stats.accepted += accepted
+            stats.draft_steps += k
+            stats.target_passes += 1
+            stats.draft_s += t1 - t0
+            stats.target_s += t2 - t1
+            stats.tokens += len(tokens)
+            SPEC_DRAFT_TOKENS.labels("accepted").inc(accepted)
+            SPEC_DRAFT_TOKENS.labels("rejected").inc(k - accepted)
+            stats.k = self.policy.update(k, accepted, (t1 - t0) / k if k else 0.0, t2 - t1)
+            stats.elapsed_s = time.perf_counter() - start
+
+            seq = torch.cat([seq, torch.tensor([tokens], dtype=torch.long)], dim=1)
+            yield tokens
+            if tokens[-1] == EOS:
+                break
+        stats.elapsed_s = time.perf_counter() - start
+
+    def generate(self, ids: List[int], max_new_tokens: int = MAX_TOKENS) -> List[int]:
+        return [t for tokens in self.steps(ids, max_new_tokens) for t in tokens]
+
+
+@torch.no_grad()
+def autoregressive(
+    model: TinyLM,
+    ids: List[int],
+    max_new_tokens: int = MAX_TOKENS,
+    temperature: float = 0.0,
+    generator: Optional[torch.Generator] = None,
+) -> List[int]:
+    """Target-only decoding, one pass per token: the baseline speculation is measured against."""
+    seq = torch.tensor([ids], dtype=torch.long)
+    out: List[int] = []
+    for _ in range(max_new_tokens):
+        logits = model(seq)[0, -1]
+        if temperature <= 0:
+            token = int(logits.argmax())
+        else:
+            token = int(torch.multinomial(F.softmax(logits / temperature, dim=-1), 1, generator=generator))
+        out.append(token)
+        if token == EOS:
+            break
+        seq = torch.cat([seq, torch.tensor([[token]], dtype=torch.long)], dim=1)
+    return out
+
+
+class SpeculativeBackend(EngineBackend):
+    """
+    Runs speculative decoding in-process on CPU. The models are built once
+    and shared read-only by all workers; each worker has its own decoder,
+    so its draft length adapts to its own conversation.
+    """
+
+    name = "speculative"
+
+    def __init__(self, max_new_tokens: int = MAX_TOKENS, temperature: float = SPEC_TEMPERATURE):
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.model = "speculative:{}/{}".format(
+            os.path.basename(SPEC_TARGET_PATH) or f"tiny-{SPEC_TARGET_LAYERS}L",
+            os.path.basename(SPEC_DRAFT_PATH) or f"tiny-{SPEC_DRAFT_LAYERS}L",
+        )
+        self.models: Optional[Tuple[TinyLM, TinyLM]] = None
+        self._lock = asyncio.Lock()
+
+    async def load(self) -> Tuple[TinyLM, TinyLM]:
+        async with self._lock:
+            if self.models is None:
+                self.models = await asyncio.to_thread(build_models)
+        return self.models
+
+    def create_worker(self, worker_id: int) -> EngineWorker:
+        return SpeculativeWorker(worker_id, self)
+
+
+class SpeculativeWorker(EngineWorker):
+    """
+    One conversation, kept as byte tokens. The prompt is rebuilt from the
+    history every turn (the tiny models have no KV cache), trimmed after the
+    system prompt so the turn always fits in the context window.
+    """
+
+    def __init__(self, worker_id: int, backend: SpeculativeBackend):
+        super().__init__(worker_id)
+        self.backend = backend
+        self.decoder: Optional[SpeculativeDecoder] = None
+        self.history: List[int] = []
+        self.last_stats: Dict[str, Any] = {}
+
+    @property
+    def failed(self) -> bool:
+        return False
+
+    def is_alive(self) -> bool:
+        return self.decoder is not None
+
+    async def start(self) -> None:
+        if self.decoder is None:
+            target, draft = await self.backend.load()
+            self.decoder = SpeculativeDecoder(target, draft, temperature=self.backend.temperature)
+        self.history = encode(f"System: {SYSTEM_PROMPT}\n")
+        if WARMUP_PROMPT and not self._ready:
+            async for _ in self.generate(WARMUP_PROMPT):
+                pass
+            self.history = encode(f"System: {SYSTEM_PROMPT}\n")
+        self._ready = True
+
+    async def stop(self) -> None:
+        self.decoder = None
+        self._ready = False
+
+    def remember(self, user_msg: str, reply: str) -> None:
+        self.history += encode(f"User: {user_msg}\nAssistant: {reply}\n")
+
+    async def reset(self) -> None:
+        self.history = encode(f"System: {SYSTEM_PROMPT}\n")
+
+    def turn_stats(self) -> Dict[str, Any]:
+        return self.last_stats
+
+    async def generate(self, user_msg: str) -> AsyncGenerator[str, None]:
+        if self.decoder is None:
+            await self.start()
+        decoder = self.decoder
+        max_new = self.backend.max_new_tokens
+        prompt = self.history + encode(f"User: {user_msg}\nAssistant: ")
+        room = max(decoder.max_len - max_new, 1)
+        if len(prompt) > room:
+            # Drop the oldest history, keeping the system prompt
+            system = encode(f"System: {SYSTEM_PROMPT}\n")
+            prompt = system + prompt[len(system):][-max(room - len(system), 1):]
+
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        cancelled = threading.Event()
+
+        def run() -> None:
+            try:
+                for tokens in decoder.steps(prompt, max_new):
+                    loop.call_soon_threadsafe(queue.put_nowait, tokens)
+                    if cancelled.is_set():
+                        break
+            except BaseException as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            else:
+                loop.call_soon_threadsafe(queue.put_nowait, None)
+
+        worker = loop.run_in_executor(None, run)
+        text = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        reply: List[int] = []
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                reply += item
+                chunk = text.decode(bytes(t for t in item if t != EOS))
+                if chunk:
+                    yield chunk
+            tail = text.decode(b"", final=True)
+            if tail:
+                yield tail
+        except (asyncio.CancelledError, GeneratorExit):
+            cancelled.set()
+            stopped = time.monotonic()
+            await asyncio.shield(worker)
+            CANCEL_LATENCY.labels("speculative").observe(time.monotonic() - stopped)
+            # Steps the decoder finished after the cancel, which nobody read
+            while not queue.empty():
+                item = queue.get_nowait()
+                if isinstance(item, list):
+                    TOKENS_DISCARDED.labels("speculative").inc(len(item))
+            turn_cancelled("speculative", len(reply), max_new)
+            raise
+        finally:
+            # Stop decoding if the consumer went away mid-turn
+            cancelled.set()
+            await asyncio.shield(worker)
+            self.last_stats = decoder.stats.as_dict()
+            self.history = prompt + [t for t in reply if t != EOS] + encode("\n")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare speculative and target-only decoding on CPU")
+    parser.add_argument("--prompt", default="User: Tell me about speculative decoding.\nAssistant: ")
+    parser.add_argument("--tokens", type=int, default=200)
+    parser.add_argument("--temperature", type=float, default=0.0)
+    parser.add_argument("--k", type=int, default=SPEC_K)
+    parser.add_argument("--fixed-k", action="store_true", help="disable draft length adaptation")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    target, draft = build_models()
+    ids = encode(args.prompt)
+    policy = AdaptiveDraftLength(k=args.k, adaptive=not args.fixed_k)
+    decoder = SpeculativeDecoder(target, draft, policy, temperature=args.temperature, seed=args.seed)
+
+    # Warm up both paths so the first timed run is not paying for allocation
+    autoregressive(target, ids, 4)
+    decoder.generate(ids, 4)
+
+    start = time.perf_counter()
+    generator = torch.Generator().manual_seed(args.seed)
+    baseline = autoregressive(target, ids, args.tokens, args.temperature, generator)
+    baseline_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    speculative = decoder.generate(ids, args.tokens)
+    speculative_s = time.perf_counter() - start
+    stats = decoder.stats
+
+    print(f"Target-only: {len(baseline)} tokens in {baseline_s:.3f}s "
+          f"({len(baseline) / baseline_s:.1f} tok/s)")
+    print(f"Speculative: {len(speculative)} tokens in {speculative_s:.3f}s "
+          f"({len(speculative) / speculative_s:.1f} tok/s)")
+    print(f"  Speedup: {baseline_s / speculative_s:.2f}x (estimated {stats.est_speedup:.2f}x)")
+    print(f"  Acceptance: {100.0 * (stats.acceptance_rate or 0.0):.1f}% "
+          f"({stats.accepted}/{stats.proposed} drafts, {stats.wasted} wasted)")
+    print(f"  Target passes: {stats.target_passes} ({stats.tokens / stats.target_passes:.2f} tokens/pass), "
+          f"final k={stats.k}")
+    if args.temperature <= 0:
+        match = "identical" if speculative == baseline else "DIFFERENT"
+        print(f"  Greedy output vs target-only: {match}")
+
+
+if __name__ == "__main__":
+    main()
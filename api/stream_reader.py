@@ -0,0 +1,117 @@
+# api/stream_reader.py
+from __future__ import annotations
+
+import asyncio
+import codecs
+import os
+from typing import AsyncGenerator
+
+# llama-cli prints this when it is waiting for the next user turn.
+PROMPT_SENTINEL = "\n> "
+
+# Bytes requested per stdout read. read() returns whatever is available up to
+# this size, so a larger value only means fewer, bigger chunks under load.
+READ_SIZE = int(os.getenv("ALSPEC_READ_SIZE", "1024"))
+
+
+class SentinelMatcher:
+    """
+    Finds an end-of-turn sentinel in streamed text with constant work per chunk.
+
+    Instead of rescanning everything seen so far, only the current chunk plus
+    the few characters held back from the previous one (a possible partial
+    sentinel) are searched. Text is released as soon as it cannot be part of
+    the sentinel, and the sentinel itself is never emitted.
+
+    The start of the stream counts as a line start, so a turn that begins
+    with the bare prompt ("> ") also matches.
+    """
+
+    def __init__(self, sentinel: str = PROMPT_SENTINEL):
+        if not sentinel:
+            raise ValueError("sentinel must be non-empty")
+        self.sentinel = sentinel
+        self._line_sentinel = sentinel.lstrip("\n")
+        self._pending = ""
+        self._at_start = True
+        self.matched = False
+
+    def feed(self, text: str) -> str:
+        """Consume ``text`` and return the part that is safe to emit."""
+        if self.matched:
+            return ""
+        window = self._pending + text
+
+        if self._at_start and self._line_sentinel != self.sentinel:
+            if window.startswith(self._line_sentinel):
+                self.matched = True
+                self._pending = ""
+                return ""
+            if self._line_sentinel.startswith(window):
+                self._pending = window
+                return ""
+        if window:
+            self._at_start = False
+
+        idx = window.find(self.sentinel)
+        if idx != -1:
+            self.matched = True
+            self._pending = ""
+            return window[:idx]
+
+        # Hold back the longest suffix that could still start the sentinel.
+        keep = 0
+        for k in range(min(len(self.sentinel) - 1, len(window)), 0, -1):
+            if window.endswith(self.sentinel[:k]):
+                keep = k
+                break
+        self._pending = window[len(window) - keep:]
+        return window[: len(window) - keep]
+
+    def flush(self) -> str:
+        """Return any held-back text (used when the stream ends without a match)."""
+        text, self._pending = self._pending, ""
+        return text
+
+
+class TurnReader:
+    """
+    Streams one REPL turn from a subprocess pipe.
+
+    Bytes are decoded with an incremental UTF-8 decoder so multi-byte
+    characters split across reads are kept intact, and the end of the turn is
+    detected by a ``SentinelMatcher``. After iteration, ``matched`` tells
+    whether the prompt came back and ``eof`` whether the pipe closed instead.
+    """
+
+    def __init__(
+        self,
+        stream: asyncio.StreamReader,
+        sentinel: str = PROMPT_SENTINEL,
+        read_size: int = READ_SIZE,
+    ):
+        self.stream = stream
+        self.read_size = read_size
+        self.matcher = SentinelMatcher(sentinel)
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.eof = False
+
+    @property
+    def matched(self) -> bool:
+        return self.matcher.matched
+
+    async def __aiter__(self) -> AsyncGenerator[str, None]:
+        while not self.matcher.matched:
+            chunk = await self.stream.read(self.read_size)
+            if not chunk:
+                # Process ended unexpectedly.
+                self.eof = True
+                tail = self.matcher.feed(self.decoder.decode(b"", final=True))
+                tail += self.matcher.flush()
+                if tail:
+                    yield tail
+                return
+
+            text = self.matcher.feed(self.decoder.decode(chunk))
+            if text:
+                yield text
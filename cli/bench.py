@@ -0,0 +1,373 @@
+import asyncio
+import csv
+import json
+import math
+import os
+import time
+from dataclasses import asdict, dataclass, field, fields
+from typing import Dict, List, Optional
+
+import httpx
+import websockets
+
+APP_SERVER_URL = os.getenv("APP_SERVER_URL", "http://localhost:8000")
+
+END_OF_RESPONSE = "[[END_OF_RESPONSE]]"
+BUSY = "[[BUSY]]"
+
+
+@dataclass
+class Sample:
+    request_id: int
+    worker: int
+    phase: str              # "ramp" or "steady"
+    scheduled_s: float      # when the request was due, relative to bench start
+    queue_ms: float         # time spent waiting for a free connection
+    ttft_ms: Optional[float]
+    e2e_ms: float
+    tokens: int
+    itl_mean_ms: Optional[float]
+    ok: bool
+    error: str = ""
+    itl_ms: List[float] = field(default_factory=list, repr=False)
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """Nearest-rank percentile; None for an empty list."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class ChatTarget:
+    """One persistent /ws/chat session per connection; a request is one turn."""
+
+    name = "chat"
+
+    def __init__(self, base_url: str, prompt: str, protocol: str = "text"):
+        self.url = base_url.replace("http", "ws", 1) + "/ws/chat"
+        self.prompt = prompt
+        self.protocol = protocol
+        if protocol == "json":
+            self.url += "?protocol=json"
+
+    async def connect(self):
+        return await websockets.connect(self.url, max_size=None)
+
+    async def close(self, conn) -> None:
+        await conn.close()
+
+    async def request(self, conn, on_token) -> None:
+        if self.protocol == "json":
+            await self._request_json(conn, on_token)
+            return
+        await conn.send(self.prompt)
+        while True:
+            frame = await conn.recv()
+            if frame == END_OF_RESPONSE:
+                return
+            if frame.startswith(BUSY):
+                # The server still closes the turn with END_OF_RESPONSE
+                while await conn.recv() != END_OF_RESPONSE:
+                    pass
+                raise RuntimeError("busy")
+            on_token()
+
+    async def _request_json(self, conn, on_token) -> None:
+        await conn.send(json.dumps({"type": "message", "text": self.prompt}))
+        while True:
+            message = json.loads(await conn.recv())
+            if message["type"] == "delta":
+                on_token()
+            elif message["type"] == "end":
+                if message.get("status", "ok") != "ok":
+                    raise RuntimeError(message["status"])
+                return
+
+
+class InferenceTarget:
+    """Streamed /inference requests (server-sent events) over one pooled client."""
+
+    name = "inference"
+
+    def __init__(self, base_url: str, prompt: str, model: str, connections: int):
+        self.payload = {"model_name": model, "input": prompt, "batch_size": 1, "stream": True}
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            limits=httpx.Limits(max_connections=connections,
+                                max_keepalive_connections=connections),
+            timeout=httpx.Timeout(120.0, connect=5.0),
+        )
+
+    async def connect(self):
+        return self.client
+
+    async def close(self, conn) -> None:
+        pass
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+    async def request(self, conn, on_token) -> None:
+        async with conn.stream("POST", "/inference", json=self.payload) as response:
+            if response.status_code >= 400:
+                raise RuntimeError(f"HTTP {response.status_code}")
+            event = None
+            async for line in response.aiter_lines():
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:"):
+                    if event == "token":
+                        on_token()
+                    elif event == "error":
+                        raise RuntimeError(json.loads(line[len("data:"):]).get("error", "stream error"))
+                    elif event == "done":
+                        return
+        raise RuntimeError("stream ended without done event")
+
+
+class LoadGenerator:
+    """
+    Drives a target with either a fixed concurrency (closed loop: each of
+    ``concurrency`` workers sends its next request as soon as the previous
+    one finishes) or a fixed request rate (open loop: requests are due on a
+    schedule and take the next free connection, at most ``concurrency`` in
+    flight).
+
+    During ``ramp_up_s`` workers are started gradually, or the rate climbs
+    linearly from zero; those requests are tagged ``phase="ramp"`` and left
+    out of the summary. Latencies are measured from when a request was due,
+    so time spent waiting for a connection in rate mode is not hidden.
+    """
+
+    def __init__(self, target, concurrency: int, rate: Optional[float],
+                 requests: Optional[int], duration_s: Optional[float], ramp_up_s: float):
+        self.target = target
+        self.concurrency = max(1, concurrency)
+        self.rate = rate
+        self.requests = requests
+        self.duration_s = duration_s
+        self.ramp_up_s = max(0.0, ramp_up_s)
+        self.samples: List[Sample] = []
+        self._issued = 0
+        self._start = 0.0
+
+    def _now(self) -> float:
+        return time.perf_counter() - self._start
+
+    def _more(self) -> bool:
+        if self.requests is not None and self._issued >= self.requests:
+            return False
+        if self.duration_s is not None and self._now() >= self.ramp_up_s + self.duration_s:
+            return False
+        return True
+
+    def _next_id(self) -> int:
+        self._issued += 1
+        return self._issued - 1
+
+    async def run(self) -> float:
+        self._start = time.perf_counter()
+        if self.rate:
+            await self._run_rate()
+        else:
+            await self._run_concurrency()
+        return self._now()
+
+    async def _measure(self, conn, request_id: int, worker: int, scheduled: float) -> Sample:
+        started = self._now()
+        token_times: List[float] = []
+        error = ""
+        try:
+            await self.target.request(conn, lambda: token_times.append(time.perf_counter()))
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        end = self._now()
+        base = self._start + scheduled
+        itl = [1000.0 * (b - a) for a, b in zip(token_times, token_times[1:])]
+        sample = Sample(
+            request_id=request_id,
+            worker=worker,
+            phase="ramp" if scheduled < self.ramp_up_s else "steady",
+            scheduled_s=scheduled,
+            queue_ms=1000.0 * (started - scheduled),
+            ttft_ms=1000.0 * (token_times[0] - base) if token_times else None,
+            e2e_ms=1000.0 * (end - scheduled),
+            tokens=len(token_times),
+            itl_mean_ms=sum(itl) / len(itl) if itl else None,
+            ok=not error,
+            error=error,
+            itl_ms=itl,
+        )
+        self.samples.append(sample)
+        return sample
+
+    async def _run_concurrency(self) -> None:
+        async def worker(index: int) -> None:
+            if self.ramp_up_s:
+                await asyncio.sleep(self.ramp_up_s * index / self.concurrency)
+            conn = None
+            try:
+                while self._more():
+                    request_id = self._next_id()
+                    if conn is None:
+                        try:
+                            conn = await self.target.connect()
+                        except Exception as e:
+                            self._failed(request_id, index, f"connect: {e}")
+                            await asyncio.sleep(0.1)
+                            continue
+                    sample = await self._measure(conn, request_id, index, self._now())
+                    if not sample.ok and self.target.name == "chat":
+                        # The session may be broken; reconnect for the next turn
+                        await self._close_quietly(conn)
+                        conn = None
+            finally:
+                if conn is not None:
+                    await self._close_quietly(conn)
+
+        await asyncio.gather(*(worker(i) for i in range(self.concurrency)))
+
+    async def _run_rate(self) -> None:
+        free: "asyncio.Queue" = asyncio.Queue()
+        for index in range(self.concurrency):
+            free.put_nowait((index, None))
+        tasks = []
+
+        async def one(request_id: int, scheduled: float) -> None:
+            index, conn = await free.get()
+            try:
+                if conn is None:
+                    conn = await self.target.connect()
+                sample = await self._measure(conn, request_id, index, scheduled)
+                if not sample.ok and self.target.name == "chat":
+                    await self._close_quietly(conn)
+                    conn = None
+            except Exception as e:
+                self._failed(request_id, index, f"connect: {e}", scheduled)
+                conn = None
+            finally:
+                free.put_nowait((index, conn))
+
+        due = 0.0
+        while self._more():
+            delay = due - self._now()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if not self._more():
+                break
+            tasks.append(asyncio.create_task(one(self._next_id(), due)))
+            # Linear ramp: the instantaneous rate grows from 0 to self.rate
+            ramp = min(1.0, (due + 1e-3) / self.ramp_up_s) if self.ramp_up_s else 1.0
+            due += 1.0 / (self.rate * max(ramp, 0.05))
+        await asyncio.gather(*tasks)
+        while not free.empty():
+            _, conn = free.get_nowait()
+            if conn is not None:
+                await self._close_quietly(conn)
+
+    def _failed(self, request_id: int, worker: int, error: str,
+                scheduled: Optional[float] = None) -> None:
+        scheduled = self._now() if scheduled is None else scheduled
+        self.samples.append(Sample(
+            request_id=request_id, worker=worker,
+            phase="ramp" if scheduled < self.ramp_up_s else "steady",
+            scheduled_s=scheduled, queue_ms=0.0, ttft_ms=None,
+            e2e_ms=1000.0 * (self._now() - scheduled), tokens=0,
+            itl_mean_ms=None, ok=False, error=error,
+        ))
+
+    async def _close_quietly(self, conn) -> None:
+        try:
+            await self.target.close(conn)
+        except Exception:
+            pass
+
+
+def summarize(samples: List[Sample], elapsed_s: float, ramp_up_s: float) -> Dict[str, object]:
+    steady = [s for s in samples if s.phase == "steady"]
+    if steady:
+        window_s = max(1e-9, elapsed_s - ramp_up_s)
+    else:
+        # Everything happened during the ramp; report it rather than nothing
+        steady, window_s = samples, max(1e-9, elapsed_s)
+    ok = [s for s in steady if s.ok]
+    errors: Dict[str, int] = {}
+    for s in steady:
+        if not s.ok:
+            errors[s.error] = errors.get(s.error, 0) + 1
+
+    def pcts(values: List[float]) -> Dict[str, Optional[float]]:
+        return {f"p{p}": percentile(values, p) for p in (50, 95, 99)}
+
+    tokens = sum(s.tokens for s in ok)
+    return {
+        "requests": len(steady),
+        "ok": len(ok),
+        "errors": len(steady) - len(ok),
+        "error_counts": errors,
+        "elapsed_s": window_s,
+        "requests_per_s": len(ok) / window_s,
+        "tokens": tokens,
+        "tokens_per_s": tokens / window_s,
+        "ttft_ms": pcts([s.ttft_ms for s in ok if s.ttft_ms is not None]),
+        "itl_ms": pcts([gap for s in ok for gap in s.itl_ms]),
+        "e2e_ms": pcts([s.e2e_ms for s in ok]),
+    }
+
+
+def write_csv(path: str, samples: List[Sample]) -> None:
+    columns = [f.name for f in fields(Sample) if f.name != "itl_ms"]
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        for s in sorted(samples, key=lambda s: s.request_id):
+            row = asdict(s)
+            row.pop("itl_ms")
+            writer.writerow(row)
+
+
+def _fmt(p: Dict[str, Optional[float]]) -> str:
+    return "  ".join(f"{k}={v:.1f}" if v is not None else f"{k}=n/a" for k, v in p.items())
+
+
+async def run_bench(target: str = "chat", url: Optional[str] = None, concurrency: int = 8,
+                    rate: Optional[float] = None, requests: Optional[int] = None,
+                    duration: Optional[float] = None, ramp_up: float = 0.0,
+                    prompt: str = "Hello from the benchmark", model: str = "demo-base",
+                    csv_path: Optional[str] = None, protocol: str = "text") -> Dict[str, object]:
+    base_url = (url or APP_SERVER_URL).rstrip("/")
+    if requests is None and duration is None:
+        requests = 100
+    if target == "chat":
+        tgt = ChatTarget(base_url, prompt, protocol)
+    else:
+        tgt = InferenceTarget(base_url, prompt, model, concurrency)
+
+    mode = f"rate {rate}/s (max {concurrency} in flight)" if rate else f"concurrency {concurrency}"
+    limit = f"{requests} requests" if requests is not None else f"{duration}s"
+    print(f"BENCH: {tgt.name} at {base_url}, {mode}, {limit}, ramp-up {ramp_up}s")
+
+    gen = LoadGenerator(tgt, concurrency, rate, requests, duration, ramp_up)
+    try:
+        elapsed = await gen.run()
+    finally:
+        if isinstance(tgt, InferenceTarget):
+            await tgt.aclose()
+
+    summary = summarize(gen.samples, elapsed, ramp_up)
+    print("RESULTS:")
+    print(f"  Requests: {summary['requests']} ({summary['ok']} ok, {summary['errors']} errors)")
+    for error, count in summary["error_counts"].items():
+        print(f"    {count} x {error}")
+    print(f"  Throughput: {summary['requests_per_s']:.2f} req/s, {summary['tokens_per_s']:.1f} tokens/s")
+    print(f"  TTFT (ms):        {_fmt(summary['ttft_ms'])}")
+    print(f"  Inter-token (ms): {_fmt(summary['itl_ms'])}")
+    print(f"  End-to-end (ms):  {_fmt(summary['e2e_ms'])}")
+    print(f"  Time: {elapsed:.3f}s")
+    if csv_path:
+        write_csv(csv_path, gen.samples)
+        print(f"  Samples: {csv_path}")
+    return summary
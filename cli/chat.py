@@ -1,32 +1,328 @@
 import asyncio
+import json
+import signal
+import threading
+import time
 import websockets
 import os
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, List, Optional, Tuple
+from urllib.parse import urlencode
 
 # Default to localhost for local tests; override with APP_SERVER_URL when
 # talking to Marshall's server.
 APP_SERVER_URL = os.getenv("APP_SERVER_URL", "http://localhost:8000")
 WS_URL = APP_SERVER_URL.replace("http", "ws") + "/ws/chat"
 
+END_OF_RESPONSE = "[[END_OF_RESPONSE]]"
+BUSY = "[[BUSY]]"
+STOP = "[[STOP]]"
+# Messages the server holds per connection; more than that in flight are answered busy
+INBOX_MESSAGES = int(os.getenv("ALSPEC_INBOX_MESSAGES", "16"))
 
-async def chat_session():
+
+@dataclass
+class Turn:
+    """Client-side timing for one turn."""
+
+    prompt: str
+    started_at: float
+    first_token_at: Optional[float] = None
+    ended_at: Optional[float] = None
+    chunks: List[str] = field(default_factory=list)
+    status: str = "ok"
+    server: dict = field(default_factory=dict)
+
+    @property
+    def ttft_ms(self) -> Optional[float]:
+        if self.first_token_at is None:
+            return None
+        return 1000.0 * (self.first_token_at - self.started_at)
+
+    @property
+    def total_s(self) -> float:
+        return (self.ended_at or time.perf_counter()) - self.started_at
+
+    @property
+    def tokens(self) -> int:
+        # Frames may be coalesced; the JSON protocol reports the real count
+        return self.server.get("chunks", len(self.chunks))
+
+    @property
+    def tokens_per_s(self) -> Optional[float]:
+        if self.first_token_at is None or self.ended_at is None or self.tokens < 2:
+            return None
+        decode_s = self.ended_at - self.first_token_at
+        return (self.tokens - 1) / decode_s if decode_s > 0 else None
+
+    def summary(self) -> str:
+        ttft = f"{self.ttft_ms:.0f} ms" if self.ttft_ms is not None else "n/a"
+        rate = f"{self.tokens_per_s:.1f} tok/s" if self.tokens_per_s is not None else "n/a tok/s"
+        text = f"first token {ttft}, {rate}, {self.tokens} tokens in {self.total_s:.2f}s"
+        engine = self.server.get("engine") or {}
+        if engine.get("acceptance_rate") is not None:
+            text += (f", draft acceptance {100.0 * engine['acceptance_rate']:.0f}%"
+                     f" ({engine['draft_wasted']} wasted, k={engine['k']})")
+            if engine.get("est_speedup") is not None:
+                text += f", ~{engine['est_speedup']:.2f}x speedup"
+        context = self.server.get("context") or {}
+        if context:
+            text += f", context {context['context_tokens']}/{context['context_budget']} tokens"
+            trimmed = context.get("turns_compacted", 0) + context.get("turns_dropped", 0)
+            if trimmed:
+                text += (f" ({context.get('turns_compacted', 0)} old turns compacted,"
+                         f" {context.get('turns_dropped', 0)} dropped)")
+        return text if self.status == "ok" else f"{self.status}; {text}"
+
+
+class ChatConnection:
+    """
+    Sends prompts and turns incoming frames into events for either protocol:
+    ("delta", text), ("busy", text), ("error", text) and ("end", info).
+    """
+
+    def __init__(self, ws, protocol: str):
+        self.ws = ws
+        self.protocol = protocol
+
+    async def send(self, prompt: str) -> None:
+        if self.protocol == "json":
+            await self.ws.send(json.dumps({"type": "message", "text": prompt}))
+        else:
+            await self.ws.send(prompt)
+
+    async def stop(self) -> None:
+        """Ask the server to cut the current reply short."""
+        if self.protocol == "json":
+            await self.ws.send(json.dumps({"type": "stop"}))
+        else:
+            await self.ws.send(STOP)
+
+    async def events(self) -> AsyncIterator[Tuple[str, object]]:
+        async for frame in self.ws:
+            if self.protocol == "json":
+                message = json.loads(frame)
+                kind = message.get("type")
+                if kind == "delta":
+                    yield "delta", message["text"]
+                elif kind == "end":
+                    yield "end", message
+                elif kind == "busy":
+                    yield "busy", f"[server busy, queue position {message['position']}]"
+                elif kind == "error":
+                    yield "error", f"[error: {message['message']}]"
+            elif frame == END_OF_RESPONSE:
+                yield "end", {}
+            elif frame.startswith(BUSY):
+                yield "busy", frame
+            else:
+                yield "delta", frame
+
+
+def _connect_url(session_id: Optional[str], protocol: str) -> str:
+    query = {}
+    if session_id:
+        query["session_id"] = session_id
+    if protocol != "text":
+        query["protocol"] = protocol
+    return WS_URL + ("?" + urlencode(query) if query else "")
+
+
+async def ainput(prompt: str = "") -> str:
+    """
+    input() without blocking the event loop. The read runs on a daemon
+    thread, so a pending read never keeps the process alive on exit.
+    """
+    loop = asyncio.get_running_loop()
+    fut = loop.create_future()
+
+    def deliver(setter, value):
+        if not fut.done():
+            setter(value)
+
+    def read():
+        try:
+            line = input(prompt)
+        except BaseException as e:
+            loop.call_soon_threadsafe(deliver, fut.set_exception, e)
+        else:
+            loop.call_soon_threadsafe(deliver, fut.set_result, line)
+
+    threading.Thread(target=read, daemon=True).start()
+    return await fut
+
+
+def _apply_end(turn: Turn, info: dict) -> None:
+    turn.ended_at = time.perf_counter()
+    turn.server = info
+    turn.status = info.get("status", turn.status)
+
+
+@contextmanager
+def _stop_on_ctrl_c(conn: ChatConnection):
+    """While active, Ctrl+C sends a stop instead of raising KeyboardInterrupt (where supported)."""
+    loop = asyncio.get_running_loop()
+    try:
+        loop.add_signal_handler(signal.SIGINT, lambda: asyncio.ensure_future(conn.stop()))
+    except (NotImplementedError, RuntimeError):
+        yield
+        return
+    try:
+        yield
+    finally:
+        loop.remove_signal_handler(signal.SIGINT)
+
+
+async def chat_session(session_id: Optional[str] = None, protocol: str = "text"):
+    """
+    Interactive chat. The keyboard is read on a helper thread, so frames
+    keep being received (and tokens rendered as they arrive) while the
+    prompt is waiting for input. Ctrl+C while a reply is streaming stops
+    the reply; at the prompt it exits.
+    """
     print(f"Connecting to server at {WS_URL} ...")
-    async with websockets.connect(WS_URL) as ws:
-        print("Connected. Type messages. Ctrl+C to exit.\n")
+    async with websockets.connect(_connect_url(session_id, protocol)) as ws:
+        response = getattr(ws, "response", None)
+        headers = response.headers if response is not None else {}
+        print(f"Connected (session {headers.get('x-session-id', 'unknown')}). "
+              "Type messages. Ctrl+C stops a reply; Ctrl+C or Ctrl+D at the prompt exits.\n")
 
-        while True:
-            # User input
-            user_msg = input("You: ")
+        conn = ChatConnection(ws, protocol)
+        turns: "asyncio.Queue[Turn]" = asyncio.Queue()
+        turn_done = asyncio.Event()
 
-            # Send to server
-            await ws.send(user_msg)
+        async def receive():
+            turn = None
+            async for kind, payload in conn.events():
+                if turn is None:
+                    turn = await turns.get()
+                    print("Model: ", end="", flush=True)
+                if kind == "delta":
+                    if turn.first_token_at is None:
+                        turn.first_token_at = time.perf_counter()
+                    turn.chunks.append(payload)
+                    print(payload, end="", flush=True)
+                elif kind in ("busy", "error"):
+                    turn.status = kind
+                    print(payload, end="", flush=True)
+                elif kind == "end":
+                    _apply_end(turn, payload)
+                    print(f"\n({turn.summary()})\n")
+                    turn = None
+                    turn_done.set()
 
-            # Collect model’s answer
-            chunks = []
+        receiver = asyncio.create_task(receive())
+        try:
             while True:
-                chunk = await ws.recv()
-                if chunk == "[[END_OF_RESPONSE]]":
-                    break
-                chunks.append(chunk)
+                reader = asyncio.ensure_future(ainput("You: "))
+                done, _ = await asyncio.wait({reader, receiver}, return_when=asyncio.FIRST_COMPLETED)
+                if receiver in done:
+                    print("\nConnection closed by server.")
+                    reader.cancel()
+                    return
+                try:
+                    user_msg = reader.result()
+                except EOFError:
+                    print()
+                    return
+                if not user_msg.strip():
+                    continue
+
+                turn_done.clear()
+                turns.put_nowait(Turn(user_msg, time.perf_counter()))
+                await conn.send(user_msg)
+                waiter = asyncio.create_task(turn_done.wait())
+                with _stop_on_ctrl_c(conn):
+                    await asyncio.wait({waiter, receiver}, return_when=asyncio.FIRST_COMPLETED)
+                waiter.cancel()
+        finally:
+            receiver.cancel()
+
+
+def read_script(path: str) -> List[str]:
+    """One prompt per non-blank line; a JSON string or {"text": ...} per line is also accepted."""
+    prompts = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if not line.strip():
+                continue
+            if line.lstrip().startswith(("{", '"')):
+                try:
+                    data = json.loads(line)
+                    line = data["text"] if isinstance(data, dict) else str(data)
+                except (ValueError, KeyError):
+                    pass
+            prompts.append(line)
+    return prompts
+
+
+async def run_script(path: str, session_id: Optional[str] = None, protocol: str = "text",
+                     quiet: bool = False) -> List[Turn]:
+    """
+    Replay the prompts in ``path`` over one connection, pipelined: up to
+    INBOX_MESSAGES prompts are in flight, and the server answers them in
+    order.
+
+    A turn's clock starts when it was sent or when the previous reply
+    ended, whichever is later, so TTFT reflects the server rather than
+    the queue of pipelined prompts.
+    """
+    prompts = read_script(path)
+    print(f"Replaying {len(prompts)} prompts from {path} against {WS_URL} ...")
+    start = time.perf_counter()
+    turns: List[Turn] = []
+    async with websockets.connect(_connect_url(session_id, protocol), max_size=None) as ws:
+        conn = ChatConnection(ws, protocol)
+        sent_at: List[float] = []
+        in_flight = asyncio.Semaphore(max(INBOX_MESSAGES, 1))
+
+        async def send_all():
+            for prompt in prompts:
+                await in_flight.acquire()
+                sent_at.append(time.perf_counter())
+                await conn.send(prompt)
+
+        sender = asyncio.create_task(send_all())
+        try:
+            previous_end = start
+            turn = None
+            if prompts:
+                async for kind, payload in conn.events():
+                    if turn is None:
+                        i = len(turns)
+                        turn = Turn(prompts[i], max(sent_at[i], previous_end))
+                    if kind == "delta":
+                        if turn.first_token_at is None:
+                            turn.first_token_at = time.perf_counter()
+                        turn.chunks.append(payload)
+                    elif kind in ("busy", "error"):
+                        turn.status = kind
+                    elif kind == "end":
+                        _apply_end(turn, payload)
+                        in_flight.release()
+                        previous_end = turn.ended_at
+                        turns.append(turn)
+                        if not quiet:
+                            print(f"You: {turn.prompt}")
+                            print(f"Model: {''.join(turn.chunks).strip()}")
+                            print(f"({turn.summary()})\n")
+                        turn = None
+                        if len(turns) == len(prompts):
+                            break
+            await sender
+        finally:
+            sender.cancel()
 
-            model_answer = "".join(chunks).strip()
-            print(f"\nModel: {model_answer}\n")
+    elapsed = time.perf_counter() - start
+    ok = [t for t in turns if t.status == "ok"]
+    ttfts = sorted(t.ttft_ms for t in ok if t.ttft_ms is not None)
+    tokens = sum(t.tokens for t in ok)
+    print("SCRIPT COMPLETED:")
+    print(f"  Turns: {len(turns)}/{len(prompts)} ({len(turns) - len(ok)} not ok)")
+    if ttfts:
+        print(f"  Time to first token: median {ttfts[len(ttfts) // 2]:.0f} ms, max {ttfts[-1]:.0f} ms")
+    print(f"  Tokens: {tokens} ({tokens / elapsed:.1f} tok/s overall)")
+    print(f"  Time: {elapsed:.3f}s")
+    return turns
@@ -1,32 +1,109 @@
 from api.client import InferenceClient
+import json
+import os
+import sys
 import time
 
 class InferenceCommands:
     def __init__(self, client: InferenceClient):
         self.client = client
-    
-    def run_inference(self, model_name: str, input_data: str, 
-                     batch_size: int = 1, stream: bool = False):
+
+    def run_inference(self, model_name: str, input_data: str,
+                     batch_size: int = 1, stream: bool = False, output: str = None,
+                     priority: str = None, deadline_ms: float = None, client_id: str = None):
         print(f"RUNNING: Running inference with model: {model_name}")
         print(f"  Input: {input_data}")
-        
+
+        if stream:
+            self.stream_inference(model_name, input_data, batch_size)
+            return
+
+        if os.path.isfile(input_data):
+            # Without --output the records go to stdout as JSON Lines
+            self.file_inference(model_name, input_data, output, batch_size)
+            return
+
         start_time = time.time()
         try:
             result = self.client.run_inference(
                 model_name=model_name,
-                input=input_data,
+                input_data=input_data,
                 batch_size=batch_size,
-                stream=stream
+                stream=stream,
+                priority=priority,
+                deadline_ms=deadline_ms,
+                client_id=client_id
             )
             end_time = time.time()
             inference_time = end_time - start_time
-            
+
+            status = result.get('status', 'succeeded')
+            if status != 'succeeded':
+                print(f"ERROR: Inference {status}: {result.get('error', 'no details')}")
+                print(f"  Time: {inference_time:.3f}s")
+                return
+
             print(f"SUCCESS: Inference completed!")
-            print(f"  Result: {result.get('output', 'No output')}")
+            print(f"  Result: {result.get('result', result.get('output', 'No output'))}")
             print(f"  Time: {inference_time:.3f}s")
-            
+
         except Exception as e:
             end_time = time.time()
             inference_time = end_time - start_time
             print(f"ERROR: Error running inference: {e}")
-            print(f"  Time elapsed: {inference_time:.2f}s")
\ No newline at end of file
+            print(f"  Time elapsed: {inference_time:.2f}s")
+
+    def stream_inference(self, model_name: str, input_data: str, batch_size: int = 1):
+        start_time = time.perf_counter()
+        first_token_time = None
+        tokens = 0
+        try:
+            print("  Output: ", end="", flush=True)
+            for token in self.client.stream_inference(model_name, input_data, batch_size):
+                if first_token_time is None:
+                    first_token_time = time.perf_counter() - start_time
+                tokens += 1
+                print(token, end="", flush=True)
+            total_time = time.perf_counter() - start_time
+            print()
+
+            print(f"SUCCESS: Inference completed!")
+            if first_token_time is not None:
+                print(f"  Time to first token: {first_token_time:.3f}s")
+            print(f"  Tokens: {tokens}")
+            print(f"  Time: {total_time:.3f}s")
+
+        except Exception as e:
+            print()
+            inference_time = time.perf_counter() - start_time
+            print(f"ERROR: Error running inference: {e}")
+            print(f"  Time elapsed: {inference_time:.2f}s")
+
+    def file_inference(self, model_name: str, input_path: str, output_path: str = None,
+                       batch_size: int = 1):
+        # Results are written as they arrive, so the file is never held in memory
+        start_time = time.perf_counter()
+        records = errors = 0
+        try:
+            out = open(output_path, "w") if output_path else sys.stdout
+            try:
+                for record in self.client.stream_file_inference(model_name, input_path, batch_size):
+                    print(json.dumps(record), file=out, flush=out is sys.stdout)
+                    records += 1
+                    if "error" in record:
+                        errors += 1
+            finally:
+                if out is not sys.stdout:
+                    out.close()
+            total_time = time.perf_counter() - start_time
+
+            print(f"SUCCESS: Inference completed!")
+            print(f"  Records: {records} ({errors} errors)")
+            print(f"  Output: {output_path or 'stdout'}")
+            print(f"  Time: {total_time:.3f}s")
+
+        except Exception as e:
+            inference_time = time.perf_counter() - start_time
+            print(f"ERROR: Error running inference: {e}")
+            print(f"  Records written: {records}")
+            print(f"  Time elapsed: {inference_time:.2f}s")
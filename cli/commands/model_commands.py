@@ -21,6 +21,10 @@ class ModelCommands:
             print(f"SUCCESS: Model loaded successfully!")
             print(f"  Name: {result.get('model_name')}")
             print(f"  Status: {result.get('status')}")
+            if result.get('size_mb') is not None:
+                print(f"  Size: {result['size_mb']:.0f} MB")
+            if result.get('evicted'):
+                print(f"  Evicted (LRU): {', '.join(result['evicted'])}")
             print(f"  Time: {load_time:.2f}s")
         except Exception as e:
             end_time = time.time()
@@ -31,13 +35,43 @@ class ModelCommands:
     def list_models(self):
         start_time = time.time()
         try:
-            models = self.client.list_models()
+            data = self.client.get_models()
+            models = data.get("models", []) if isinstance(data, dict) else data
             end_time = time.time()
             query_time = end_time - start_time
             print("LOADED MODELS:")
             for model in models:
                 status = "[LOADED]" if model.get('loaded') else "[NOT LOADED]"
-                print(f"  {status} {model.get('name', 'Unknown')}")
+                name = model.get('name', model.get('model_name', 'Unknown'))
+                if model.get('active'):
+                    name += " (active)"
+                details = []
+                if model.get('error'):
+                    details.append(f"unreadable: {model['error']}")
+                if model.get('quantization'):
+                    details.append(model['quantization'])
+                if model.get('context_length'):
+                    details.append(f"ctx {model['context_length']}")
+                if model.get('size_mb') is not None:
+                    details.append(f"{model['size_mb']:.0f} MB")
+                if model.get('load_ms') is not None:
+                    details.append(f"loaded in {model['load_ms']:.0f} ms")
+                if model.get('uses'):
+                    details.append(f"{model['uses']} uses")
+                suffix = f" ({', '.join(details)})" if details else ""
+                print(f"  {status} {name}{suffix}")
+            registry = data.get("registry") if isinstance(data, dict) else None
+            if registry:
+                print(f"  Memory: {registry['memory_used_mb']:.0f} / {registry['memory_budget_mb']:.0f} MB")
+                print(f"  Hit Rate: {100.0 * registry['model_hit_rate']:.1f}% "
+                      f"({registry['model_hits']} hits, {registry['model_misses']} misses)")
+                print(f"  Loads: {registry['model_loads']} (avg {registry['avg_load_ms']:.0f} ms), "
+                      f"Evictions: {registry['model_evictions']}")
+            catalog = data.get("catalog") if isinstance(data, dict) else None
+            if catalog:
+                print(f"  Catalog: {catalog['files']} GGUF files in {catalog['model_dir']} "
+                      f"({catalog['last_scan_ms']:.1f} ms scan, {catalog['cache_hits']} cached, "
+                      f"{catalog['headers_parsed']} parsed)")
             print(f"Time: {query_time:.3f}s")
         except Exception as e:
             end_time = time.time()
@@ -66,6 +100,10 @@ class ModelCommands:
             end_time = time.time()
             switch_time = end_time - start_time
             print(f"SUCCESS: Switched to model: {model_name}")
+            if result.get('status'):
+                print(f"  Status: {result['status']}")
+            if result.get('evicted'):
+                print(f"  Evicted (LRU): {', '.join(result['evicted'])}")
             print(f"  Time: {switch_time:.2f}s")
         except Exception as e:
             end_time = time.time()
@@ -30,12 +30,32 @@ class SystemCommands:
             end_time = time.time()
             query_time = end_time - start_time
             print("SYSTEM STATISTICS:")
-            print(f"  Total Inferences: {stats.get('total_inferences', 0)}")
-            print(f"  Average Latency: {stats.get('avg_latency', 'N/A')}ms")
+            print(f"  Uptime: {self._fmt(stats.get('uptime_s'), 's', 0)}")
+            print(f"  Total Inferences: {stats.get('total_inferences', 0):.0f} "
+                  f"({stats.get('failed_inferences', 0):.0f} failed, "
+                  f"{stats.get('rejected_inferences', 0):.0f} rejected)")
+            print(f"  Average Latency: {self._fmt(stats.get('avg_latency'), 'ms')}")
+            print(f"  Latency p50/p95/p99: {self._pcts(stats, 'turn')}")
+            print(f"  Time to First Token p50/p95/p99: {self._pcts(stats, 'ttft')}")
+            print(f"  Queue Wait p50/p95/p99: {self._pcts(stats, 'queue_wait')}")
+            print(f"  Per-Token Latency avg: {self._fmt(stats.get('token_latency_ms_avg'), 'ms')}")
+            print(f"  Tokens Generated: {stats.get('tokens_generated', 0):.0f}")
+            print(f"  Active Sessions: {stats.get('active_sessions', 0):.0f}")
+            workers = stats.get('engine_workers_by_state') or {}
+            if workers:
+                print("  Engine Workers: " + ", ".join(f"{k}={v:.0f}" for k, v in workers.items()))
+            print(f"  Engine Restarts: {stats.get('engine_restarts', 0):.0f}")
             print(f"  Models Loaded: {stats.get('models_loaded', 0)}")
             print(f"Time: {query_time:.3f}s")
         except Exception as e:
             end_time = time.time()
             query_time = end_time - start_time
             print(f"ERROR: Error getting statistics: {e}")
-            print(f"  Time elapsed: {query_time:.2f}s")
\ No newline at end of file
+            print(f"  Time elapsed: {query_time:.2f}s")
+
+    @staticmethod
+    def _fmt(value, unit: str, digits: int = 1) -> str:
+        return f"{value:.{digits}f}{unit}" if value is not None else "N/A"
+
+    def _pcts(self, stats, name: str) -> str:
+        return " / ".join(self._fmt(stats.get(f"{name}_ms_p{p}"), "ms") for p in (50, 95, 99))
@@ -17,12 +17,16 @@ class ResultsFormatter:
             return
         
         print("\n📚 Loaded Models:")
-        print("-" * 50)
+        print("-" * 80)
         for model in models:
             status = "🟢" if model.get('loaded') else "🔴"
-            print(f"{status} {model.get('name', 'Unknown'):<20} "
-                  f"| Device: {model.get('device', 'N/A'):<8} "
-                  f"| Precision: {model.get('precision', 'N/A'):<6}")
+            size = model.get('size_mb')
+            size = f"{size:.0f} MB" if size is not None else "N/A"
+            print(f"{status} {model.get('name') or model.get('model_name', 'Unknown'):<20} "
+                  f"| Device: {model.get('device') or 'N/A':<8} "
+                  f"| Precision: {model.get('quantization') or model.get('precision') or 'N/A':<8} "
+                  f"| Context: {model.get('context_length') or 'N/A':<7} "
+                  f"| Size: {size}")
     
     @staticmethod
     def display_inference_result(result: Dict[str, Any]):
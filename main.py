@@ -6,7 +6,8 @@ from api.client import InferenceClient
 from cli.commands.model_commands import ModelCommands
 from cli.commands.inference_commands import InferenceCommands
 from cli.commands.system_commands import SystemCommands
-from cli.chat import chat_session
+from cli.chat import chat_session, run_script
+from cli.bench import run_bench
 
 class InferenceCLI:
     def __init__(self):
@@ -45,6 +46,11 @@ class InferenceCLI:
         inference_parser.add_argument('--batch-size', type=int, default=1)
         inference_parser.add_argument('--output', help='Output file path')
         inference_parser.add_argument('--stream', action='store_true', help='Stream results')
+        inference_parser.add_argument('--priority', choices=['interactive', 'batch'],
+                                      help='Scheduling class (the server defaults jobs to batch)')
+        inference_parser.add_argument('--deadline-ms', type=float,
+                                      help='Drop the job if it has not started this many ms after submission')
+        inference_parser.add_argument('--client-id', help='Client id for fair sharing of the engine')
         
         # System commands
         system_parser = subparsers.add_parser('system', help='System operations')
@@ -53,7 +59,28 @@ class InferenceCLI:
         system_subparsers.add_parser('stats', help='Show performance statistics')
         
         # Chat command (WebSocket)
-        subparsers.add_parser('chat', help='Interactive chat session over WebSocket')
+        chat_parser = subparsers.add_parser('chat', help='Interactive chat session over WebSocket')
+        chat_parser.add_argument('--session', help='Session id to resume')
+        chat_parser.add_argument('--protocol', choices=['text', 'json'], default='text',
+                                 help='Wire protocol (json adds typed messages and per-turn timing)')
+        chat_parser.add_argument('--script', help='Replay prompts from a file (one per line), pipelined over one connection')
+        chat_parser.add_argument('--quiet', action='store_true', help='With --script, print only the summary')
+
+        # Load generator
+        bench_parser = subparsers.add_parser('bench', help='Load-test the chat or inference endpoint')
+        bench_parser.add_argument('--target', choices=['chat', 'inference'], default='chat')
+        bench_parser.add_argument('--url', help='Server URL (default: APP_SERVER_URL)')
+        bench_parser.add_argument('--concurrency', type=int, default=8,
+                                  help='Concurrent sessions/streams (max in flight with --rate)')
+        bench_parser.add_argument('--rate', type=float, help='Fixed request rate per second instead of fixed concurrency')
+        bench_parser.add_argument('--requests', type=int, help='Total requests (default 100 unless --duration)')
+        bench_parser.add_argument('--duration', type=float, help='Steady-state duration in seconds')
+        bench_parser.add_argument('--ramp-up', type=float, default=0.0, help='Ramp-up seconds, excluded from results')
+        bench_parser.add_argument('--prompt', default='Hello from the benchmark')
+        bench_parser.add_argument('--model', default='demo-base', help='Model for --target inference')
+        bench_parser.add_argument('--csv', help='Write raw per-request samples to this CSV file')
+        bench_parser.add_argument('--protocol', choices=['text', 'json'], default='text',
+                                  help='Chat wire protocol')
         
         return parser
     
@@ -77,7 +104,11 @@ class InferenceCLI:
             args.model,
             args.input,
             args.batch_size,
-            args.stream
+            args.stream,
+            args.output,
+            priority=args.priority,
+            deadline_ms=args.deadline_ms,
+            client_id=args.client_id
         )
     
     def handle_system_command(self, args):
@@ -86,6 +117,27 @@ class InferenceCLI:
         elif args.system_command == 'stats':
             self.system_commands.get_statistics()
     
+    def handle_chat_command(self, args):
+        if args.script:
+            asyncio.run(run_script(args.script, args.session, args.protocol, args.quiet))
+        else:
+            asyncio.run(chat_session(args.session, args.protocol))
+    
+    def handle_bench_command(self, args):
+        asyncio.run(run_bench(
+            target=args.target,
+            url=args.url or self.client.base_url,
+            concurrency=args.concurrency,
+            rate=args.rate,
+            requests=args.requests,
+            duration=args.duration,
+            ramp_up=args.ramp_up,
+            prompt=args.prompt,
+            model=args.model,
+            csv_path=args.csv,
+            protocol=args.protocol
+        ))
+    
     def run_command(self, command_string):
         """Execute a command string"""
         try:
@@ -99,7 +151,9 @@ class InferenceCLI:
             elif args.command == 'system':
                 self.handle_system_command(args)
             elif args.command == 'chat':
-                asyncio.run(chat_session())            
+                self.handle_chat_command(args)
+            elif args.command == 'bench':
+                self.handle_bench_command(args)
                 
         except SystemExit:
             # argparse calls sys.exit() on help or error, we want to continue
@@ -159,7 +213,9 @@ def main():
             elif args.command == 'system':
                 cli.handle_system_command(args)
             elif args.command == 'chat':
-                asyncio.run(chat_session())
+                cli.handle_chat_command(args)
+            elif args.command == 'bench':
+                cli.handle_bench_command(args)
         except Exception as e:
             print(f"Error: {e}")
             sys.exit(1)
@@ -0,0 +1,219 @@
+# testbench/attention.py
+"""
+Attention kernels for the speculation testbench.
+
+A case is ``depth`` consecutive decode steps against a KV cache of
+``seq_len`` tokens: the query of step i attends to keys 0 .. seq_len + i.
+The baseline computes all steps with one batched exact call. A speculative
+variant runs in rounds: it produces the outputs of the remaining steps
+with a cheap approximation and checks them with one batched exact pass.
+Steps are accepted up to the first one further than the tolerance from the
+exact result, which is replaced by its exact output. Later steps were
+speculated from the wrong output, so they are discarded and the next round
+starts after the corrected step.
+"""
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from functools import partial
+from typing import Callable, Dict, Optional, Tuple
+
+import torch
+import torch.nn.functional as F
+
+Tensors = Tuple[torch.Tensor, torch.Tensor, torch.Tensor]
+
+SINK_TOKENS = 4
+WINDOW = 256
+TOLERANCE = 1e-2
+
+# Attention weight falls by e per DECAY tokens of distance in the synthetic
+# inputs, so the default window leaves out about e^-8 of it.
+DECAY = 32.0
+
+
+@dataclass(frozen=True)
+class Case:
+    seq_len: int
+    batch: int
+    heads: int
+    depth: int
+    head_dim: int = 64
+
+
+def make_inputs(case: Case, seed: int, decay: float = DECAY, sink_bias: float = 4.0) -> Tensors:
+    """
+    Random q, k, v (float32) whose attention is concentrated on recent keys
+    and on the first SINK_TOKENS keys, as decode-time attention is. Uniform
+    random inputs spread attention evenly, and no local approximation
+    would ever be accepted.
+
+    The last two head dimensions carry the structure: they add
+    -distance / decay and, for sink keys, +sink_bias to every score.
+    """
+    g = torch.Generator().manual_seed(seed)
+    d = case.head_dim
+    total = case.seq_len + case.depth
+    q = torch.randn(case.batch, case.heads, case.depth, d, generator=g)
+    k = torch.randn(case.batch, case.heads, total, d, generator=g)
+    v = torch.randn(case.batch, case.heads, total, d, generator=g)
+
+    scale = d ** 0.5
+    q[..., -2:] = 1.0
+    k[..., -1] = (torch.arange(total, dtype=torch.float32) - total) / decay * scale
+    k[..., -2] = 0.0
+    k[:, :, :SINK_TOKENS, -2] = sink_bias * scale
+    return q, k, v
+
+
+def causal_mask(seq_len: int, depth: int) -> torch.Tensor:
+    """(depth, seq_len + depth) boolean mask: step i sees keys 0 .. seq_len + i."""
+    keys = torch.arange(seq_len + depth)
+    return keys <= torch.arange(depth).unsqueeze(1) + seq_len
+
+
+def reference(q: torch.Tensor, k: torch.Tensor, v: torch.Tensor, seq_len: int) -> torch.Tensor:
+    """Exact attention in float64, the yardstick for every variant's error."""
+    q, k, v = q.double(), k.double(), v.double()
+    scores = q @ k.transpose(-2, -1) / q.shape[-1] ** 0.5
+    scores = scores.masked_fill(~causal_mask(seq_len, q.shape[2]), float("-inf"))
+    return torch.softmax(scores, dim=-1) @ v
+
+
+def exact_decode(q: torch.Tensor, k: torch.Tensor, v: torch.Tensor, seq_len: int) -> torch.Tensor:
+    """Baseline: one exact attention call per step over the growing cache."""
+    steps = [
+        F.scaled_dot_product_attention(q[:, :, i:i + 1], k[:, :, :seq_len + i + 1], v[:, :, :seq_len + i + 1])
+        for i in range(q.shape[2])
+    ]
+    return torch.cat(steps, dim=2)
+
+
+def exact_batched(q: torch.Tensor, k: torch.Tensor, v: torch.Tensor, seq_len: int) -> torch.Tensor:
+    """All steps in one exact call, each masked to its own prefix: the verification pass."""
+    return F.scaled_dot_product_attention(q, k, v, attn_mask=causal_mask(seq_len, q.shape[2]))
+
+
+def window_attention(
+    q: torch.Tensor,
+    k: torch.Tensor,
+    v: torch.Tensor,
+    seq_len: int,
+    window: int = WINDOW,
+    sinks: int = SINK_TOKENS,
+) -> torch.Tensor:
+    """
+    Speculate with the sink keys plus the last ``window`` keys of each step
+    (StreamingLLM-style). The cost does not grow with ``seq_len``.
+    """
+    depth = q.shape[2]
+    start = max(sinks, seq_len - window + 1)
+    keys = torch.cat([k[:, :, :sinks], k[:, :, start:]], dim=2)
+    values = torch.cat([v[:, :, :sinks], v[:, :, start:]], dim=2)
+    pos = torch.arange(start, seq_len + depth)
+    step = torch.arange(depth).unsqueeze(1) + seq_len
+    tail = (pos <= step) & (pos > step - window)
+    mask = torch.cat([torch.ones(depth, sinks, dtype=torch.bool), tail], dim=1)
+    return F.scaled_dot_product_attention(q, keys, values, attn_mask=mask)
+
+
+def to_bfloat16(q: torch.Tensor, k: torch.Tensor, v: torch.Tensor) -> Tensors:
+    return q.bfloat16(), k.bfloat16(), v.bfloat16()
+
+
+def low_precision(q: torch.Tensor, k: torch.Tensor, v: torch.Tensor, seq_len: int) -> torch.Tensor:
+    """Speculate with exact attention over a bfloat16 cache, batched over all steps."""
+    return exact_batched(q, k, v, seq_len).float()
+
+
+@dataclass(frozen=True)
+class Variant:
+    """
+    ``speculate(q, k, v, seq_len)`` produces all steps' outputs at once;
+    None marks the baseline. ``prepare`` converts the inputs into the form
+    the variant keeps its cache in and is not timed.
+    """
+
+    name: str
+    speculate: Optional[Callable[..., torch.Tensor]] = None
+    prepare: Optional[Callable[..., Tensors]] = None
+
+
+def make_variants(window: int = WINDOW) -> Dict[str, Variant]:
+    return {
+        v.name: v
+        for v in (
+            Variant("baseline"),
+            Variant("spec_window", partial(window_attention, window=window)),
+            Variant("spec_bf16", low_precision, prepare=to_bfloat16),
+        )
+    }
+
+
+VARIANTS = make_variants()
+
+
+def step_errors(output: torch.Tensor, exact: torch.Tensor) -> torch.Tensor:
+    """Relative error of each step's output (over batch, heads and head_dim)."""
+    diff = (output.double() - exact).transpose(0, 2).flatten(1)
+    return diff.norm(dim=1) / exact.transpose(0, 2).flatten(1).norm(dim=1)
+
+
+def accepted_steps(output: torch.Tensor, exact: torch.Tensor, tolerance: float = TOLERANCE) -> int:
+    """Number of leading steps whose relative error is within ``tolerance``."""
+    for i, err in enumerate(step_errors(output, exact).tolist()):
+        if err > tolerance:
+            return i
+    return output.shape[2]
+
+
+@dataclass
+class SpeculativeRun:
+    output: torch.Tensor
+    accepted: int
+    rounds: int
+    spec_ms: float
+    verify_ms: float
+
+
+def speculative_decode(
+    speculate: Callable[..., torch.Tensor],
+    inputs: Tensors,
+    q: torch.Tensor,
+    k: torch.Tensor,
+    v: torch.Tensor,
+    seq_len: int,
+    tolerance: float = TOLERANCE,
+) -> SpeculativeRun:
+    """
+    Decode every step with ``speculate`` (on ``inputs``, the variant's form
+    of q, k, v) checked by exact_batched, round by round. ``accepted``
+    counts the speculated outputs kept; each rejection costs a further
+    round over the steps after it.
+    """
+    sq, sk, sv = inputs
+    depth = q.shape[2]
+    output = torch.empty_like(q)
+    accepted = rounds = 0
+    spec_s = verify_s = 0.0
+    start = 0
+    while start < depth:
+        n = seq_len + start
+        t0 = time.perf_counter()
+        guess = speculate(sq[:, :, start:], sk, sv, n).float()
+        t1 = time.perf_counter()
+        exact = exact_batched(q[:, :, start:], k, v, n)
+        t2 = time.perf_counter()
+        spec_s += t1 - t0
+        verify_s += t2 - t1
+        rounds += 1
+
+        kept = accepted_steps(guess, exact.double(), tolerance)
+        output[:, :, start:start + kept] = guess[:, :, :kept]
+        accepted += kept
+        start += kept
+        if start < depth:
+            output[:, :, start] = exact[:, :, kept]
+            start += 1
+    return SpeculativeRun(output, accepted, rounds, 1000.0 * spec_s, 1000.0 * verify_s)
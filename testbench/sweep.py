@@ -0,0 +1,398 @@
+# testbench/sweep.py
+"""
+Attention-level speculation testbench.
+
+Sweeps sequence length, batch size, head count and speculation depth. For
+each case it runs the baseline (exact attention over all steps in one
+batched call) and every speculative variant in testbench/attention.py on
+CPU, and records latency, peak tensor memory, error against a float64
+reference, how many speculated steps verification accepted and how many
+speculate-and-verify rounds that took. Results go to CSV, with plots next
+to it:
+
+    python -m testbench.sweep --out results/sweep.csv
+    python -m testbench.sweep --quick --no-plots
+    python -m testbench.sweep --out results/new.csv --compare results/sweep.csv
+
+Runs are reproducible: every case's inputs come from a seed derived from
+its parameters, torch runs deterministically on a fixed number of threads
+(--threads), and each row records the torch version and git commit, so the
+CSVs of two commits can be compared with --compare.
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import itertools
+import os
+import platform
+import statistics
+import subprocess
+import time
+import weakref
+import zlib
+from dataclasses import asdict, dataclass, fields
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import torch
+from torch.overrides import TorchFunctionMode
+
+from testbench.attention import (
+    TOLERANCE,
+    VARIANTS,
+    WINDOW,
+    Case,
+    Variant,
+    accepted_steps,
+    exact_batched,
+    make_inputs,
+    make_variants,
+    reference,
+    speculative_decode,
+)
+
+SEQ_LENS = (256, 1024, 4096)
+BATCHES = (1, 4)
+HEADS = (8, 32)
+DEPTHS = (1, 4, 8)
+
+QUICK_SEQ_LENS = (256, 1024)
+QUICK_BATCHES = (1,)
+QUICK_HEADS = (8,)
+QUICK_DEPTHS = (1, 4)
+
+MB = 1024 * 1024
+
+
+@dataclass
+class Row:
+    commit: str
+    torch_version: str
+    threads: int
+    seed: int
+    variant: str
+    seq_len: int
+    batch: int
+    heads: int
+    head_dim: int
+    depth: int
+    window: int
+    tolerance: float
+    latency_ms: float
+    latency_min_ms: float
+    spec_ms: Optional[float]
+    verify_ms: Optional[float]
+    speedup: Optional[float]
+    peak_mem_mb: float
+    max_abs_err: float
+    rel_err: float
+    accepted_steps: Optional[int]
+    accepted_frac: Optional[float]
+    rounds: Optional[int]
+
+
+KEY_COLUMNS = ("variant", "seq_len", "batch", "heads", "head_dim", "depth")
+
+
+def tensors(obj: Any) -> Iterator[torch.Tensor]:
+    """The tensors in a nest of tuples, lists and dicts (call arguments, op outputs)."""
+    if isinstance(obj, torch.Tensor):
+        yield obj
+    elif isinstance(obj, (tuple, list)):
+        for item in obj:
+            yield from tensors(item)
+    elif isinstance(obj, dict):
+        for item in obj.values():
+            yield from tensors(item)
+
+
+class PeakMemory(TorchFunctionMode):
+    """
+    Peak bytes of tensor storage allocated by torch calls while active.
+
+    Every call's output is recorded under its storage and released when the
+    tensor that introduced the storage is freed. Scratch space inside a
+    call (a fused attention kernel, say) is not visible, only the tensors
+    it returns.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.live = 0
+        self.peak = 0
+        self._storages: Dict[int, int] = {}
+
+    def _release(self, ptr: int) -> None:
+        self.live -= self._storages.pop(ptr, 0)
+
+    def __torch_function__(self, func, types, args=(), kwargs=None):
+        kwargs = kwargs or {}
+        out = func(*args, **kwargs)
+        # Views share their input's storage and allocate nothing
+        inputs = {t.untyped_storage().data_ptr() for t in tensors((args, kwargs))}
+        for t in tensors(out):
+            storage = t.untyped_storage()
+            ptr = storage.data_ptr()
+            if ptr and ptr not in inputs and ptr not in self._storages:
+                self._storages[ptr] = storage.nbytes()
+                self.live += storage.nbytes()
+                self.peak = max(self.peak, self.live)
+                weakref.finalize(t, self._release, ptr)
+        return out
+
+
+def peak_memory_mb(fn: Callable[[], torch.Tensor]) -> float:
+    tracker = PeakMemory()
+    with tracker:
+        out = fn()
+    del out
+    return tracker.peak / MB
+
+
+def time_call(fn: Callable[[], torch.Tensor], repeats: int, warmup: int) -> List[float]:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(1000.0 * (time.perf_counter() - start))
+    return samples
+
+
+def case_seed(seed: int, case: Case) -> int:
+    """A seed fixed by the case's parameters, independent of the sweep it is part of."""
+    key = f"{seed}:{case.seq_len}:{case.batch}:{case.heads}:{case.depth}:{case.head_dim}"
+    return zlib.crc32(key.encode())
+
+
+def git_commit() -> str:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+@torch.no_grad()
+def run_case(
+    case: Case,
+    variants: Dict[str, Variant],
+    seed: int,
+    repeats: int,
+    warmup: int,
+    tolerance: float,
+    meta: Dict[str, object],
+) -> List[Row]:
+    seed = case_seed(seed, case)
+    q, k, v = make_inputs(case, seed)
+    exact = reference(q, k, v, case.seq_len)
+    n = case.seq_len
+
+    def row(variant: str, output: torch.Tensor, samples: List[float], peak_mb: float,
+            speedup: float, spec_ms: Optional[float] = None, verify_ms: Optional[float] = None,
+            steps: Optional[int] = None, rounds: Optional[int] = None) -> Row:
+        diff = output.double() - exact
+        return Row(
+            commit=meta["commit"], torch_version=meta["torch_version"], threads=meta["threads"],
+            seed=seed, variant=variant, seq_len=case.seq_len, batch=case.batch,
+            heads=case.heads, head_dim=case.head_dim, depth=case.depth,
+            window=meta["window"], tolerance=tolerance,
+            latency_ms=statistics.median(samples), latency_min_ms=min(samples),
+            spec_ms=spec_ms, verify_ms=verify_ms, speedup=speedup,
+            peak_mem_mb=peak_mb,
+            max_abs_err=float(diff.abs().max()),
+            rel_err=float(diff.norm() / exact.norm()),
+            accepted_steps=steps,
+            accepted_frac=None if steps is None else steps / case.depth,
+            rounds=rounds,
+        )
+
+    baseline = time_call(lambda: exact_batched(q, k, v, n), repeats, warmup)
+    baseline_ms = statistics.median(baseline)
+
+    rows = []
+    for name, variant in variants.items():
+        if variant.speculate is None:
+            rows.append(row(
+                name, exact_batched(q, k, v, n), baseline,
+                peak_memory_mb(lambda: exact_batched(q, k, v, n)), speedup=1.0,
+            ))
+            continue
+
+        inputs = variant.prepare(q, k, v) if variant.prepare else (q, k, v)
+        speculate = variant.speculate
+
+        def decode():
+            return speculative_decode(speculate, inputs, q, k, v, n, tolerance)
+
+        for _ in range(warmup):
+            decode()
+        runs = [decode() for _ in range(repeats)]
+        samples = [r.spec_ms + r.verify_ms for r in runs]
+        result = runs[-1]
+        peak_mb = max(
+            peak_memory_mb(lambda: speculate(*inputs, n)),
+            peak_memory_mb(lambda: exact_batched(q, k, v, n)),
+        )
+        rows.append(row(
+            name, result.output, samples, peak_mb,
+            spec_ms=statistics.median(r.spec_ms for r in runs),
+            verify_ms=statistics.median(r.verify_ms for r in runs),
+            speedup=baseline_ms / statistics.median(samples),
+            steps=result.accepted, rounds=result.rounds,
+        ))
+    return rows
+
+
+def write_csv(path: str, rows: List[Row]) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=[f.name for f in fields(Row)])
+        writer.writeheader()
+        for r in rows:
+            writer.writerow(asdict(r))
+
+
+def plot(path: str, rows: List[Row]) -> List[str]:
+    """One figure per metric against sequence length, next to the CSV."""
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import pandas as pd
+    import seaborn as sns
+
+    data = pd.DataFrame([asdict(r) for r in rows])
+    stem = os.path.splitext(path)[0]
+    written = []
+    for metric, log_y in (
+        ("latency_ms", True),
+        ("speedup", False),
+        ("peak_mem_mb", True),
+        ("max_abs_err", True),
+        ("accepted_frac", False),
+    ):
+        subset = data.dropna(subset=[metric])
+        if subset.empty:
+            continue
+        if log_y:
+            subset = subset[subset[metric] > 0]
+        grid = sns.relplot(
+            data=subset, x="seq_len", y=metric, hue="variant", style="batch",
+            col="depth", row="heads", kind="line", marker="o", errorbar=None,
+            height=3, aspect=1.2,
+        )
+        grid.set(xscale="log")
+        if log_y:
+            grid.set(yscale="log")
+        out = f"{stem}_{metric}.png"
+        grid.savefig(out, dpi=120)
+        written.append(out)
+    return written
+
+
+def compare(rows: List[Row], old_path: str, threshold: float) -> int:
+    """Print latency and error changes against an earlier CSV; returns the number of regressions."""
+    with open(old_path, newline="") as f:
+        old = {tuple(r[c] for c in KEY_COLUMNS): r for r in csv.DictReader(f)}
+    old_commit = next(iter(old.values()), {}).get("commit", "unknown")
+
+    print(f"COMPARISON against {old_path} (commit {old_commit}):")
+    regressions = matched = 0
+    for r in rows:
+        key = tuple(str(getattr(r, c)) for c in KEY_COLUMNS)
+        before = old.get(key)
+        if before is None:
+            continue
+        matched += 1
+        ratio = r.latency_ms / float(before["latency_ms"])
+        err_before = float(before["max_abs_err"])
+        flag = ""
+        if ratio > 1.0 + threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        elif ratio < 1.0 - threshold:
+            flag = "  faster"
+        if r.max_abs_err > 2 * err_before and r.max_abs_err > 1e-6:
+            flag += "  ERROR UP"
+            regressions += 1
+        if flag:
+            label = ", ".join(f"{c}={getattr(r, c)}" for c in KEY_COLUMNS)
+            print(f"  {label}: {float(before['latency_ms']):.3f} -> {r.latency_ms:.3f} ms "
+                  f"({ratio:.2f}x), max err {err_before:.2e} -> {r.max_abs_err:.2e}{flag}")
+    print(f"  Matched cases: {matched}/{len(rows)}, regressions: {regressions} "
+          f"(latency threshold {100 * threshold:.0f}%)")
+    return regressions
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Attention-level speculation sweep (CPU)")
+    parser.add_argument("--out", default="results/attention_sweep.csv", help="CSV path; plots are written next to it")
+    parser.add_argument("--seq-lens", type=int, nargs="+")
+    parser.add_argument("--batches", type=int, nargs="+")
+    parser.add_argument("--heads", type=int, nargs="+")
+    parser.add_argument("--depths", type=int, nargs="+", help="speculation depths (decode steps per verify pass)")
+    parser.add_argument("--head-dim", type=int, default=64)
+    parser.add_argument("--variants", nargs="+", choices=sorted(VARIANTS), default=list(VARIANTS))
+    parser.add_argument("--window", type=int, default=WINDOW, help="keys seen by spec_window")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="relative error a speculated step may have")
+    parser.add_argument("--repeats", type=int, default=7)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=1, help="torch intra-op threads (fixed for comparable runs)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--quick", action="store_true", help="small grid for a smoke run")
+    parser.add_argument("--no-plots", action="store_true")
+    parser.add_argument("--compare", metavar="CSV", help="earlier results to compare latency and error against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="latency change reported by --compare")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    args = parse_args(argv)
+    torch.manual_seed(args.seed)
+    torch.set_num_threads(args.threads)
+    torch.use_deterministic_algorithms(True, warn_only=True)
+    variants = {name: v for name, v in make_variants(args.window).items() if name in args.variants}
+
+    grid: Tuple[Sequence[int], ...] = (
+        args.seq_lens or (QUICK_SEQ_LENS if args.quick else SEQ_LENS),
+        args.batches or (QUICK_BATCHES if args.quick else BATCHES),
+        args.heads or (QUICK_HEADS if args.quick else HEADS),
+        args.depths or (QUICK_DEPTHS if args.quick else DEPTHS),
+    )
+    cases = [Case(s, b, h, d, args.head_dim) for s, b, h, d in itertools.product(*grid)]
+    meta = {"commit": git_commit(), "torch_version": torch.__version__,
+            "threads": args.threads, "window": args.window}
+
+    print(f"Sweeping {len(cases)} cases x {len(variants)} variants "
+          f"(torch {torch.__version__}, {args.threads} threads, {platform.processor() or platform.machine()})")
+    start = time.perf_counter()
+    rows: List[Row] = []
+    for i, case in enumerate(cases, 1):
+        case_rows = run_case(case, variants, args.seed, args.repeats, args.warmup, args.tolerance, meta)
+        rows.extend(case_rows)
+        summary = "  ".join(
+            f"{r.variant}={r.latency_ms:.3f}ms"
+            + (f"/{r.accepted_steps}of{r.depth} in {r.rounds}" if r.accepted_steps is not None else "")
+            for r in case_rows
+        )
+        print(f"  [{i}/{len(cases)}] L={case.seq_len} B={case.batch} H={case.heads} "
+              f"depth={case.depth}: {summary}")
+
+    write_csv(args.out, rows)
+    print("SWEEP COMPLETED:")
+    print(f"  Rows: {len(rows)} -> {args.out}")
+    if not args.no_plots:
+        for path in plot(args.out, rows):
+            print(f"  Plot: {path}")
+    print(f"  Time: {time.perf_counter() - start:.3f}s")
+    if args.compare:
+        compare(rows, args.compare, args.threshold)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import pytest
+import torch
+
+from testbench.attention import (
+    Case,
+    exact_batched,
+    exact_decode,
+    make_inputs,
+    make_variants,
+    reference,
+    speculative_decode,
+)
+from testbench.sweep import run_case
+
+CASES = [Case(64, 1, 2, 1, 16), Case(128, 2, 4, 4, 32)]
+
+
+@pytest.mark.parametrize("case", CASES)
+def test_exact_baseline_matches_float64_reference(case):
+    q, k, v = make_inputs(case, seed=0)
+    exact = reference(q, k, v, case.seq_len)
+
+    for output in (exact_decode(q, k, v, case.seq_len), exact_batched(q, k, v, case.seq_len)):
+        assert output.shape == exact.shape
+        assert output.dtype == torch.float32
+        assert float((output.double() - exact).abs().max()) < 1e-5
+
+
+def test_sweep_case_smoke():
+    case = CASES[1]
+    meta = {"commit": "test", "torch_version": torch.__version__, "threads": 1, "window": 32}
+    rows = run_case(case, make_variants(window=32), seed=0, repeats=1, warmup=0, tolerance=1e-2, meta=meta)
+
+    by_variant = {row.variant: row for row in rows}
+    assert set(by_variant) == {"baseline", "spec_window", "spec_bf16"}
+    assert by_variant["baseline"].rel_err < 1e-6
+    assert by_variant["baseline"].accepted_steps is None
+    for row in rows:
+        assert row.latency_ms > 0 and row.peak_mem_mb > 0
+        if row.variant != "baseline":
+            assert 0 <= row.accepted_steps <= case.depth
+            assert 1 <= row.rounds <= case.depth - row.accepted_steps + 1
+
+
+def test_each_rejection_costs_a_round_over_the_steps_after_it():
+    case = CASES[1]
+    q, k, v = make_inputs(case, seed=0)
+    exact = exact_batched(q, k, v, case.seq_len)
+
+    perfect = speculative_decode(exact_batched, (q, k, v), q, k, v, case.seq_len)
+    assert (perfect.accepted, perfect.rounds) == (case.depth, 1)
+
+    # Wrong from step 2 on: two steps kept, then every round only yields its corrected step
+    def wrong_after_two(q, k, v, seq_len):
+        out = exact_batched(q, k, v, seq_len)
+        first = case.seq_len + 2 - seq_len
+        out[:, :, max(first, 0):] += 1.0
+        return out
+
+    run = speculative_decode(wrong_after_two, (q, k, v), q, k, v, case.seq_len)
+    assert run.accepted == 2
+    assert run.rounds == case.depth - 2
+    assert torch.allclose(run.output, exact, atol=1e-6)
@@ -0,0 +1,45 @@
+import asyncio
+
+from fastapi import WebSocketDisconnect
+
+from api.frames import Inbox, JsonProtocol
+
+
+class FakeWebSocket:
+    def __init__(self, messages):
+        self.incoming = asyncio.Queue()
+        for message in messages:
+            self.incoming.put_nowait(message)
+        self.sent = []
+
+    async def receive_text(self):
+        message = await self.incoming.get()
+        if message is None:
+            raise WebSocketDisconnect()
+        return message
+
+    async def send_text(self, text):
+        self.sent.append(text)
+
+
+def test_dropped_messages_are_left_to_the_turn_loop_in_order():
+    async def run():
+        ws = FakeWebSocket(['{"type": "message", "text": "%s"}' % t for t in "abcd"])
+        inbox = Inbox(ws, JsonProtocol(ws), capacity=2)
+        inbox.start()
+        try:
+            await asyncio.sleep(0)
+            assert await inbox.get() == '{"type": "message", "text": "a"}'
+            assert inbox.take_rejected() == 0
+            assert await inbox.get() == '{"type": "message", "text": "b"}'
+            assert inbox.take_rejected() == 2
+            assert inbox.take_rejected() == 0
+            ws.incoming.put_nowait(None)
+            assert await inbox.get() is None
+            assert inbox.rejected == 2 and inbox.disconnected
+            # The reader never answers on its own
+            assert ws.sent == []
+        finally:
+            await inbox.close()
+
+    asyncio.run(run())
@@ -0,0 +1,228 @@
+import asyncio
+import time
+
+import pytest
+
+from api.admission import DeadlineExceeded
+from api.context import ContextWindow, Tokenizer
+from api.engine import EngineBackend, EngineWorker, WorkerPool
+from api.kv_store import KVStore
+from api.sessions import SessionManager
+
+
+class FakeWorker(EngineWorker):
+    """Keeps its history in a ContextWindow and "saves" KV state as a file in the store's directory."""
+
+    def __init__(self, worker_id, store):
+        super().__init__(worker_id)
+        self.store = store
+        self.alive = False
+        self.context = ContextWindow("system", Tokenizer(), "fake")
+
+    @property
+    def failed(self):
+        return False
+
+    def is_alive(self):
+        return self.alive
+
+    async def start(self):
+        self.alive = self._ready = True
+
+    async def stop(self):
+        self.alive = self._ready = False
+
+    def remember(self, user_msg, reply):
+        self.context.add(user_msg, reply)
+
+    async def reset(self):
+        self.context.clear()
+
+    @property
+    def can_save_state(self):
+        return True
+
+    async def save_state(self, name):
+        (self.store.directory / name).write_bytes(b"kv")
+        return True
+
+    async def load_state(self, name):
+        return (self.store.directory / name).is_file()
+
+    async def generate(self, user_msg):
+        yield "ok"
+
+
+class FakeBackend(EngineBackend):
+    name = "fake"
+
+    def __init__(self, store):
+        self.store = store
+
+    def create_worker(self, worker_id):
+        return FakeWorker(worker_id, self.store)
+
+
+def test_sweep_saves_and_evicts_idle_disconnected_session(tmp_path):
+    store = KVStore(tmp_path / "kv", max_bytes=1024 * 1024)
+    pool = WorkerPool(FakeBackend(store), size=1, max_size=1, standby=0)
+    manager = SessionManager(pool, idle_timeout=60, sweep_interval=3600, store=store, snapshot_idle_s=10)
+
+    async def run():
+        await pool.start()
+        try:
+            session = await manager.attach("s1")
+            session.worker.remember("hi", "hello")
+            session.turns = 1
+            manager.detach(session)
+            # Nothing is written until the first save
+            assert not store.directory.exists()
+
+            # Idle past snapshot_idle_s: saved, still resident
+            session.last_used -= 30
+            await manager.sweep()
+            assert manager.get("s1") is session
+            assert store.saves == 1
+
+            # Idle past idle_timeout: evicted; the snapshot is current, so not saved again
+            session.last_used -= 60
+            await manager.sweep()
+            assert manager.get("s1") is None
+            assert manager.evicted == 1
+            assert store.saves == 1
+
+            resumed = await manager.attach("s1")
+            assert manager.restored == 1
+            assert resumed.turns == 1
+            assert resumed.worker.context.export() == [["hi", "hello"]]
+        finally:
+            await manager.close()
+            await pool.close()
+
+    asyncio.run(run())
+
+
+def test_new_session_never_takes_over_a_worker_shared_with_a_connected_session(tmp_path):
+    store = KVStore(tmp_path / "kv", max_bytes=0)
+    pool = WorkerPool(FakeBackend(store), size=1, max_size=1, standby=0)
+    manager = SessionManager(pool, sweep_interval=3600, store=store)
+
+    async def run():
+        await pool.start()
+        try:
+            alice = await manager.attach("alice")
+            alice.worker.remember("hi", "hello")
+            # The only worker is pinned to alice, so bob shares it
+            bob = await manager.attach("bob")
+            assert bob.worker is alice.worker and alice.worker.sessions == 2
+            manager.detach(bob)
+
+            carol = await manager.attach("carol")
+            assert carol.worker is alice.worker
+            assert alice.worker.context.export() == [["hi", "hello"]]
+            assert manager.get("bob") is bob
+        finally:
+            await manager.close()
+            await pool.close()
+
+    asyncio.run(run())
+
+
+def test_taking_over_a_worker_keeps_its_session_count(tmp_path):
+    store = KVStore(tmp_path / "kv", max_bytes=0)
+    pool = WorkerPool(FakeBackend(store), size=1, max_size=1, standby=0)
+    manager = SessionManager(pool, sweep_interval=3600, store=store)
+
+    async def run():
+        await pool.start()
+        try:
+            alice = await manager.attach("alice")
+            alice.worker.remember("hi", "hello")
+            manager.detach(alice)
+
+            bob = await manager.attach("bob")
+            assert manager.get("alice") is None
+            assert bob.worker.sessions == 1
+            assert bob.worker.context.export() == []
+        finally:
+            await manager.close()
+            await pool.close()
+
+    asyncio.run(run())
+
+
+def test_job_waits_for_a_worker_of_its_own_and_leaves_it_empty(tmp_path):
+    store = KVStore(tmp_path / "kv", max_bytes=0)
+    pool = WorkerPool(FakeBackend(store), size=1, max_size=1, standby=0)
+    manager = SessionManager(pool, sweep_interval=3600, store=store)
+
+    async def run():
+        await pool.start()
+        try:
+            alice = await manager.attach("alice")
+            alice.worker.remember("hi", "hello")
+            # The only worker belongs to a connected session
+            with pytest.raises(DeadlineExceeded):
+                async with manager.borrow(time.monotonic() + 0.05):
+                    pass
+            assert alice.worker.context.export() == [["hi", "hello"]]
+
+            async def job():
+                async with manager.borrow() as worker:
+                    assert worker.context.export() == []
+                    assert worker.sessions == 1
+                    worker.remember("job", "done")
+                    return worker
+
+            waiting = asyncio.create_task(job())
+            await asyncio.sleep(0.01)
+            assert not waiting.done()
+            manager.detach(alice)
+            worker = await asyncio.wait_for(waiting, 1)
+            assert manager.get("alice") is None
+            assert worker.sessions == 0
+            assert worker.context.export() == []
+        finally:
+            await manager.close()
+            await pool.close()
+
+    asyncio.run(run())
+
+
+def test_slow_save_does_not_hold_up_other_sessions(tmp_path):
+    store = KVStore(tmp_path / "kv", max_bytes=1024 * 1024)
+    pool = WorkerPool(FakeBackend(store), size=2, max_size=2, standby=0)
+    manager = SessionManager(pool, idle_timeout=60, sweep_interval=3600, store=store, snapshot_idle_s=10)
+
+    async def run():
+        await pool.start()
+        try:
+            alice = await manager.attach("alice")
+            alice.worker.remember("hi", "hello")
+            alice.turns = 1
+            manager.detach(alice)
+            alice.last_used -= 30
+
+            gate = asyncio.Event()
+            fast_save = alice.worker.save_state
+
+            async def slow_save(name):
+                await gate.wait()
+                return await fast_save(name)
+
+            alice.worker.save_state = slow_save
+            snapshot = asyncio.create_task(manager.snapshot_idle())
+            await asyncio.sleep(0.01)
+
+            bob = await asyncio.wait_for(manager.attach("bob"), 1)
+            assert bob.worker is not alice.worker
+            assert not snapshot.done()
+
+            gate.set()
+            assert await snapshot == 1
+            assert store.saves == 1
+        finally:
+            await manager.close()
+            await pool.close()
+
+    asyncio.run(run())
@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from api.speculative import (
+    AdaptiveDraftLength,
+    SpeculativeBackend,
+    SpeculativeDecoder,
+    autoregressive,
+    build_models,
+    encode,
+)
+
+MAX_NEW = 64
+
+
+@pytest.fixture(scope="module")
+def models():
+    return build_models(d_model=64, n_heads=2, target_layers=3, draft_layers=1, max_len=256, seed=0)
+
+
+@pytest.mark.parametrize("k", [1, 4, 8])
+def test_greedy_matches_target_only_decoding(models, k):
+    target, draft = models
+    ids = encode("System: be brief\nUser: hello\nAssistant: ")
+    decoder = SpeculativeDecoder(target, draft, AdaptiveDraftLength(k=k, k_max=8), temperature=0)
+
+    assert decoder.generate(ids, MAX_NEW) == autoregressive(target, ids, MAX_NEW)
+    assert decoder.stats.target_passes < decoder.stats.tokens
+
+
+def test_adaptive_draft_length_stays_in_bounds():
+    policy = AdaptiveDraftLength(k=4, k_min=2, k_max=6)
+    # All accepted with cheap drafts pushes k up; all rejected with costly drafts pushes it down
+    for proposed, accepted, draft_s, target_s in [(4, 4, 0.001, 1.0)] * 20 + [(4, 0, 1.0, 1.0)] * 20:
+        k = policy.update(proposed, accepted, draft_s, target_s)
+        assert policy.k_min <= k <= policy.k_max
+    assert k == policy.k_min
+    assert AdaptiveDraftLength(k=100, k_min=1, k_max=8).k == 8
+    with pytest.raises(ValueError):
+        AdaptiveDraftLength(k_min=4, k_max=2)
+
+
+def test_worker_keeps_partial_reply_when_cancelled(models):
+    backend = SpeculativeBackend(max_new_tokens=MAX_NEW, temperature=0)
+    backend.models = models
+    worker = backend.create_worker(0)
+
+    async def run():
+        await worker.start()
+        before = list(worker.history)
+        stream = worker.generate("hello")
+        await stream.__anext__()
+        await stream.aclose()
+        return before + encode("User: hello\nAssistant: ")
+
+    prompt = asyncio.run(run())
+    reply = worker.history[len(prompt):-1]
+
+    assert worker.history[:len(prompt)] == prompt
+    assert worker.history[-1:] == encode("\n")
+    # Only the first verify pass was read
+    assert 0 < len(reply) <= worker.decoder.policy.k_max + 1
+    assert worker.turn_stats()["tokens"] >= len(reply)